@@ -2,20 +2,26 @@
 Custom Evaluator Function App - Dedicated function app for Summary (Model as a Judge) evaluations.
 """
 
-import asyncio
+import functools
 import json
 import logging
 import os
+import time
 import traceback
 from datetime import datetime, timezone
 
 import attrs
 import azure.functions as func
+from medbench import aio
 from medbench.config import settings
+from medbench.dedup import JobDeduplicator, content_hash
 
 # Import MedBench Summary Evaluator implementation
 from medbench.evaluators import ABEvaluatorRunner, SummaryEvaluatorRunner
 from medbench.models import ModelRun, OpenAIReasoningModel
+from medbench.models.cache import response_cache
+from medbench.models.clients import openai_client_pool, warm_up_clients
+from medbench.perf import job_latencies, process_rss_mb
 
 # Set azure-core logging to WARNING
 logging.getLogger("azure").setLevel(logging.WARNING)
@@ -66,14 +72,42 @@ async def run_summary_evaluator(model_run, llm_evaluator, questions_generator_ru
         raise
 
 
+def _instance_errors(evaluator) -> list[str]:
+    """Errors of the instances of the LLM runs of an evaluator.
+
+    Evaluators run with `skip_errors`, so instances that failed, e.g. on rate
+    limits, are left out of the evaluation instead of failing it.
+    """
+    errors = []
+    for name in ("questions_generator_runner", "answerer_runner", "evaluator_runner"):
+        model_run = getattr(getattr(evaluator, name, None), "_model_run", None)
+        if model_run is None:
+            continue
+        errors.extend(
+            f"{model_run.id}/{result.input_id}: {result.error}"
+            for result in model_run.results
+            if result.error is not None
+        )
+    return errors
+
+
 async def _process_model_run_async(
-    model_run, llm_evaluator, questions_generator_runner=None, output_instructions=""
+    model_run,
+    llm_evaluator,
+    questions_generator_runner=None,
+    output_instructions="",
+    failures=None,
 ):
-    """Helper function to process model run using SummaryEvaluatorRunner with injected output instructions."""
+    """Helper function to process model run using SummaryEvaluatorRunner with injected output instructions.
+
+    Errors of evaluated instances are appended to `failures`, if given.
+    """
     try:
         evaluator = await run_summary_evaluator(
             model_run, llm_evaluator, questions_generator_runner, output_instructions
         )
+        if failures is not None:
+            failures.extend(_instance_errors(evaluator))
         # Extract the evaluation result text
         return evaluator.evaluator_runner._model_run.results[0].completions.get_text()
     except Exception as e:
@@ -81,8 +115,13 @@ async def _process_model_run_async(
         raise
 
 
-async def _process_ab_testing_async(model_run, llm_evaluator, output_instructions):
-    """Helper function to process A/B testing using SummaryEvaluatorRunner + MultimodalEvaluatorRunner."""
+async def _process_ab_testing_async(
+    model_run, llm_evaluator, output_instructions, failures=None
+):
+    """Helper function to process A/B testing using SummaryEvaluatorRunner + MultimodalEvaluatorRunner.
+
+    Errors of evaluated instances are appended to `failures`, if given.
+    """
     try:
         # Step 1: Run vanilla SummaryEvaluatorRunner for each model separately
         model_runs = []
@@ -99,6 +138,8 @@ async def _process_ab_testing_async(model_run, llm_evaluator, output_instruction
             )
 
             questions_generator_runner = evaluator.questions_generator_runner
+            if failures is not None:
+                failures.extend(_instance_errors(evaluator))
 
             # Extract the evaluator runner's model run for AB comparison
             model_runs.append(evaluator.evaluator_runner._model_run)
@@ -112,6 +153,8 @@ async def _process_ab_testing_async(model_run, llm_evaluator, output_instruction
         )
 
         await comparison_runner.evaluate()
+        if failures is not None:
+            failures.extend(_instance_errors(comparison_runner))
         return comparison_runner.evaluator_runner._model_run.results[0].completions.get_text()
 
     except Exception as e:
@@ -146,6 +189,7 @@ def summary_evaluator(blob: func.InputStream, outputBlob: func.Out[str]):
     """
 
     logging.info(f"Summary evaluator processing blob: {blob.name}")
+    start = time.perf_counter()
 
     try:
         # Read and parse input
@@ -176,18 +220,42 @@ def summary_evaluator(blob: func.InputStream, outputBlob: func.Out[str]):
         # Check if this is A/B testing (Arena experiment)
         is_ab_testing = len(model_run.results) > 1
 
-        if is_ab_testing:
-            # Process A/B testing with separate function
-            evaluation_result = asyncio.run(
-                _process_ab_testing_async(model_run, llm_evaluator, output_instructions)
-            )
-        else:
-            # Process single model evaluation
-            evaluation_result = asyncio.run(
-                _process_model_run_async(
-                    model_run, llm_evaluator, None, output_instructions
+        # Duplicates of the job (retriggered blobs, identical jobs under other
+        # job ids) reuse its evaluation, or wait for the invocation running it
+        dedup_key = content_hash(
+            {key: value for key, value in request_data.items() if key != "job_id"},
+            llm_evaluator.name,
+            llm_evaluator.version,
+        )
+        with _job_deduplicator().claim(dedup_key) as claim:
+            failures = []
+            if claim.result is not None:
+                logging.info(f"Reusing evaluation of a duplicate of {blob.name}")
+                evaluation_result = claim.result
+            elif is_ab_testing:
+                # Process A/B testing with separate function
+                evaluation_result = aio.run(
+                    _process_ab_testing_async(
+                        model_run, llm_evaluator, output_instructions, failures
+                    )
                 )
-            )
+            else:
+                # Process single model evaluation
+                evaluation_result = aio.run(
+                    _process_model_run_async(
+                        model_run, llm_evaluator, None, output_instructions, failures
+                    )
+                )
+
+            # Evaluations degraded by failed instances are not replayed to
+            # duplicates, which evaluate the job again instead
+            if failures:
+                logging.warning(
+                    f"Not reusing the evaluation of {blob.name}, "
+                    f"{len(failures)} instances failed: {failures[:3]}"
+                )
+            elif claim.result is None:
+                claim.set(evaluation_result)
 
         # Prepare output in expected format
         output = {
@@ -199,6 +267,9 @@ def summary_evaluator(blob: func.InputStream, outputBlob: func.Out[str]):
         # Write result
         outputBlob.set(json.dumps(output, indent=2))
 
+        job_latencies.record(
+            "ab_testing" if is_ab_testing else "summary", time.perf_counter() - start
+        )
         logging.info(f"Summary evaluation completed for {blob.name}")
 
     except Exception as e:
@@ -219,12 +290,26 @@ def summary_evaluator(blob: func.InputStream, outputBlob: func.Out[str]):
         raise
 
 
+@functools.cache
+def _job_deduplicator():
+    return JobDeduplicator.from_settings("evaluator")
+
+
 @app.function_name("SummaryHealthCheck")
 @app.route(route="health", auth_level=func.AuthLevel.ANONYMOUS)
 def health_check(req: func.HttpRequest) -> func.HttpResponse:
-    """Health check endpoint for the Summary evaluator function app."""
+    """Health check endpoint for the Summary evaluator function app.
+
+    With `?warmup=true`, the async LLM client the evaluators use is connected
+    before responding.
+    """
 
     try:
+        warmup_info = None
+        if req.params.get("warmup", "").strip().lower() in ("1", "true", "yes"):
+            warmup_info = {"llm_clients": warm_up_clients()}
+        llm_clients = openai_client_pool.stats()
+
         # Basic health check
         health_info = {
             "status": "healthy",
@@ -241,7 +326,18 @@ def health_check(req: func.HttpRequest) -> func.HttpResponse:
                 )
                 or os.environ.get("AZURE_OPENAI_DEPLOYMENT", "not-set"),
             },
+            "performance": {
+                "state": "warm"
+                if job_latencies.count or llm_clients["connected"]
+                else "cold",
+                "process_rss_mb": process_rss_mb(),
+                "llm_clients": llm_clients,
+                "llm_cache": response_cache.stats(),
+                "job_latency": job_latencies.stats(),
+            },
         }
+        if warmup_info is not None:
+            health_info["warmup"] = warmup_info
 
         return func.HttpResponse(
             json.dumps(health_info, indent=2),
@@ -1,19 +1,34 @@
+import functools
 import gc
 import json
 import logging
 import os
+import time
 import traceback
 from datetime import datetime, timezone
 
 import azure.functions as func
+import orjson
 
-from medbench.metrics import (
-    calculate_exact_match_metrics,
-    calculate_image_metrics,
-    calculate_summarization_metrics,
-)
-from medbench.models import ModelRun
+from medbench.metrics import MetricJob, MetricRegistry
 from medbench.config import settings
+from medbench.dedup import content_hash
+from medbench.metrics.checkpoint import MetricCheckpoint
+from medbench.metrics.results import (
+    dump_results,
+    input_reference,
+    upload_results,
+)
+from medbench.perf import job_latencies, process_rss_mb
+from medbench.metrics.shards import (
+    SHARD_RESULTS_CONTAINER,
+    SHARDS_CONTAINER,
+    merge_shard_results,
+    shard_result_blob_name,
+    shard_results_prefix,
+    should_shard,
+    split_job,
+)
 
 # Set azure-core logging to WARNING
 logging.getLogger("azure").setLevel(logging.WARNING)
@@ -24,13 +39,33 @@ os.environ["HF_HUB_ENABLE_HF_TRANSFER"] = "0"  # Disable optimized transfer
 
 app = func.FunctionApp()
 
+# Name of the TBFact factual consistency metric in the job "metrics" list
+TBFACT_METRIC = "tbfact"
+
+# Warm up metrics when the worker starts, so the first job does not pay for
+# loading `evaluate` modules and models. Later jobs reuse the warm metric pool.
+if settings.metrics_pool_prewarm:
+    from medbench.metrics import metric_pool
+
+    metric_pool.warm_up(settings.metrics_pool_prewarm.split(","))
+
 
 @app.function_name("MetricsHealthCheck")
 @app.route(route="health", auth_level=func.AuthLevel.ANONYMOUS)
 def health_check(req: func.HttpRequest) -> func.HttpResponse:
-    """Health check endpoint for the main metrics function app."""
+    """Health check endpoint for the main metrics function app.
+
+    With `?warmup=true`, metrics (the `METRICS_POOL_PREWARM` ones, or else all
+    summarization and exact match metrics, including the BERT model) and LLM
+    clients are loaded before responding, so load balancers and pre-warm
+    scripts can bring instances to a ready state. `?warmup=rouge,bert_score`
+    only warms up the named metrics.
+    """
 
     try:
+        warmup = req.params.get("warmup")
+        warmup_info = warm_up(warmup) if warmup else None
+
         # Basic health check
         health_info = {
             "status": "healthy",
@@ -51,7 +86,10 @@ def health_check(req: func.HttpRequest) -> func.HttpResponse:
                 )
                 or os.environ.get("AZURE_OPENAI_DEPLOYMENT", "not-set"),
             },
+            "performance": performance_info(),
         }
+        if warmup_info is not None:
+            health_info["warmup"] = warmup_info
 
         return func.HttpResponse(
             json.dumps(health_info, indent=2),
@@ -73,6 +111,51 @@ def health_check(req: func.HttpRequest) -> func.HttpResponse:
         )
 
 
+def warm_up(metrics):
+    """Load metrics and LLM clients ahead of the first job.
+
+    Args:
+        metrics: Comma separated names of the metrics to warm up, or "true".
+    """
+    from medbench.metrics import metric_pool
+    from medbench.metrics.text_summarization import SUMMARIZATION_METRICS
+    from medbench.models.clients import warm_up_clients
+
+    start = time.perf_counter()
+    if metrics.strip().lower() in ("1", "true", "yes"):
+        metrics = settings.metrics_pool_prewarm or ",".join(
+            SUMMARIZATION_METRICS + ("exact_match",)
+        )
+    names = [name.strip() for name in metrics.split(",") if name.strip()]
+    metric_pool.warm_up(names)
+
+    # Async client used by TBFact, so its first LLM call finds it connected
+    llm_clients = warm_up_clients()
+    return {
+        "metrics": names,
+        "llm_clients": llm_clients,
+        "seconds": round(time.perf_counter() - start, 3),
+    }
+
+
+def performance_info():
+    """Warm state, memory and rolling job latencies of this worker."""
+    from medbench.metrics import metric_pool
+    from medbench.models.cache import response_cache
+    from medbench.models.clients import openai_client_pool
+
+    pool = metric_pool.stats()
+    return {
+        "state": "warm" if pool["metrics"] or job_latencies.count else "cold",
+        "process_rss_mb": process_rss_mb(),
+        # Estimated from each metric's memory footprint
+        "metric_pool": pool,
+        "llm_clients": openai_client_pool.stats(),
+        "llm_cache": response_cache.stats(),
+        "job_latency": job_latencies.stats(),
+    }
+
+
 @app.function_name("MetricsProcessorContainer")
 @app.blob_trigger(
     arg_name="blob", path="metricjobs/{name}", connection="AzureWebJobsStorage"
@@ -82,39 +165,98 @@ def health_check(req: func.HttpRequest) -> func.HttpResponse:
     path="metricresults/{name}-results.json",
     connection="AzureWebJobsStorage",
 )
-def metrics_processor(blob: func.InputStream, outputBlob: func.Out[str]):
+def metrics_processor(blob: func.InputStream, outputBlob: func.Out[bytes]):
     logging.info(
         f"Python blob trigger function processed blob \n"
         f"Name: {blob.name}\n"
         f"Size: {blob.length} bytes"
     )
+    start = time.perf_counter()
 
     try:
         # Add logging about cache directories
         logging.info(f"TRANSFORMERS_CACHE: {os.environ.get('TRANSFORMERS_CACHE')}")
         logging.info(f"HF_HOME: {os.environ.get('HF_HOME')}")
 
-        # Read the blob content this is a test
-        blob_content = blob.read().decode("utf-8")
-        model_run_data = json.loads(blob_content)
-
-        # Parse the input data
-        model_run = ModelRun.from_json(model_run_data.get("model_run", {}))
+        # Parse the job incrementally, without decoding the blob or building
+        # its whole JSON tree, and dropping instance inputs (e.g. images)
+        data = blob.read()
+        job = MetricJob.from_bytes(data)
+        reference = input_reference(blob.name, data)
 
-        # Calculate metrics based on the metrics_type
-        metrics_type = model_run_data.get("metrics_type", "summarization")
-        results = calculate_metrics(model_run, metrics_type)
+        # Duplicates of the job (retriggered blobs, identical jobs under other
+        # names) reuse its results, or wait for the invocation computing them.
+        # Scores also depend on the BERTScore backend, and the TBFact judge.
+        dedup_key = content_hash(
+            job.content_hash(),
+            settings.bertscore_backend,
+            settings.azure_openai_deployment,
+            settings.azure_openai_version,
+        )
+        checkpoint = None
+        with _job_deduplicator().claim(dedup_key) as claim:
+            if claim.result is not None:
+                logging.info(f"Reusing results of a duplicate of {blob.name}")
+                results = claim.result
+            elif should_shard(job, settings.metrics_shard_size):
+                # Large jobs are scored by parallel invocations, one per shard,
+                # and the last one to finish writes the results blob
+                shards = split_job(
+                    job,
+                    _blob_path(blob.name),
+                    settings.metrics_shard_size,
+                    input=reference,
+                    content_hash=dedup_key,
+                )
+                container = _container_client(SHARDS_CONTAINER)
+                for shard_name, shard_data in shards:
+                    container.upload_blob(shard_name, shard_data, overwrite=True)
+                logging.info(f"Split {blob.name} into {len(shards)} shards")
+                return
+            else:
+                # Calculate metrics based on the metrics_type, and only the
+                # metrics named by the job, if any (e.g. ["rouge", "tbfact"]).
+                # If the job is retried, e.g. after the host recycled, completed
+                # TBFact evaluations are resumed from its checkpoint.
+                checkpoint = MetricCheckpoint.for_job(
+                    _blob_path(blob.name), reference["sha256"]
+                )
+                failures = []
+                results = calculate_metrics(
+                    job.model_run,
+                    job.metrics_type,
+                    job.metrics,
+                    checkpoint=checkpoint,
+                    failures=failures,
+                )
+                if reusable_results(results, failures):
+                    claim.set(results)
 
-        # Create output JSON with original data and metrics results
-        output_data = {
-            "original_run": model_run_data,
-            "test": "test",
-            "metrics_results": results,
-            "processed_at": datetime.now(timezone.utc).isoformat(),
-        }
+        output_data = results_output(results, reference, job.summary)
+        del data
 
         # Output the results to the destination container
-        outputBlob.set(json.dumps(output_data, indent=2))
+        output = dump_results(output_data, compact=settings.metrics_output_compact)
+        if settings.metrics_output_gzip:
+            # The output binding cannot set the content encoding of the blob
+            upload_results(
+                os.environ["AzureWebJobsStorage"],
+                "metricresults",
+                f"{_blob_path(blob.name)}-results.json",
+                output,
+                compress=True,
+            )
+        else:
+            outputBlob.set(output)
+        if settings.metrics_output_parquet:
+            upload_instance_metrics(
+                f"{_blob_path(blob.name)}-instance-metrics.parquet",
+                job.model_run,
+                results,
+            )
+        if checkpoint is not None:
+            checkpoint.clear()
+        job_latencies.record(job.metrics_type, time.perf_counter() - start)
         logging.info(f"Successfully processed metrics for {blob.name}")
 
         gc.collect()
@@ -123,42 +265,319 @@ def metrics_processor(blob: func.InputStream, outputBlob: func.Out[str]):
         error_message = f"Error processing metrics: {str(e)}\n{traceback.format_exc()}"
         logging.error(error_message)
         # Still write the error to the output blob
-        outputBlob.set(
-            json.dumps(
-                {
-                    "error": error_message,
-                    "original_blob_name": blob.name,
-                    "processed_at": datetime.now(timezone.utc).isoformat(),
-                },
-                indent=2,
+        outputBlob.set(dump_results(error_output(error_message, blob.name)))
+
+
+@app.function_name("MetricsShardProcessor")
+@app.blob_trigger(
+    arg_name="blob", path="metricshards/{name}", connection="AzureWebJobsStorage"
+)
+def metrics_shard_processor(blob: func.InputStream):
+    """Score a shard of a large metric job, and merge the results of all its
+    shards once they are all scored."""
+    logging.info(f"Processing metric job shard {blob.name} ({blob.length} bytes)")
+    start = time.perf_counter()
+
+    try:
+        data = blob.read()
+        job = MetricJob.from_bytes(data)
+        shard = job.shard
+        checkpoint = MetricCheckpoint.for_job(
+            _blob_path(blob.name), input_reference(blob.name, data)["sha256"]
+        )
+        del data
+    except Exception as e:
+        # Without its results, the shards of the job can never be merged, so
+        # the job fails. Shard blobs are named "{job}/shard-...".
+        job_name = _blob_path(blob.name).rsplit("/", 1)[0]
+        error_message = f"Error processing metrics: {str(e)}\n{traceback.format_exc()}"
+        logging.error(error_message)
+        upload_results(
+            os.environ["AzureWebJobsStorage"],
+            "metricresults",
+            f"{job_name}-results.json",
+            dump_results(error_output(error_message, f"metricjobs/{job_name}")),
+            compress=settings.metrics_output_gzip,
+        )
+        return
+
+    shard_info = {
+        key: shard[key] for key in ("job", "index", "count", "start", "stop")
+    }
+    try:
+        failures = []
+        results = calculate_metrics(
+            job.model_run,
+            job.metrics_type,
+            job.metrics,
+            checkpoint=checkpoint,
+            failures=failures,
+        )
+        shard_result = {
+            "shard": shard_info,
+            "metrics_results": results,
+            "reusable": reusable_results(results, failures),
+        }
+        if settings.metrics_output_parquet:
+            # Written per shard, as the merged results lack instance ids
+            upload_instance_metrics(
+                f"{shard['job']}-instance-metrics/"
+                f"shard-{shard['index']:05d}.parquet",
+                job.model_run,
+                results,
             )
+    except Exception as e:
+        logging.error(f"Error processing metrics of {blob.name}: {str(e)}")
+        shard_result = {
+            "shard": shard_info,
+            "error": f"{str(e)}\n{traceback.format_exc()}",
+        }
+
+    shard_results = _container_client(SHARD_RESULTS_CONTAINER)
+    shard_results.upload_blob(
+        shard_result_blob_name(shard), dump_results(shard_result), overwrite=True
+    )
+    if "error" not in shard_result:
+        # Failed shards keep their completed TBFact evaluations, so they are
+        # resumed if the job is submitted again
+        checkpoint.clear()
+    job_latencies.record(f"{job.metrics_type}-shard", time.perf_counter() - start)
+    del job, shard_result
+    gc.collect()
+
+    # Fan in: whichever shard completes the set writes the results blob.
+    # Only results of this content and number of shards are listed, as
+    # results of other uploads of the job name may not be deleted yet.
+    names = [
+        properties.name
+        for properties in shard_results.list_blobs(
+            name_starts_with=shard_results_prefix(shard)
+        )
+    ]
+    if len(names) < shard["count"]:
+        logging.info(
+            f"Scored shard {shard['index'] + 1} of {shard['count']} of "
+            f"{shard['job']}, {len(names)} done"
         )
+        return
 
+    from azure.core.exceptions import ResourceNotFoundError
+
+    try:
+        shard_result_list = [
+            orjson.loads(shard_results.download_blob(name).readall())
+            for name in names
+        ]
+        results = merge_shard_results(shard_result_list)
+        output_data = results_output(results, shard["input"], shard["original_run"])
+        if shard.get("content_hash") and all(
+            result.get("reusable") for result in shard_result_list
+        ):
+            _job_deduplicator().put(shard["content_hash"], results)
+    except ResourceNotFoundError:
+        # Another shard completed the set at the same time, and already merged
+        # and deleted the shard results
+        logging.info(f"Shards of {shard['job']} were merged by another shard")
+        return
+    except Exception as e:
+        error_message = f"Error processing metrics: {str(e)}\n{traceback.format_exc()}"
+        logging.error(error_message)
+        output_data = error_output(error_message, f"metricjobs/{shard['job']}")
+
+    upload_results(
+        os.environ["AzureWebJobsStorage"],
+        "metricresults",
+        f"{shard['job']}-results.json",
+        dump_results(output_data, compact=settings.metrics_output_compact),
+        compress=settings.metrics_output_gzip,
+    )
+    # Results of failed shards are deleted too, so a resubmitted job scores
+    # all its shards again
+    for name in names:
+        try:
+            shard_results.delete_blob(name)
+        except ResourceNotFoundError:
+            pass
+    logging.info(f"Merged {shard['count']} shards of {shard['job']}")
+
+
+def reusable_results(results, failures):
+    """Whether the results of a job are stored for its duplicates.
+
+    Results with failed instances, or where TBFact fell back to standard
+    metrics or zero scores, are not, so submitting the job again, e.g. after
+    an LLM outage, computes them again.
+    """
+    failed_instances = sum(
+        any(isinstance(value, str) for value in instance_metrics.values())
+        for instance_metrics in results.get("instance_level_metrics", [])
+    )
+    if failures or failed_instances:
+        logging.warning(
+            f"Not reusing results for duplicates: {failed_instances} failed "
+            f"instances, {len(failures)} TBFact failures"
+        )
+        return False
+    return True
+
+
+def error_output(error_message, blob_name):
+    """Results blob content of a job that failed."""
+    return {
+        "error": error_message,
+        "original_blob_name": blob_name,
+        "processed_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def results_output(results, input, original_run):
+    """Results blob content of a job.
+
+    Args:
+        results: Metrics results of the job.
+        input: Reference to the job blob, see `input_reference`.
+        original_run: Job without its instances and model outputs.
+    """
+    if settings.metrics_output_compact:
+        # Results only, with a reference to the job instead of its copy
+        return {
+            "input": input,
+            "metrics_results": results,
+            "processed_at": datetime.now(timezone.utc).isoformat(),
+        }
+    # Create output JSON with the job (without instances and model outputs)
+    # and metrics results
+    return {
+        "original_run": original_run,
+        "test": "test",
+        "metrics_results": results,
+        "processed_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def upload_instance_metrics(name, model_run, results):
+    """Upload the instance-level metrics of a job as Parquet to metricresults.
+
+    Read many of them as a single table with
+    `medbench.metrics.read_instance_metrics`. The export is an addition to the
+    results blob, so failures are logged without failing the job.
+    """
+    from medbench.metrics.columnar import (
+        dump_instance_metrics,
+        instance_metrics_table,
+    )
+
+    try:
+        table = instance_metrics_table(model_run, results["instance_level_metrics"])
+        upload_results(
+            os.environ["AzureWebJobsStorage"],
+            "metricresults",
+            name,
+            dump_instance_metrics(table),
+            content_type="application/vnd.apache.parquet",
+        )
+    except Exception as e:
+        logging.error(f"Error exporting instance metrics to {name}: {str(e)}")
+
+
+@functools.cache
+def _job_deduplicator():
+    from medbench.dedup import JobDeduplicator
+
+    return JobDeduplicator.from_settings("metrics")
+
+
+def _blob_path(name):
+    # Blob name without its container, as matched by "{name}" in trigger paths
+    return name.split("/", 1)[-1]
+
+
+def _container_client(container):
+    from azure.storage.blob import ContainerClient
+
+    return ContainerClient.from_connection_string(
+        os.environ["AzureWebJobsStorage"], container_name=container
+    )
+
+
+def calculate_metrics(
+    model_run, metrics_type, metrics=None, checkpoint=None, failures=None
+):
+    """Calculate metrics based on the metrics type.
+
+    For summarization, `metrics` names the metrics to compute, registered
+    metrics and/or "tbfact". If None, all summarization metrics are computed.
+    TBFact evaluations are checkpointed to `checkpoint`, if any, and resumed
+    from it. Other metrics are fast to resume from the metric score cache.
+    TBFact failures, replaced by standard metrics only or zero scores, are
+    appended to `failures`, if any.
+    """
+    # Metrics are imported on first use, so they do not slow down cold starts
+    from medbench.metrics import (
+        calculate_exact_match_metrics,
+        calculate_image_metrics,
+    )
 
-def calculate_metrics(model_run, metrics_type):
-    """Calculate metrics based on the metrics type."""
     if metrics_type == "summarization":
-        return calculate_summarization_metrics_with_tbfact(model_run)
+        return calculate_summarization_metrics_with_tbfact(
+            model_run, metrics, checkpoint, failures
+        )
     elif metrics_type == "image_quality":
         return calculate_image_metrics(model_run)
     elif metrics_type == "accuracy":
         return calculate_exact_match_metrics(model_run)
     else:
         # Default to summarization metrics
-        return calculate_summarization_metrics_with_tbfact(model_run)
+        return calculate_summarization_metrics_with_tbfact(
+            model_run, metrics, checkpoint, failures
+        )
+
 
+def calculate_summarization_metrics_with_tbfact(
+    model_run, metrics=None, checkpoint=None, failures=None
+):
+    """Calculate summarization metrics including TBFact for factual consistency.
 
-def calculate_summarization_metrics_with_tbfact(model_run):
-    """Calculate summarization metrics including TBFact for factual consistency."""
-    import asyncio
+    TBFact failures are logged and appended to `failures`, if any, while the
+    results fall back to standard metrics only or zero TBFact scores.
+    """
+    if failures is None:
+        failures = []
+
+    from medbench import aio
     from medbench.config import settings
+    from medbench.metrics import (
+        aggregate_results,
+        calculate_summarization_metrics,
+        get_evaluation_pairs,
+    )
+
+    standard_metric_names = None
+    if metrics is not None:
+        # Fail on unknown metrics before computing any of them
+        for name in metrics:
+            if name != TBFACT_METRIC:
+                MetricRegistry.get(name)
+        standard_metric_names = [name for name in metrics if name != TBFACT_METRIC]
+
+    # First calculate standard summarization metrics, unless the job only
+    # asks for TBFact
+    if standard_metric_names == []:
+        standard_metrics = {
+            **aggregate_results([]),
+            "instance_level_metrics": [{} for _ in get_evaluation_pairs(model_run)],
+        }
+    else:
+        standard_metrics = calculate_summarization_metrics(
+            model_run, metrics=standard_metric_names
+        )
+
+    if metrics is not None and TBFACT_METRIC not in metrics:
+        return standard_metrics
+
     from medbench.evaluators.tbfact.runner import TBFactEvaluatorRunner
-    from medbench.metrics import aggregate_metrics
     from medbench.models import OpenAIReasoningModel
-    
-    # First calculate standard summarization metrics
-    standard_metrics = calculate_summarization_metrics(model_run)
-    
+
     try:
         # Add TBFact metrics for factual consistency
         logging.info("Calculating TBFact metrics for summarization task")
@@ -176,12 +595,15 @@ def calculate_summarization_metrics_with_tbfact(model_run):
             stream=False,
         )
         
-        # Initialize TBFact evaluator runner
+        # Initialize TBFact evaluator runner. Reference facts are extracted
+        # and kept in memory per runner, as shards of a job run concurrently
+        # in a worker and must not share them through a file.
         tbfact_evaluator_runner = TBFactEvaluatorRunner(
             predictions_model_run=model_run,
             evaluator=llm_evaluator,
-            reference_facts_path="/tmp/tbfact_reference_facts.json",
-            batch_size=5
+            batch_size=5,
+            completed_results=checkpoint.load() if checkpoint is not None else {},
+            on_batch_complete=checkpoint.add if checkpoint is not None else None,
         )
         
         # Run TBFact evaluation asynchronously
@@ -190,6 +612,7 @@ def calculate_summarization_metrics_with_tbfact(model_run):
                 tbfact_results = await tbfact_evaluator_runner.evaluate()
             except Exception as e:
                 logging.error(f"Error running TBFact evaluation: {str(e)}")
+                failures.append(f"TBFact evaluation failed: {str(e)}")
                 # Return empty results if evaluation fails completely
                 return []
             
@@ -207,6 +630,7 @@ def calculate_summarization_metrics_with_tbfact(model_run):
                     tbfact_instance_metrics.append(instance_metrics)
                 except Exception as e:
                     logging.error(f"Error processing TBFact evaluation result {i}: {str(e)}")
+                    failures.append(f"TBFact result {i} failed: {str(e)}")
                     # Add default metrics for failed instances
                     tbfact_instance_metrics.append(
                         {"tbfact-f1": 0.0, "tbfact-recall": 0.0, "tbfact-precision": 0.0}
@@ -214,8 +638,11 @@ def calculate_summarization_metrics_with_tbfact(model_run):
             
             return tbfact_instance_metrics
         
-        # Execute TBFact evaluation
-        tbfact_instance_metrics = asyncio.run(run_tbfact())
+        # Execute TBFact evaluation on the long-lived event loop, so pooled
+        # clients keep their connections across invocations
+        tbfact_instance_metrics = aio.run(run_tbfact())
+        if checkpoint is not None:
+            checkpoint.flush()
         
         # Merge TBFact metrics with standard metrics
         combined_instance_metrics = []
@@ -225,12 +652,13 @@ def calculate_summarization_metrics_with_tbfact(model_run):
                 combined_instance.update(tbfact_instance_metrics[i])
             else:
                 # Fallback for mismatched lengths
+                failures.append(f"TBFact result {i} is missing")
                 combined_instance.update({"tbfact-f1": 0.0, "tbfact-recall": 0.0, "tbfact-precision": 0.0})
             combined_instance_metrics.append(combined_instance)
         
         # Calculate aggregated metrics including TBFact
         combined_metrics = {
-            "aggregated_metrics": aggregate_metrics(combined_instance_metrics),
+            **aggregate_results(combined_instance_metrics),
             "instance_level_metrics": combined_instance_metrics,
         }
         
@@ -242,4 +670,5 @@ def calculate_summarization_metrics_with_tbfact(model_run):
         logging.error(traceback.format_exc())
         # Fallback to standard metrics if TBFact fails
         logging.info("Falling back to standard summarization metrics due to TBFact error")
+        failures.append(f"TBFact metrics failed: {str(e)}")
         return standard_metrics
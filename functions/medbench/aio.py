@@ -0,0 +1,69 @@
+import asyncio
+import logging
+import threading
+from typing import Any, Coroutine, Optional, TypeVar
+
+import attrs
+
+T = TypeVar("T")
+
+
+@attrs.define
+class EventLoopThread:
+    """Long-lived event loop running in a daemon thread.
+
+    `asyncio.run` creates and closes an event loop on every call, closing the
+    connections of async clients bound to it. Running coroutines on a single
+    loop that lives as long as the worker process lets async clients, such as
+    those of `openai_client_pool`, keep their connections across invocations.
+
+    Coroutines can be run from any thread but the loop's own, e.g. from the
+    threads Azure Functions runs synchronous functions in.
+    """
+
+    _loop: Optional[asyncio.AbstractEventLoop] = attrs.field(init=False, default=None)
+    _thread: Optional[threading.Thread] = attrs.field(init=False, default=None)
+    _lock: threading.Lock = attrs.field(init=False, factory=threading.Lock)
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The event loop, started on first use."""
+        with self._lock:
+            if self._loop is None or self._loop.is_closed():
+                self._loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(
+                    target=self._loop.run_forever,
+                    name="medbench-event-loop",
+                    daemon=True,
+                )
+                self._thread.start()
+                logging.info("Started the long-lived event loop.")
+            return self._loop
+
+    def run(self, coroutine: Coroutine[Any, Any, T]) -> T:
+        """Run a coroutine on the loop, and wait for its result."""
+        loop = self.loop
+        if threading.current_thread() is self._thread:
+            coroutine.close()
+            raise RuntimeError(
+                "Cannot wait for a coroutine from the event loop thread, "
+                "await it instead."
+            )
+        return asyncio.run_coroutine_threadsafe(coroutine, loop).result()
+
+    def stop(self) -> None:
+        with self._lock:
+            if self._loop is None:
+                return
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop.close()
+            self._loop, self._thread = None, None
+
+
+event_loop = EventLoopThread()
+
+
+def run(coroutine: Coroutine[Any, Any, T]) -> T:
+    """Run a coroutine on the long-lived event loop, instead of `asyncio.run`."""
+    return event_loop.run(coroutine)
@@ -24,6 +24,7 @@ class Settings(JsonSerializable):
     env: Environment = Environment.DEVELOPMENT
 
     azure_storage_blob_endpoint: str = None
+    # Account of blob caches and checkpoints, else the AzureWebJobsStorage one
     azure_storage_connection_string: str = None
 
     babelbench_aml_workspace_name: str = "hls-bench"
@@ -32,12 +33,74 @@ class Settings(JsonSerializable):
     azure_openai_version: str = None
     azure_openai_endpoint: str = None
     azure_openai_api_key: str = None
+    azure_openai_http2: bool = False  # Requires the h2 package
+    azure_openai_max_concurrency: int = 8  # Requests in flight per async run
+    # Quota of each deployment used by a worker process (0 does not limit)
+    azure_openai_requests_per_minute: int = 0
+    azure_openai_tokens_per_minute: int = 0
+    # Persistent cache of LLM completions (leave the path empty to disable)
+    azure_openai_cache_path: str = None
+    azure_openai_cache_max_size_mb: int = 256
+    azure_openai_cache_ttl_hours: float = 168  # 0 never expires completions
 
     cxrreportgen_deployment: str = "cxrreportgen"
     cxrreportgen_version: str = "4"
     cxrreportgen_endpoint: str = None
     cxrreportgen_api_key: str = None
 
+    # Warm metric pool shared across function invocations
+    metrics_pool_memory_budget_mb: int = 4096
+    metrics_pool_prewarm: str = None  # Comma separated registered metric names
+
+    # Worker processes computing CPU-bound metrics (1 disables, 0 uses all cores)
+    metrics_num_workers: int = 1
+
+    # Persistent cache of metric scores (leave the path empty to disable)
+    metrics_cache_path: str = "/tmp/medbench/metrics.sqlite"
+    metrics_cache_max_size_mb: int = 256
+    # Shares scores across workers, with one blob read per metric and job (or
+    # shard), and one write per metric when the job computed new scores
+    metrics_cache_blob_container: str = None
+    metrics_cache_blob_ttl_days: int = 30  # 0 keeps blobs forever
+
+    # Results blobs: compact leaves out the job and indentation, gzip sets
+    # the gzip content encoding (clients must decompress the blob)
+    metrics_output_compact: bool = True
+    metrics_output_gzip: bool = False
+    # Also write instance-level metrics as Parquet, next to the results blob
+    metrics_output_parquet: bool = False
+
+    # Jobs with more instances are split into shards of this many instances,
+    # scored by parallel invocations (0 disables sharding)
+    metrics_shard_size: int = 0
+
+    # Checkpoints of TBFact results, to resume retried jobs (leave the path
+    # empty to only checkpoint to the blob container, if any)
+    metrics_checkpoint_path: str = "/tmp/medbench/checkpoints"
+    metrics_checkpoint_blob_container: str = None
+    metrics_checkpoint_interval: int = 20  # Results between blob uploads
+
+    # Results of jobs by content hash, reused by duplicate jobs (leave the path
+    # and container empty to disable). Duplicates running on other workers are
+    # waited for, up to the wait time, through leases on the container.
+    job_dedup_path: str = "/tmp/medbench/dedup"
+    job_dedup_blob_container: str = None
+    job_dedup_wait_seconds: int = 600
+    job_dedup_ttl_hours: float = 168  # Results expire after this (0 never)
+    job_dedup_max_size_mb: int = 512  # Local results beyond are evicted (LRU)
+
+    # BERTScore encoding
+    bertscore_max_batch_tokens: int = 16384
+    bertscore_num_threads: int = 0  # 0 uses all cores available to the worker
+    bertscore_backend: str = "torch"  # "torch" or "onnx" (quantized int8)
+    bertscore_onnx_model_dir: str = None
+
+    # BERTScore token embeddings cache
+    bertscore_cache_dir: str = "/tmp/medbench/bertscore"
+    bertscore_cache_memory_mb: int = 512
+    bertscore_cache_disk_mb: int = 2048
+    bertscore_cache_predictions: bool = False
+
     @classmethod
     def from_env(cls) -> "Settings":
         kwargs = {}
@@ -45,7 +108,10 @@ class Settings(JsonSerializable):
         for field_name, field in attrs.fields_dict(cls).items():
             env_var = field_name.upper()
             if env_var in os.environ:
-                kwargs[field_name] = os.environ[env_var]
+                value = os.environ[env_var]
+                if field.type is bool:
+                    value = value.strip().lower() in ("1", "true", "yes")
+                kwargs[field_name] = value
             else:
                 logging.info(f"Environment variable {env_var} not found.")
                 if field.default is attrs.NOTHING:
@@ -61,7 +127,21 @@ class Settings(JsonSerializable):
         return cls.from_json(kwargs)
 
 
+_settings: Settings = None
+
+
+def get_settings() -> Settings:
+    """Settings read from the environment, and the .env file, on first use."""
+    global _settings
+    if _settings is None:
+        load_dotenv()
+        _settings = Settings.from_env()
+    return _settings
 
-load_dotenv()
 
-settings = Settings.from_env()
+def __getattr__(name: str):
+    # `settings` is resolved on first access (PEP 562), so importing this
+    # module, e.g. for `Settings`, neither reads .env nor the environment
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
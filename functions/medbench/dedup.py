@@ -0,0 +1,317 @@
+import contextlib
+import glob
+import hashlib
+import logging
+import os
+import threading
+import time
+from typing import Any, Iterator, Optional
+
+import attrs
+import orjson
+
+from medbench.config import settings
+from medbench.storage import container_client
+
+_HASH_OPTIONS = orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+
+def content_hash(*values: Any) -> str:
+    """Canonical SHA-256 hash of JSON values.
+
+    Object keys are sorted, so jobs differing only in key order or whitespace
+    have the same hash.
+    """
+    sha256 = hashlib.sha256()
+    for value in values:
+        sha256.update(orjson.dumps(value, option=_HASH_OPTIONS))
+        sha256.update(b"\n")
+    return sha256.hexdigest()
+
+
+@attrs.define
+class Claim:
+    """Claim on the computation of a job result, see `JobDeduplicator.claim`.
+
+    Attributes:
+        key (str): Content hash of the job.
+        result (Any): Result previously written for the job, if any.
+            If None, the holder of the claim computes the result and `set`s it.
+    """
+
+    key: str
+    result: Any = None
+
+    _deduplicator: "JobDeduplicator" = attrs.field(default=None, repr=False)
+
+    def set(self, result: Any) -> None:
+        self._deduplicator.put(self.key, result)
+        self.result = result
+
+
+@attrs.define
+class JobDeduplicator:
+    """Results of jobs keyed by content hash, computed once per content.
+
+    Blob triggers may fire more than once for the same blob, and identical
+    jobs may be uploaded under different names. Results are stored by the
+    content hash of their job, in a local directory and, if set, a blob
+    container shared by workers, so duplicates reuse them. Concurrent
+    duplicates wait for the first one: on a worker behind a lock, and across
+    workers behind a lease on a lock blob of the container, renewed while the
+    result is computed. If the holder fails, the next waiter computes it.
+
+    Results expire after `ttl_seconds`, so they are eventually computed again,
+    e.g. with updated metrics. Local results are evicted least recently used
+    first once they grow beyond `max_size_mb`. Results in the container expire
+    too, but are only deleted by its lifecycle management policy, if any.
+
+    Attributes:
+        directory (str): Directory of the local results.
+            If None, results are only stored in the blob container.
+        blob_container (Any): `azure.storage.blob.ContainerClient` storing
+            results and lock blobs. If None, duplicates are only detected on
+            this worker.
+        lease_seconds (int): Duration of lock blob leases, between 15 and 60.
+        wait_seconds (float): Maximum time to wait for another worker to
+            compute a result, before computing it anyway.
+        poll_seconds (float): Interval between checks for the result, while
+            another worker holds the lease.
+        ttl_seconds (float): Time after which results expire.
+            If 0, results never expire.
+        max_size_mb (int): Size budget of the local results, in MB.
+    """
+
+    directory: Optional[str] = None
+    blob_container: Any = None
+    lease_seconds: int = 60
+    wait_seconds: float = 600
+    poll_seconds: float = 2
+    ttl_seconds: float = 7 * 24 * 3600
+    max_size_mb: int = 512
+
+    # Lock of each key being claimed, and its number of holders and waiters
+    _locks: dict[str, list] = attrs.field(init=False, factory=dict)
+    _locks_lock: threading.Lock = attrs.field(init=False, factory=threading.Lock)
+
+    @classmethod
+    def from_settings(cls, namespace: str) -> "JobDeduplicator":
+        """Deduplicator of a kind of jobs (e.g. "metrics"), from the settings."""
+        return cls(
+            directory=(
+                os.path.join(settings.job_dedup_path, namespace)
+                if settings.job_dedup_path
+                else None
+            ),
+            blob_container=container_client(settings.job_dedup_blob_container),
+            wait_seconds=settings.job_dedup_wait_seconds,
+            ttl_seconds=settings.job_dedup_ttl_hours * 3600,
+            max_size_mb=settings.job_dedup_max_size_mb,
+        )
+
+    def get(self, key: str) -> Any:
+        """Result previously written for a job, or None if missing or expired."""
+        data = self._read_local(key)
+        if data is not None:
+            return orjson.loads(data)
+        if self.blob_container is None:
+            return None
+
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            download = self.blob_container.download_blob(f"{key}.json")
+            created_at = download.properties.last_modified.timestamp()
+            if self._expired(created_at, time.time()):
+                return None
+            data = download.readall()
+        except ResourceNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Could not read deduplicated result {key}: {e}")
+            return None
+        # Expires locally when it does in the container
+        self._write_local(key, data, created_at)
+        return orjson.loads(data)
+
+    def put(self, key: str, result: Any) -> None:
+        """Store the result of a job."""
+        data = orjson.dumps(
+            result, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        )
+        self._write_local(key, data)
+        if self.blob_container is not None:
+            try:
+                self.blob_container.upload_blob(f"{key}.json", data, overwrite=True)
+            except Exception as e:
+                logging.warning(f"Could not write deduplicated result {key}: {e}")
+
+    @contextlib.contextmanager
+    def claim(self, key: str) -> Iterator[Claim]:
+        """Claim the computation of the result of a job.
+
+        Yields the previously written result, if any, waiting for duplicates
+        being computed on this or other workers. Otherwise, the result is to
+        be computed and `set` on the claim before leaving the context.
+        """
+        with self._lock(key):
+            result = self.get(key)
+            if result is not None or self.blob_container is None:
+                yield Claim(key, result, self)
+                return
+
+            with self._lease(key) as result:
+                yield Claim(key, result, self)
+
+    @contextlib.contextmanager
+    def _lock(self, key: str) -> Iterator[None]:
+        # Dropped once no claim holds or waits for it, so locks do not pile up
+        # over the jobs of a long-lived worker
+        with self._locks_lock:
+            entry = self._locks.setdefault(key, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._locks_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[key]
+
+    @contextlib.contextmanager
+    def _lease(self, key: str) -> Iterator[Any]:
+        """Hold the lease of the lock blob of a job, yielding its result if
+        another worker wrote it in the meantime."""
+        from azure.core.exceptions import HttpResponseError, ResourceExistsError
+
+        blob = self.blob_container.get_blob_client(f"{key}.lock")
+        try:
+            blob.upload_blob(b"", overwrite=False)
+        except ResourceExistsError:
+            pass
+
+        deadline = time.monotonic() + self.wait_seconds
+        lease = None
+        while lease is None:
+            try:
+                lease = blob.acquire_lease(lease_duration=self.lease_seconds)
+            except HttpResponseError as e:
+                if e.status_code != 409:
+                    raise
+                # Another worker computes the result
+                result = self.get(key)
+                if result is not None:
+                    logging.info(f"Reusing result of duplicate job {key}")
+                    yield result
+                    return
+                if time.monotonic() > deadline:
+                    logging.warning(
+                        f"Timed out waiting for duplicate job {key}, computing it"
+                    )
+                    yield None
+                    return
+                time.sleep(self.poll_seconds)
+
+        stop = threading.Event()
+        renewal = threading.Thread(
+            target=self._renew,
+            args=(lease, stop),
+            name=f"lease-{key[:8]}",
+            daemon=True,
+        )
+        renewal.start()
+        try:
+            # The previous holder may have written the result before releasing
+            yield self.get(key)
+        finally:
+            stop.set()
+            renewal.join()
+            try:
+                lease.release()
+            except Exception as e:
+                logging.warning(f"Could not release lease of job {key}: {e}")
+
+    def _renew(self, lease: Any, stop: threading.Event) -> None:
+        while not stop.wait(self.lease_seconds / 3):
+            try:
+                lease.renew()
+            except Exception as e:
+                logging.warning(f"Could not renew job lease: {e}")
+
+    def _path(self, key: str) -> Optional[str]:
+        if not self.directory:
+            return None
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return bool(self.ttl_seconds) and now - created_at > self.ttl_seconds
+
+    def _read_local(self, key: str) -> Optional[bytes]:
+        # Local results are created at their modification time, and used at
+        # their access time, which is set explicitly as mounts may not
+        path = self._path(key)
+        try:
+            if not path:
+                return None
+            created_at = os.stat(path).st_mtime
+            now = time.time()
+            if self._expired(created_at, now):
+                os.remove(path)
+                return None
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path, (now, created_at))
+            return data
+        except FileNotFoundError:
+            return None
+
+    def _write_local(
+        self, key: str, data: bytes, created_at: Optional[float] = None
+    ) -> None:
+        path = self._path(key)
+        if not path:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # Written to a temporary file first, so readers never see a partial one
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, "wb") as f:
+            f.write(data)
+        now = time.time()
+        os.utime(temp_path, (now, created_at or now))
+        os.replace(temp_path, path)
+        self._evict(now)
+
+    def _evict(self, now: float) -> None:
+        """Delete expired local results, then the least recently used ones
+        while they are beyond the size budget."""
+        entries = []
+        for path in glob.glob(os.path.join(self.directory, "*.json")):
+            try:
+                stat = os.stat(path)
+                if self._expired(stat.st_mtime, now):
+                    os.remove(path)
+                else:
+                    entries.append((stat.st_atime, stat.st_size, path))
+            except FileNotFoundError:
+                # Evicted by another process
+                continue
+
+        size = sum(entry_size for _, entry_size, _ in entries)
+        budget = self.max_size_mb * 2**20
+        if size <= budget:
+            return
+        # Evict down to 90% of the budget, so evictions are not run on every put
+        to_free = size - int(0.9 * budget)
+        evicted = 0
+        for _, entry_size, path in sorted(entries):
+            if to_free <= 0:
+                break
+            with contextlib.suppress(FileNotFoundError):
+                os.remove(path)
+                evicted += 1
+            to_free -= entry_size
+        logging.info(
+            f"Evicted {evicted} job results from {self.directory} "
+            f"to stay within {self.max_size_mb}MB."
+        )
@@ -1,6 +1,22 @@
 # flake8: noqa: F401
+from typing import TYPE_CHECKING
+
+from medbench.lazy import lazy_attributes
 
 from .base import EvaluatorRunner
-from .multimodal import ABEvaluatorRunner, MultimodalEvaluatorRunner
-from .summarization import SummaryEvaluatorRunner
-from .tbfact import TBFactEvaluator, TBFactEvaluatorRunner
+
+__getattr__, __dir__ = lazy_attributes(
+    __name__,
+    {
+        "ABEvaluatorRunner": ".multimodal",
+        "MultimodalEvaluatorRunner": ".multimodal",
+        "SummaryEvaluatorRunner": ".summarization",
+        "TBFactEvaluator": ".tbfact",
+        "TBFactEvaluatorRunner": ".tbfact",
+    },
+)
+
+if TYPE_CHECKING:
+    from .multimodal import ABEvaluatorRunner, MultimodalEvaluatorRunner
+    from .summarization import SummaryEvaluatorRunner
+    from .tbfact import TBFactEvaluator, TBFactEvaluatorRunner
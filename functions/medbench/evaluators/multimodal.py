@@ -140,7 +140,8 @@ Your output is programmatically processed, so make sure to follow the template e
                 self.predictions_model_run, self.evaluator
             )
         )
-        self.evaluator_runner.run()
+        # Instances are completed concurrently, without blocking the loop
+        await self.evaluator_runner.arun()
 
     def _prepare_evaluation_model_run(
         self, model_run: ModelRun, model: Model
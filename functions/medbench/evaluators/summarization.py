@@ -274,7 +274,8 @@ Your output is programmatically processed, so make sure to follow the template e
                     dataset=self.predictions_model_run.dataset,
                 )
             )
-            self.questions_generator_runner.run()
+            # Instances are completed concurrently, without blocking the loop
+            await self.questions_generator_runner.arun()
         else:
             logging.debug("Questions already generated. Skipping.")
 
@@ -300,7 +301,7 @@ Your output is programmatically processed, so make sure to follow the template e
                 ),
             )
         )
-        self.answerer_runner.run()
+        await self.answerer_runner.arun()
 
         answers: List[Instance] = self._process_triplet_output(
             self.answerer_runner._model_run.results,
@@ -325,7 +326,7 @@ Your output is programmatically processed, so make sure to follow the template e
                 ),
             )
         )
-        self.evaluator_runner.run()
+        await self.evaluator_runner.arun()
 
     def _process_triplet_output(
         self,
@@ -80,9 +80,12 @@ class MedBenchLLMClientAdapter:
             ),
         )
 
-        # Run inference
-        self.runner.setup(model_run)
-        self.runner.run()
+        # Run inference on a copy of the runner, so concurrent calls do not
+        # share the runner's model run, without blocking the event loop.
+        # Runner copies share the pooled clients and their connections.
+        runner = attrs.evolve(self.runner)
+        runner.setup(model_run)
+        await runner.arun()
 
         # Get the result
         result = model_run.results[0]
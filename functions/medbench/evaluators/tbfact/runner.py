@@ -4,7 +4,7 @@ MedBench TBFactEvaluatorRunner: integrates the standalone TBFactEvaluator and ex
 
 import asyncio
 import logging
-from typing import List, Optional, Generator, Tuple, Dict, Any
+from typing import Any, Callable, Dict, Generator, List, Optional, Tuple
 
 import attrs
 
@@ -62,6 +62,12 @@ class TBFactEvaluatorRunner(EvaluatorRunner):
             Passed to the TBFactEvaluator.
         entailment_evaluation_prompt_template (str): Prompt template for entailment evaluation.
             Passed to the TBFactEvaluator.
+        completed_results (Dict[str, Dict[str, Any]]): TBFact results of instances
+            already evaluated, e.g. by a previous attempt, keyed by instance id.
+            These instances are not evaluated again, but their results are
+            returned and added to the ModelRuns as if they were.
+        on_batch_complete (Callable): Called with the new results of each batch,
+            keyed by instance id, e.g. to checkpoint them.
         tbfact (TBFactEvaluator): The TBFactEvaluator instance.
         tbfact_evaluation_model_run (ModelRun): ModelRun for TBFact evaluation.
         fact_extraction_model_run (ModelRun): ModelRun for fact extraction.
@@ -80,6 +86,10 @@ class TBFactEvaluatorRunner(EvaluatorRunner):
     fact_extraction_prompt_template: Optional[str] = None
     entailment_evaluation_prompt_template: Optional[str] = None
 
+    # Resuming from previous attempts
+    completed_results: Dict[str, Dict[str, Any]] = attrs.field(factory=dict)
+    on_batch_complete: Optional[Callable[[Dict[str, Dict[str, Any]]], None]] = None
+
     tbfact: TBFactEvaluator = attrs.field(init=False)
     tbfact_evaluation_model_run: ModelRun = attrs.field(init=False)
     fact_extraction_model_run: ModelRun = attrs.field(init=False)
@@ -142,6 +152,13 @@ class TBFactEvaluatorRunner(EvaluatorRunner):
         - Final scoring (with scores in metadata)
         """
         logging.info(f"Running TBFact evaluator workflow for {self.predictions_model_run.id}")
+        if self.completed_results:
+            logging.info(
+                f"Reusing {len(self.completed_results)} completed TBFact results "
+                f"for {self.predictions_model_run.id}."
+            )
+
+        tbfact_results: List[Dict[str, Any]] = []
 
         # Process instances in batches
         for batch in self._create_batches(
@@ -152,7 +169,6 @@ class TBFactEvaluatorRunner(EvaluatorRunner):
             # Create and run evaluation tasks for this batch
             batch_tasks = []
             batch_contexts = []
-            tbfact_results: List[Dict[str, Any]] = []
             
             for instance, prediction in batch:
                 # Extract texts
@@ -165,13 +181,14 @@ class TBFactEvaluatorRunner(EvaluatorRunner):
                     ]
                 )
                 
-                # Create evaluation task
-                task = self.tbfact.evaluate(
-                    generated_text=prediction_text,
-                    reference_text=reference_text,
-                    reference_id=instance.id,
-                )
-                batch_tasks.append(task)
+                # Create evaluation task, unless the instance was evaluated
+                if instance.id not in self.completed_results:
+                    task = self.tbfact.evaluate(
+                        generated_text=prediction_text,
+                        reference_text=reference_text,
+                        reference_id=instance.id,
+                    )
+                    batch_tasks.append(task)
                 batch_contexts.append({
                     'instance': instance,
                     'prediction': prediction,
@@ -180,12 +197,28 @@ class TBFactEvaluatorRunner(EvaluatorRunner):
                 })
             
             # Await batch results
-            batch_results = await asyncio.gather(*batch_tasks)
+            new_results = iter(await asyncio.gather(*batch_tasks))
+            batch_results = [
+                self.completed_results[context['instance'].id]
+                if context['instance'].id in self.completed_results
+                else next(new_results)
+                for context in batch_contexts
+            ]
             
             tbfact_results.extend(batch_results)
             logging.info(
                 f"TBFact evaluation batch complete for {self.predictions_model_run.id}."
             )
+            if batch_tasks and self.on_batch_complete is not None:
+                self.on_batch_complete(
+                    {
+                        context['instance'].id: result
+                        for context, result in zip(batch_contexts, batch_results)
+                        if context['instance'].id not in self.completed_results
+                        # Failed evaluations are retried by the next attempt
+                        and "error" not in result.get("details", {})
+                    }
+                )
 
             # Process results
             for eval_result, context in zip(batch_results, batch_contexts):
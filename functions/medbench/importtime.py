@@ -0,0 +1,74 @@
+"""Benchmark the import time of modules, as seen by a cold start.
+
+Each module is imported in fresh interpreters with `python -X importtime`,
+and the median cumulative import time is reported, with the slowest imports
+of the median run. Compare revisions with e.g.:
+
+    python -m medbench.importtime function_app medbench.metrics --runs 7
+"""
+
+import argparse
+import json
+import subprocess
+import sys
+from typing import Optional
+
+
+def measure(module: str, runs: int = 5, top: int = 10) -> dict:
+    """Measure the import time of a module in fresh interpreters.
+
+    Returns:
+        The median and all cumulative import times of the module, in ms, and
+        the cumulative import times of its slowest imports in the median run.
+    """
+    samples = []
+    for _ in range(runs):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        samples.append(_parse(result.stderr))
+
+    samples.sort(key=lambda sample: sample[module])
+    median = samples[len(samples) // 2]
+    slowest = sorted(
+        ((name, ms) for name, ms in median.items() if name != module),
+        key=lambda item: -item[1],
+    )[:top]
+    return {
+        "module": module,
+        "median_ms": median[module],
+        "samples_ms": [sample[module] for sample in samples],
+        "slowest_imports_ms": dict(slowest),
+    }
+
+
+def _parse(output: str) -> dict[str, float]:
+    # Lines read "import time: <self us> | <cumulative us> | <indented name>"
+    times = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = int(cumulative) / 1000
+    return times
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("modules", nargs="+", help="Modules to import.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument(
+        "--top", type=int, default=10, help="Number of slowest imports to report."
+    )
+    args = parser.parse_args(argv)
+
+    for module in args.modules:
+        print(json.dumps(measure(module, args.runs, args.top), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,35 @@
+import importlib
+import sys
+from typing import Any, Callable
+
+
+def lazy_attributes(
+    package: str, attributes: dict[str, str]
+) -> tuple[Callable[[str], Any], Callable[[], list[str]]]:
+    """Module `__getattr__` and `__dir__` importing attributes on first access.
+
+    Implements PEP 562 lazy loading for packages re-exporting attributes of
+    their submodules, so importing the package does not import submodules,
+    and their dependencies (e.g. `openai`), until an attribute is used:
+    ```
+    __getattr__, __dir__ = lazy_attributes(__name__, {"Foo": ".foo"})
+    ```
+
+    Args:
+        package: Name of the package, i.e. its `__name__`.
+        attributes: Submodule of each attribute, relative to the package.
+    """
+    module = sys.modules[package]
+
+    def __getattr__(name: str) -> Any:
+        if name not in attributes:
+            raise AttributeError(f"module {package!r} has no attribute {name!r}")
+        value = getattr(importlib.import_module(attributes[name], package), name)
+        # Later accesses do not go through `__getattr__`
+        setattr(module, name, value)
+        return value
+
+    def __dir__() -> list[str]:
+        return sorted(set(vars(module)) | set(attributes))
+
+    return __getattr__, __dir__
@@ -1,4 +1,39 @@
-from .base import Metric, aggregate_metrics, get_evaluation_pairs
-from .image_match import calculate_image_metrics
-from .text_exact_match import calculate_exact_match_metrics
-from .text_summarization import calculate_summarization_metrics
+from typing import TYPE_CHECKING
+
+from medbench.lazy import lazy_attributes
+
+from .base import (
+    Metric,
+    MetricRegistry,
+    add_metric_score,
+    aggregate_metrics,
+    aggregate_results,
+    aggregate_statistics,
+    get_evaluation_pairs,
+)
+
+# Metric implementations, worker pools and job parsing are only imported when
+# used, and registered metrics when their name is looked up in MetricRegistry
+__getattr__, __dir__ = lazy_attributes(
+    __name__,
+    {
+        "read_instance_metrics": ".columnar",
+        "calculate_image_metrics": ".image_match",
+        "MetricJob": ".jobs",
+        "MetricProcessPool": ".parallel",
+        "metric_process_pool": ".parallel",
+        "MetricPool": ".pool",
+        "metric_pool": ".pool",
+        "calculate_exact_match_metrics": ".text_exact_match",
+        "calculate_summarization_metrics": ".text_summarization",
+    },
+)
+
+if TYPE_CHECKING:
+    from .columnar import read_instance_metrics
+    from .image_match import calculate_image_metrics
+    from .jobs import MetricJob
+    from .parallel import MetricProcessPool, metric_process_pool
+    from .pool import MetricPool, metric_pool
+    from .text_exact_match import calculate_exact_match_metrics
+    from .text_summarization import calculate_summarization_metrics
@@ -1,11 +1,22 @@
 import logging
+import numbers
+import warnings
 from abc import abstractmethod
-from typing import Generator, Self
+from typing import ClassVar, Generator, Optional, Self
 
 import attrs
+import numpy as np
 
 from medbench.datasets import Data
 from medbench.models import ModelRun
+from medbench.register import BaseRegistry
+
+
+class MetricRegistry(BaseRegistry["Metric"]):
+    _plugins = (
+        "medbench.metrics.text_exact_match",
+        "medbench.metrics.text_summarization",
+    )
 
 
 def get_evaluation_pairs(
@@ -16,31 +27,244 @@ def get_evaluation_pairs(
         yield input.get_ground_truths(), result.completions
 
 
-def aggregate_metrics(metrics: list[dict[str, float]]) -> dict[str, float]:
-    """Aggregate metrics for a model run."""
-    metric_values = {}
-    for instance_level_metrics in metrics:
-        for metric, value in instance_level_metrics.items():
-            if metric not in metric_values:
-                metric_values[metric] = []
-            metric_values[metric].append(value)
+def aggregate_results(
+    metrics: list[dict[str, float | str]],
+) -> dict[str, dict]:
+    """Aggregated metrics and statistics of the instance-level metrics of a
+    model run, keyed as in metrics results.
 
-    aggregated_metrics = {
-        metric: sum(values) / len(values) for metric, values in metric_values.items()
+    Instance metrics are packed into an array once, and shared by both
+    aggregates. See `aggregate_metrics` and `aggregate_statistics`.
+    """
+    names, values = _metric_columns(metrics)
+    return {
+        "aggregated_metrics": _aggregate_metrics(names, values),
+        "aggregated_statistics": _aggregate_statistics(names, values),
     }
 
+
+def aggregate_metrics(
+    metrics: list[dict[str, float | str]],
+) -> dict[str, float]:
+    """Aggregate metrics for a model run.
+
+    Returns the mean of each metric. Failed instances (error messages instead
+    of scores) and instances missing a metric are left out of its mean.
+    Metrics that failed on every instance are left out altogether.
+    """
+    return _aggregate_metrics(*_metric_columns(metrics))
+
+
+def _aggregate_metrics(names: list[str], values: np.ndarray) -> dict[str, float]:
+    if not names:
+        return {}
+    with np.errstate(invalid="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        means = np.nanmean(values, axis=0)
+
+    aggregated_metrics = {}
+    for name, mean in zip(names, means):
+        if np.isnan(mean):
+            logging.warning(f"Metric {name} failed on every instance.")
+            continue
+        aggregated_metrics[name] = float(mean)
+
     return aggregated_metrics
 
 
+def aggregate_statistics(
+    metrics: list[dict[str, float | str]],
+    percentiles: tuple[float, ...] = (5, 25, 50, 75, 95),
+    confidence: float = 0.95,
+    n_bootstrap: int = 1000,
+    seed: int = 0,
+) -> dict[str, dict[str, Optional[float]]]:
+    """Summary statistics of each metric over the instances of a model run.
+
+    Instance metrics are packed into a single (instances, metrics) array, with
+    NaN for failed or missing values, so the statistics of all metrics are
+    computed in one vectorized pass. The confidence interval of the mean is a
+    percentile bootstrap: each resample is drawn once, as counts per instance,
+    and shared by all metrics.
+
+    Args:
+        metrics: Instance-level metrics.
+        percentiles: Percentiles to report, between 0 and 100.
+        confidence: Confidence level of the bootstrap interval of the mean.
+        n_bootstrap: Number of bootstrap resamples. If 0, no interval is computed.
+        seed: Seed of the bootstrap resamples, so statistics are reproducible.
+
+    Returns:
+        Statistics keyed by metric name. Statistics that are not defined,
+        e.g. for metrics that failed on every instance, are None.
+    """
+    return _aggregate_statistics(
+        *_metric_columns(metrics), percentiles, confidence, n_bootstrap, seed
+    )
+
+
+def _aggregate_statistics(
+    names: list[str],
+    values: np.ndarray,
+    percentiles: tuple[float, ...] = (5, 25, 50, 75, 95),
+    confidence: float = 0.95,
+    n_bootstrap: int = 1000,
+    seed: int = 0,
+) -> dict[str, dict[str, Optional[float]]]:
+    if not names or not len(values):
+        return {}
+    valid = ~np.isnan(values)
+
+    with np.errstate(invalid="ignore", divide="ignore"), warnings.catch_warnings():
+        warnings.simplefilter("ignore", category=RuntimeWarning)
+        statistics = {
+            "count": valid.sum(axis=0),
+            "failures": (~valid).sum(axis=0),
+            "mean": np.nanmean(values, axis=0),
+            "std": np.nanstd(values, axis=0, ddof=1),
+            "min": np.nanmin(values, axis=0),
+            "max": np.nanmax(values, axis=0),
+        }
+        for q, percentile in zip(
+            percentiles, np.nanpercentile(values, percentiles, axis=0)
+        ):
+            statistics[f"p{q:g}"] = percentile
+
+        if n_bootstrap:
+            bootstrap_means = _bootstrap_means(values, valid, n_bootstrap, seed)
+            alpha = (1 - confidence) / 2
+            statistics["ci_lower"], statistics["ci_upper"] = np.nanpercentile(
+                bootstrap_means, [100 * alpha, 100 * (1 - alpha)], axis=0
+            )
+
+    counts = ("count", "failures")
+    return {
+        name: {
+            statistic: (
+                int(column[i])
+                if statistic in counts
+                else None if np.isnan(column[i]) else float(column[i])
+            )
+            for statistic, column in statistics.items()
+        }
+        for i, name in enumerate(names)
+    }
+
+
+def _metric_columns(
+    metrics: list[dict[str, float | str]],
+) -> tuple[list[str], np.ndarray]:
+    """Pack instance metrics into a float array, one column per metric.
+
+    Values that are not numbers, such as error messages, are NaN. NumPy
+    scalars are numbers too.
+    """
+    names = list(dict.fromkeys(name for instance in metrics for name in instance))
+    columns = {name: i for i, name in enumerate(names)}
+
+    values = np.full((len(metrics), len(names)), np.nan)
+    for row, instance_metrics in enumerate(metrics):
+        for name, value in instance_metrics.items():
+            if isinstance(value, (numbers.Real, np.number)):
+                values[row, columns[name]] = value
+
+    return names, values
+
+
+def _bootstrap_means(
+    values: np.ndarray,
+    valid: np.ndarray,
+    n_bootstrap: int,
+    seed: int,
+    max_block_size: int = 2**22,
+) -> np.ndarray:
+    """Means of each metric over bootstrap resamples of the instances.
+
+    Resamples are drawn as the number of times each instance is picked, so the
+    means of every metric are a single matrix product per block of resamples,
+    with NaN values weighted out.
+    """
+    n_instances = len(values)
+    rng = np.random.default_rng(seed)
+    block_size = max(1, max_block_size // n_instances)
+    weighted_values = np.where(valid, values, 0.0)
+    weights = valid.astype(np.float64)
+
+    means = []
+    for start in range(0, n_bootstrap, block_size):
+        size = min(block_size, n_bootstrap - start)
+        picks = rng.integers(0, n_instances, size=(size, n_instances))
+        # Offset each resample, so a single bincount counts the picks of all
+        counts = np.bincount(
+            (picks + n_instances * np.arange(size)[:, None]).ravel(),
+            minlength=size * n_instances,
+        ).reshape(size, n_instances)
+        means.append((counts @ weighted_values) / (counts @ weights))
+
+    return np.concatenate(means)
+
+
+def add_metric_score(
+    instance_metrics: dict[str, float],
+    name: str,
+    score: float | dict[str, float] | str,
+) -> None:
+    """Add a metric score to the instance-level metrics.
+
+    Scores of multi-valued metrics (dictionaries) are fanned out to their own
+    keys, while single scores are added under the metric name.
+    """
+    if isinstance(score, dict):
+        instance_metrics.update(score)
+    else:
+        instance_metrics[name] = score
+
+
 @attrs.define
 class Metric:
+    """Base class for instance-level metrics.
+
+    Attributes:
+        memory_footprint_mb (int): Rough estimate of the resident memory taken
+            by a set up metric (loaded modules, models, corpora). Used by the
+            `MetricPool` to keep warm metrics within its memory budget.
+        cpu_bound (bool): Whether the metric is pure Python and single-core,
+            so it is computed across the `MetricProcessPool` when enabled.
+    """
+
+    memory_footprint_mb: ClassVar[int] = 16
+    cpu_bound: ClassVar[bool] = False
+
     @classmethod
     @abstractmethod
     def setup() -> Self:
         raise NotImplementedError
 
-    def calculate(self, ground_truths: list[Data], prediction: Data) -> float | str:
-        """Calculate the metric for a given ground truth and prediction."""
+    @classmethod
+    def cache_config(cls) -> dict:
+        """Configuration that the scores of the metric depend on.
+
+        Part of the key of cached scores, so scores computed with another
+        configuration (e.g. another model) are never reused. Override in
+        metrics whose scores depend on settings.
+        """
+        return {}
+
+    def warm_up(self) -> None:
+        """Load any lazily initialized resources ahead of the first calculation.
+
+        Override in metrics whose first call is much slower than the following
+        ones, e.g. when models or corpora are only loaded on first use.
+        """
+        pass
+
+    def calculate(
+        self, ground_truths: list[Data], prediction: Data
+    ) -> float | dict[str, float] | str:
+        """Calculate the metric for a given ground truth and prediction.
+
+        Multi-valued metrics return a dictionary of scores keyed by name.
+        """
         try:
             return self._calculate(ground_truths, prediction)
         except Exception as e:
@@ -51,6 +275,45 @@ class Metric:
             raise e
             return str(e)
 
+    def calculate_batch(
+        self, ground_truths: list[list[Data]], predictions: list[Data]
+    ) -> list[float | dict[str, float] | str]:
+        """Calculate the metric for a batch of ground truths and predictions.
+
+        Metrics that can score many pairs in a single call override
+        `_calculate_batch`. If the batched call fails, the metric falls back to
+        scoring each pair with `calculate`, so a single faulty instance surfaces
+        exactly as it would in the per-instance mode.
+        """
+        if len(ground_truths) != len(predictions):
+            raise ValueError(
+                f"Got {len(ground_truths)} ground truths for "
+                f"{len(predictions)} predictions."
+            )
+        if not predictions:
+            return []
+
+        try:
+            return self._calculate_batch(ground_truths, predictions)
+        except Exception as e:
+            logging.error(
+                f"Error calculating batched metric {self.__class__.__name__}: {e}. "
+                "Falling back to per-instance calculation."
+            )
+            return [
+                self.calculate(instance_ground_truths, prediction)
+                for instance_ground_truths, prediction in zip(ground_truths, predictions)
+            ]
+
     @abstractmethod
     def _calculate(self, ground_truths: list[Data], prediction: Data) -> float:
         raise NotImplementedError
+
+    def _calculate_batch(
+        self, ground_truths: list[list[Data]], predictions: list[Data]
+    ) -> list[float]:
+        """Score a batch of pairs. Defaults to one `_calculate` call per pair."""
+        return [
+            self._calculate(instance_ground_truths, prediction)
+            for instance_ground_truths, prediction in zip(ground_truths, predictions)
+        ]
@@ -0,0 +1,465 @@
+"""BERTScore engine with a persistent cache of contextual token embeddings.
+
+Scores match `evaluate`'s bertscore module (and `bert_score.BERTScorer`)
+with its default settings: no idf weighting, no baseline rescaling, and the
+best F1 over all references of a prediction.
+"""
+
+import glob
+import hashlib
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Iterable, Optional
+
+import attrs
+import numpy as np
+
+
+@attrs.define
+class EmbeddingCache:
+    """Content-hash keyed cache of token embeddings.
+
+    Embeddings are kept in memory up to `max_memory_mb`, evicting the least
+    recently used ones, and, if `cache_dir` is set, persisted to disk as `.npy`
+    files that are loaded back as memory-mapped arrays. The disk cache survives
+    worker restarts and is shared by all workers mounting the same directory.
+    Once it grows beyond `max_disk_mb`, the embeddings least recently loaded
+    from disk are deleted, down to 90% of the budget.
+
+    Attributes:
+        cache_dir (str): Directory to persist embeddings to.
+            If None, embeddings are only cached in memory.
+        max_memory_mb (int): Memory budget for in-memory embeddings, in MB.
+        max_disk_mb (int): Disk budget for persisted embeddings, in MB.
+    """
+
+    cache_dir: Optional[str] = None
+    max_memory_mb: int = 512
+    max_disk_mb: int = 2048
+
+    _entries: "OrderedDict[str, np.ndarray]" = attrs.field(
+        init=False, factory=OrderedDict
+    )
+    _memory_bytes: int = attrs.field(init=False, default=0)
+    # Size of the persisted embeddings, scanned on the first write
+    _disk_bytes: Optional[int] = attrs.field(init=False, default=None)
+    _lock: threading.Lock = attrs.field(init=False, factory=threading.Lock)
+
+    @staticmethod
+    def key(namespace: str, text: str) -> str:
+        """Cache key of a text embedded by the model identified by `namespace`."""
+        return hashlib.sha256(f"{namespace}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[np.ndarray]:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+
+        path = self._path(key)
+        if path is None or not os.path.exists(path):
+            return None
+
+        try:
+            embedding = np.load(path, mmap_mode="r")
+            # Access times are set explicitly, as mounts may not update them
+            os.utime(path)
+        except Exception as e:
+            logging.warning(f"Ignoring unreadable cached embedding {path}: {e}")
+            return None
+
+        self._remember(key, embedding)
+        return embedding
+
+    def put(self, key: str, embedding: np.ndarray) -> None:
+        self._remember(key, embedding)
+
+        path = self._path(key)
+        if path is None or os.path.exists(path):
+            return
+
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Write to a temporary file first, so concurrent readers never
+            # load a partially written array.
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                np.save(f, embedding)
+            os.replace(tmp_path, path)
+            self._evict_disk(os.path.getsize(path))
+        except OSError as e:
+            logging.warning(f"Could not persist embedding to {path}: {e}")
+
+    def clear(self) -> None:
+        """Clear the in-memory cache. Persisted embeddings are kept."""
+        with self._lock:
+            self._entries.clear()
+            self._memory_bytes = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "memory_mb": self._memory_bytes / 2**20,
+                "max_memory_mb": self.max_memory_mb,
+                "cache_dir": self.cache_dir,
+                "disk_mb": (self._disk_bytes or 0) / 2**20,
+                "max_disk_mb": self.max_disk_mb,
+            }
+
+    def _remember(self, key: str, embedding: np.ndarray) -> None:
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return
+
+            self._entries[key] = embedding
+            self._memory_bytes += embedding.nbytes
+            while self._memory_bytes > self.max_memory_mb * 2**20 and len(
+                self._entries
+            ) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._memory_bytes -= evicted.nbytes
+
+    def _path(self, key: str) -> Optional[str]:
+        if not self.cache_dir:
+            return None
+        return os.path.join(self.cache_dir, key[:2], f"{key}.npy")
+
+    def _evict_disk(self, written_bytes: int) -> None:
+        budget = self.max_disk_mb * 2**20
+        with self._lock:
+            if self._disk_bytes is not None:
+                self._disk_bytes += written_bytes
+                if self._disk_bytes <= budget:
+                    return
+
+        # Scanned again when over budget, as other workers sharing the
+        # directory write and evict embeddings too
+        entries = []
+        for path in glob.glob(os.path.join(self.cache_dir, "*", "*.npy")):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_atime, stat.st_size, path))
+        size = sum(entry_size for _, entry_size, _ in entries)
+
+        if size > budget:
+            to_free = size - int(0.9 * budget)
+            evicted = 0
+            for _, entry_size, path in sorted(entries):
+                if to_free <= 0:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    continue
+                size -= entry_size
+                to_free -= entry_size
+                evicted += 1
+            logging.info(
+                f"Evicted {evicted} embeddings from {self.cache_dir} "
+                f"to stay within {self.max_disk_mb}MB."
+            )
+
+        with self._lock:
+            self._disk_bytes = size
+
+
+@attrs.define
+class BertScoreEngine:
+    """BERTScore engine caching contextual token embeddings across calls.
+
+    Reference embeddings are cached by content hash, so scoring several models
+    against the same references only pays the forward passes of the
+    predictions. Prediction embeddings can optionally be cached as well,
+    e.g. when the same outputs are re-scored.
+
+    Texts to encode are grouped in length buckets and batched up to a token
+    budget, so mixed-length clinical notes waste little compute on padding.
+
+    The encoder runs either with PyTorch, in full precision, or with ONNX
+    Runtime, quantized to int8 (see `medbench.metrics.bertscore_onnx`).
+
+    Attributes:
+        model_type (str): Hugging Face model name, as in `bert_score`.
+        num_layers (int): Layer whose embeddings are used.
+            Defaults to the `bert_score` default for `model_type`.
+        batch_size (int): Maximum number of texts per forward pass.
+        max_batch_tokens (int): Maximum number of tokens per forward pass,
+            padding included.
+        num_threads (int): Number of torch or ONNX Runtime intra-op threads.
+            Defaults to, and is capped at, the cores available to the worker.
+        cache (EmbeddingCache): Token embeddings cache.
+        cache_predictions (bool): Whether to cache prediction embeddings too.
+        backend (str): Encoder backend, either "torch" or "onnx".
+        onnx_model_dir (str): Directory of the exported ONNX encoder.
+            Required by the "onnx" backend.
+    """
+
+    model_type: str = "bert-base-uncased"
+    num_layers: Optional[int] = None
+    batch_size: int = 64
+    max_batch_tokens: int = 16384
+    num_threads: Optional[int] = None
+    cache: EmbeddingCache = attrs.field(factory=EmbeddingCache)
+    cache_predictions: bool = False
+    backend: str = attrs.field(
+        default="torch", validator=attrs.validators.in_(("torch", "onnx"))
+    )
+    onnx_model_dir: Optional[str] = None
+
+    _model: Any = attrs.field(init=False, default=None)
+    _tokenizer: Any = attrs.field(init=False, default=None)
+    _encoded_texts: int = attrs.field(init=False, default=0)
+    _encoded_tokens: int = attrs.field(init=False, default=0)
+    _padded_tokens: int = attrs.field(init=False, default=0)
+    _encoding_seconds: float = attrs.field(init=False, default=0.0)
+
+    def __attrs_post_init__(self):
+        if self.backend == "onnx":
+            from .bertscore_onnx import read_metadata
+
+            if not self.onnx_model_dir:
+                raise ValueError("The onnx backend requires onnx_model_dir.")
+            metadata = read_metadata(self.onnx_model_dir)
+            if metadata["model_type"] != self.model_type or (
+                self.num_layers not in (None, metadata["num_layers"])
+            ):
+                raise ValueError(
+                    f"ONNX encoder in {self.onnx_model_dir} was exported from "
+                    f"{metadata['model_type']}/{metadata['num_layers']}, "
+                    f"not {self.model_type}/{self.num_layers}."
+                )
+            self.num_layers = metadata["num_layers"]
+        elif self.num_layers is None:
+            from bert_score.utils import model2layers
+
+            self.num_layers = model2layers[self.model_type]
+
+    @property
+    def namespace(self) -> str:
+        """Identifies the embeddings produced by this engine in the cache."""
+        if self.backend == "onnx":
+            # Quantized embeddings differ slightly, never mix them with torch's
+            return f"{self.model_type}/{self.num_layers}/onnx-int8"
+        return f"{self.model_type}/{self.num_layers}"
+
+    def load(self) -> "BertScoreEngine":
+        """Load the tokenizer and the model, truncated to `num_layers`."""
+        if self._model is None:
+            start = time.perf_counter()
+            self._set_num_threads()
+            if self.backend == "onnx":
+                from .bertscore_onnx import OnnxEncoder
+
+                # torch is never imported, keeping the worker footprint small
+                self._model = OnnxEncoder(
+                    self.onnx_model_dir, num_threads=self.num_threads
+                ).load()
+            else:
+                from bert_score.utils import get_model, get_tokenizer
+
+                self._tokenizer = get_tokenizer(self.model_type, use_fast=False)
+                self._model = get_model(self.model_type, self.num_layers)
+            logging.info(
+                f"Loaded BERTScore model {self.namespace} in "
+                f"{time.perf_counter() - start:.2f}s."
+            )
+        return self
+
+    def score(
+        self, predictions: list[str], references: list[list[str]]
+    ) -> list[float]:
+        """Compute the BERTScore F1 of each prediction.
+
+        Args:
+            predictions: Predicted texts.
+            references: References of each prediction. The best F1 across
+                references is reported, as `bert_score` does.
+        """
+        reference_embeddings = self.embed(
+            [ref for refs in references for ref in refs], cache=True
+        )
+        prediction_embeddings = self.embed(predictions, cache=self.cache_predictions)
+
+        return [
+            max(
+                (
+                    greedy_cosine_f1(
+                        prediction_embeddings[prediction], reference_embeddings[ref]
+                    )
+                    for ref in refs
+                ),
+                default=0.0,
+            )
+            for prediction, refs in zip(predictions, references)
+        ]
+
+    def embed(self, texts: Iterable[str], cache: bool = True) -> dict[str, np.ndarray]:
+        """Get the L2-normalized token embeddings of each unique text.
+
+        Embeddings include the special tokens ([CLS] and [SEP]), since they
+        take part in the greedy matching.
+        """
+        embeddings: dict[str, np.ndarray] = {}
+        missing: list[str] = []
+        for text in dict.fromkeys(texts):
+            embedding = self.cache.get(self._key(text)) if cache else None
+            if embedding is None:
+                missing.append(text)
+            else:
+                embeddings[text] = embedding
+
+        if missing:
+            for text, embedding in zip(missing, self._encode(missing)):
+                embeddings[text] = embedding
+                if cache:
+                    self.cache.put(self._key(text), embedding)
+
+        return embeddings
+
+    def stats(self) -> dict:
+        """Encoding throughput and cache statistics."""
+        return {
+            "encoded_texts": self._encoded_texts,
+            "encoded_tokens": self._encoded_tokens,
+            "padded_tokens": self._padded_tokens,
+            "encoding_seconds": self._encoding_seconds,
+            "tokens_per_second": (
+                self._encoded_tokens / self._encoding_seconds
+                if self._encoding_seconds
+                else 0.0
+            ),
+            "num_threads": self.num_threads,
+            "cache": self.cache.stats(),
+        }
+
+    def _key(self, text: str) -> str:
+        return EmbeddingCache.key(self.namespace, text)
+
+    def _set_num_threads(self) -> None:
+        available_cores = (
+            len(os.sched_getaffinity(0))
+            if hasattr(os, "sched_getaffinity")
+            else os.cpu_count() or 1
+        )
+        self.num_threads = min(self.num_threads or available_cores, available_cores)
+        if self.backend == "torch":
+            import torch
+
+            # Intra-op threads are process-wide in torch
+            torch.set_num_threads(self.num_threads)
+
+    def _encode(self, texts: list[str]) -> list[np.ndarray]:
+        self.load()
+        start = time.perf_counter()
+
+        if self.backend == "onnx":
+            token_ids = [self._model.tokenize(text) for text in texts]
+        else:
+            from bert_score.utils import sent_encode
+
+            token_ids = [sent_encode(self._tokenizer, text) for text in texts]
+
+        embeddings: list[Optional[np.ndarray]] = [None] * len(texts)
+        padded_tokens = 0
+        for batch in self._length_buckets([len(ids) for ids in token_ids]):
+            batch_embeddings = self._forward([token_ids[i] for i in batch])
+            padded_tokens += batch_embeddings.shape[0] * batch_embeddings.shape[1]
+            batch_embeddings /= np.linalg.norm(batch_embeddings, axis=-1, keepdims=True)
+            for i, embedding in zip(batch, batch_embeddings):
+                # Copy, so cached embeddings do not keep the whole batch alive
+                embeddings[i] = embedding[: len(token_ids[i])].copy()
+
+        elapsed = time.perf_counter() - start
+        tokens = sum(len(ids) for ids in token_ids)
+        self._encoded_texts += len(texts)
+        self._encoded_tokens += tokens
+        self._padded_tokens += padded_tokens
+        self._encoding_seconds += elapsed
+        logging.info(
+            f"Encoded {len(texts)} texts ({tokens} tokens, "
+            f"{1 - tokens / padded_tokens:.1%} padding) with {self.namespace} "
+            f"at {tokens / elapsed:.0f} tokens/s."
+        )
+
+        return embeddings
+
+    def _forward(self, token_ids: list[list[int]]) -> np.ndarray:
+        """Token embeddings of a batch, padded to its longest text."""
+        pad_token_id = (
+            self._model.pad_token_id
+            if self.backend == "onnx"
+            else self._tokenizer.pad_token_id
+        )
+        max_length = max(len(ids) for ids in token_ids)
+        input_ids = np.full((len(token_ids), max_length), pad_token_id, dtype=np.int64)
+        attention_mask = np.zeros((len(token_ids), max_length), dtype=np.int64)
+        for row, ids in enumerate(token_ids):
+            input_ids[row, : len(ids)] = ids
+            attention_mask[row, : len(ids)] = 1
+
+        if self.backend == "onnx":
+            return self._model(input_ids, attention_mask).astype(np.float32)
+
+        import torch
+        from bert_score.utils import bert_encode
+
+        embeddings = bert_encode(
+            self._model,
+            torch.from_numpy(input_ids),
+            attention_mask=torch.from_numpy(attention_mask),
+        )
+        return embeddings.numpy().astype(np.float32)
+
+    def _length_buckets(self, lengths: list[int]) -> list[list[int]]:
+        """Group text indices into batches of similar lengths.
+
+        Texts are sorted by length, longest first, and batched until the
+        padded batch would exceed `max_batch_tokens` or `batch_size` texts.
+        Since every batch is padded to its longest text, sorting keeps padding
+        to a minimum, while the token budget keeps the cost of each forward
+        pass (and its memory) bounded regardless of text lengths.
+        """
+        order = sorted(range(len(lengths)), key=lambda i: -lengths[i])
+
+        batches: list[list[int]] = []
+        batch: list[int] = []
+        for i in order:
+            # Sorted longest first, so the first text sets the padded length
+            padded_length = lengths[batch[0]] if batch else lengths[i]
+            if batch and (
+                len(batch) >= self.batch_size
+                or (len(batch) + 1) * padded_length > self.max_batch_tokens
+            ):
+                batches.append(batch)
+                batch = []
+            batch.append(i)
+        if batch:
+            batches.append(batch)
+
+        return batches
+
+
+def greedy_cosine_f1(prediction: np.ndarray, reference: np.ndarray) -> float:
+    """BERTScore F1 from L2-normalized token embeddings.
+
+    Each token is greedily matched to its most similar token on the other
+    side. Special tokens ([CLS] and [SEP], first and last) can be matched but
+    do not count towards precision or recall, as in `bert_score` without idf.
+    """
+    if len(prediction) <= 2 or len(reference) <= 2:
+        # Empty texts only contain special tokens
+        return 0.0
+
+    similarity = prediction @ reference.T
+    precision = similarity.max(axis=1)[1:-1].mean()
+    recall = similarity.max(axis=0)[1:-1].mean()
+    if precision + recall == 0:
+        return 0.0
+    return float(2 * precision * recall / (precision + recall))
@@ -0,0 +1,372 @@
+"""ONNX Runtime backend for the BERTScore engine.
+
+The encoder used by BERTScore (the model truncated to the scoring layer) is
+exported to ONNX once, typically at image build time, and its weights are
+quantized to int8 with ONNX Runtime dynamic quantization. At runtime, the
+quantized encoder runs without torch, which is both faster on CPU and lighter
+in memory than the full precision PyTorch model.
+
+Export the encoder and measure its accuracy against PyTorch with:
+
+    python -m medbench.metrics.bertscore_onnx export --output-dir <dir>
+    python -m medbench.metrics.bertscore_onnx compare --model-dir <dir>
+
+The measured accuracy delta is stored in the metadata of the exported model
+and logged whenever it is loaded.
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Optional
+
+import attrs
+import numpy as np
+
+ONNX_MODEL_FILE = "encoder.int8.onnx"
+ONNX_FP32_MODEL_FILE = "encoder.fp32.onnx"
+METADATA_FILE = "metadata.json"
+
+# Pairs of (prediction, reference) used to measure the accuracy delta of the
+# quantized encoder when no evaluation file is given.
+SAMPLE_PAIRS = [
+    (
+        "The patient presents with chest pain radiating to the left arm.",
+        "Patient reports chest pain that radiates to the left arm.",
+    ),
+    (
+        "No acute cardiopulmonary abnormality.",
+        "No acute cardiopulmonary process identified.",
+    ),
+    (
+        "Mild cardiomegaly with small bilateral pleural effusions.",
+        "The heart is mildly enlarged. Small pleural effusions on both sides.",
+    ),
+    (
+        "Start metformin 500 mg twice daily and recheck HbA1c in three months.",
+        "Initiate metformin 500mg BID; repeat hemoglobin A1c in 3 months.",
+    ),
+    (
+        "The fracture of the distal radius is healing without displacement.",
+        "Healing distal radius fracture, alignment is maintained.",
+    ),
+    (
+        "History of type 2 diabetes mellitus, hypertension and hyperlipidemia.",
+        "PMH: T2DM, HTN, HLD.",
+    ),
+    (
+        "Right lower lobe consolidation concerning for pneumonia.",
+        "Opacity in the right lower lobe, likely pneumonia.",
+    ),
+    (
+        "Discharged home in stable condition with follow up in two weeks.",
+        "The patient was sent home stable and will follow up in 2 weeks.",
+    ),
+    (
+        "",
+        "No findings.",
+    ),
+    (
+        "MRI of the brain shows no evidence of acute infarction or hemorrhage, "
+        "with mild chronic small vessel ischemic changes in the periventricular "
+        "white matter and age-appropriate volume loss.",
+        "No acute intracranial abnormality. Mild chronic microvascular ischemic "
+        "changes.",
+    ),
+]
+
+
+@attrs.define
+class OnnxEncoder:
+    """Quantized ONNX encoder producing BERTScore token embeddings.
+
+    Attributes:
+        model_dir (str): Directory the encoder was exported to with
+            `export_onnx_encoder`.
+        num_threads (int): Number of ONNX Runtime intra-op threads.
+            If None, ONNX Runtime picks it.
+    """
+
+    model_dir: str
+    num_threads: Optional[int] = None
+
+    metadata: dict = attrs.field(init=False, factory=dict)
+    _session: Any = attrs.field(init=False, default=None)
+    _tokenizer: Any = attrs.field(init=False, default=None)
+
+    def __attrs_post_init__(self):
+        self.metadata = read_metadata(self.model_dir)
+
+    @property
+    def pad_token_id(self) -> int:
+        return self._tokenizer.pad_token_id
+
+    def load(self) -> "OnnxEncoder":
+        """Load the tokenizer and create the ONNX Runtime session."""
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        if self._session is None:
+            options = onnxruntime.SessionOptions()
+            if self.num_threads:
+                options.intra_op_num_threads = self.num_threads
+            options.graph_optimization_level = (
+                onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+            )
+            self._session = onnxruntime.InferenceSession(
+                os.path.join(self.model_dir, ONNX_MODEL_FILE),
+                sess_options=options,
+                providers=["CPUExecutionProvider"],
+            )
+            self._tokenizer = AutoTokenizer.from_pretrained(
+                self.model_dir, use_fast=False
+            )
+
+            accuracy = self.metadata.get("accuracy")
+            if accuracy:
+                logging.info(
+                    f"Loaded ONNX BERTScore encoder from {self.model_dir}, "
+                    f"F1 delta against PyTorch: mean "
+                    f"{accuracy['mean_abs_delta']:.2e}, max "
+                    f"{accuracy['max_abs_delta']:.2e}."
+                )
+            else:
+                logging.warning(
+                    f"Loaded ONNX BERTScore encoder from {self.model_dir}, "
+                    "but its accuracy against PyTorch was never measured."
+                )
+        return self
+
+    def tokenize(self, text: str) -> list[int]:
+        """Token ids of a text, special tokens included, as `bert_score`."""
+        return self._tokenizer.encode(
+            text.strip(),
+            add_special_tokens=True,
+            max_length=self._tokenizer.model_max_length,
+            truncation=True,
+        )
+
+    def __call__(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        """Token embeddings of a padded batch, shaped (batch, length, hidden)."""
+        (embeddings,) = self._session.run(
+            ["embeddings"],
+            {
+                "input_ids": input_ids.astype(np.int64),
+                "attention_mask": attention_mask.astype(np.int64),
+            },
+        )
+        return embeddings
+
+
+def read_metadata(model_dir: str) -> dict:
+    with open(os.path.join(model_dir, METADATA_FILE)) as f:
+        return json.load(f)
+
+
+def write_metadata(model_dir: str, metadata: dict) -> None:
+    with open(os.path.join(model_dir, METADATA_FILE), "w") as f:
+        json.dump(metadata, f, indent=2)
+
+
+def export_onnx_encoder(
+    model: Any,
+    tokenizer: Any,
+    output_dir: str,
+    model_type: str,
+    num_layers: int,
+    opset_version: int = 17,
+) -> str:
+    """Export a BERTScore encoder to ONNX and quantize it to int8.
+
+    Args:
+        model: Encoder truncated to `num_layers`, e.g. from
+            `bert_score.utils.get_model`.
+        tokenizer: Tokenizer of the encoder, saved along with it.
+        output_dir: Directory to write the encoder, tokenizer and metadata to.
+        model_type: Hugging Face model name of the encoder.
+        num_layers: Layer whose embeddings the encoder outputs.
+        opset_version: ONNX opset to export to.
+
+    Returns:
+        The path to the quantized encoder.
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    class Encoder(torch.nn.Module):
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return self.model(input_ids, attention_mask=attention_mask)[0]
+
+    os.makedirs(output_dir, exist_ok=True)
+    fp32_path = os.path.join(output_dir, ONNX_FP32_MODEL_FILE)
+    int8_path = os.path.join(output_dir, ONNX_MODEL_FILE)
+
+    start = time.perf_counter()
+    dummy = tokenizer(["export the encoder"], return_tensors="pt")
+    with torch.no_grad():
+        torch.onnx.export(
+            Encoder(model.eval()),
+            (dummy["input_ids"], dummy["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["embeddings"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "embeddings": {0: "batch", 1: "sequence"},
+            },
+            opset_version=opset_version,
+            dynamo=False,
+        )
+
+    # Weights of the linear layers are quantized ahead of time, activations
+    # are quantized on the fly from their observed range.
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    os.remove(fp32_path)
+
+    tokenizer.save_pretrained(output_dir)
+    write_metadata(
+        output_dir,
+        {
+            "model_type": model_type,
+            "num_layers": num_layers,
+            "quantization": "dynamic-int8",
+            "opset_version": opset_version,
+        },
+    )
+    logging.info(
+        f"Exported {model_type} (layer {num_layers}) to {int8_path} in "
+        f"{time.perf_counter() - start:.2f}s, "
+        f"{os.path.getsize(int8_path) / 2**20:.0f}MB."
+    )
+    return int8_path
+
+
+def measure_accuracy(
+    onnx_engine: Any,
+    torch_engine: Any,
+    pairs: list[tuple[str, str]],
+) -> dict:
+    """Compare the BERTScore F1 of the ONNX and PyTorch engines on `pairs`."""
+    predictions = [prediction for prediction, _ in pairs]
+    references = [[reference] for _, reference in pairs]
+
+    start = time.perf_counter()
+    torch_scores = np.array(torch_engine.score(predictions, references))
+    torch_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    onnx_scores = np.array(onnx_engine.score(predictions, references))
+    onnx_seconds = time.perf_counter() - start
+
+    delta = np.abs(onnx_scores - torch_scores)
+    return {
+        "pairs": len(pairs),
+        "mean_abs_delta": float(delta.mean()),
+        "max_abs_delta": float(delta.max()),
+        "torch_mean_f1": float(torch_scores.mean()),
+        "onnx_mean_f1": float(onnx_scores.mean()),
+        "torch_seconds": torch_seconds,
+        "onnx_seconds": onnx_seconds,
+    }
+
+
+def _read_pairs(path: Optional[str]) -> list[tuple[str, str]]:
+    if path is None:
+        return SAMPLE_PAIRS
+    # JSON lines with "prediction" and "reference" keys
+    with open(path) as f:
+        return [
+            (record["prediction"], record["reference"])
+            for record in map(json.loads, f)
+            if record
+        ]
+
+
+def _export(args: argparse.Namespace) -> int:
+    from bert_score.utils import get_model, get_tokenizer, model2layers
+
+    num_layers = args.num_layers or model2layers[args.model_type]
+    export_onnx_encoder(
+        get_model(args.model_type, num_layers),
+        get_tokenizer(args.model_type, use_fast=False),
+        args.output_dir,
+        model_type=args.model_type,
+        num_layers=num_layers,
+    )
+    return 0
+
+
+def _compare(args: argparse.Namespace) -> int:
+    from .bertscore import BertScoreEngine, EmbeddingCache
+
+    metadata = read_metadata(args.model_dir)
+    engines = {
+        backend: BertScoreEngine(
+            model_type=metadata["model_type"],
+            num_layers=metadata["num_layers"],
+            backend=backend,
+            onnx_model_dir=args.model_dir,
+            # Scores must come from both encoders, not from cached embeddings
+            cache=EmbeddingCache(cache_dir=None),
+        ).load()
+        for backend in ("torch", "onnx")
+    }
+
+    accuracy = measure_accuracy(
+        engines["onnx"], engines["torch"], _read_pairs(args.pairs)
+    )
+    metadata["accuracy"] = accuracy
+    write_metadata(args.model_dir, metadata)
+    print(json.dumps(accuracy, indent=2))
+
+    if accuracy["max_abs_delta"] > args.tolerance:
+        logging.error(
+            f"ONNX BERTScore F1 differs from PyTorch by up to "
+            f"{accuracy['max_abs_delta']:.4f}, above the {args.tolerance} tolerance."
+        )
+        return 1
+    return 0
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    subparsers = parser.add_subparsers(required=True)
+
+    export = subparsers.add_parser("export", help="Export the quantized encoder.")
+    export.add_argument("--model-type", default="bert-base-uncased")
+    export.add_argument("--num-layers", type=int, default=None)
+    export.add_argument("--output-dir", required=True)
+    export.set_defaults(command=_export)
+
+    compare = subparsers.add_parser(
+        "compare", help="Measure the F1 delta against PyTorch."
+    )
+    compare.add_argument("--model-dir", required=True)
+    compare.add_argument(
+        "--pairs",
+        default=None,
+        help="JSON lines file of prediction and reference pairs.",
+    )
+    compare.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.02,
+        help="Maximum absolute F1 delta before failing.",
+    )
+    compare.set_defaults(command=_compare)
+
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+    return args.command(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
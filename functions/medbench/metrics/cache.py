@@ -0,0 +1,360 @@
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Iterator, Optional, Type
+
+import attrs
+
+from medbench.config import settings
+from medbench.datasets import Data
+from medbench.storage import container_client
+
+from .base import Metric
+
+Score = float | dict[str, float] | str
+
+
+@attrs.define
+class MetricResultCache:
+    """Persistent cache of instance-level metric scores.
+
+    Scores are keyed by a content hash of the metric name, its configuration,
+    the prediction and the references, so re-running an unchanged job, or
+    re-scoring the same outputs in another experiment, only computes the
+    metrics of instances that were never scored before.
+
+    Scores are stored in a local SQLite file, shared by all the processes of a
+    worker, and evicted least recently used first once the file grows beyond
+    `max_size_mb`. If a blob container is set, scores are also written to it,
+    and local misses are looked up there, so scores survive worker recycling
+    and are shared across instances of the function app.
+
+    The blob tier stores the scores of a metric for all the pairs of a job
+    (or shard) in a single blob, keyed by a hash of their keys, so a job is
+    looked up with one request per metric rather than one per instance and
+    metric. Blobs are only reused by jobs with the same pairs, e.g. reruns
+    and duplicates; other jobs sharing some of the pairs only reuse their
+    scores from the local tier.
+
+    Failed scores (error messages) are never cached.
+
+    Attributes:
+        path (str): SQLite file to store scores in.
+            If None, the cache is disabled, unless a blob container is set.
+        max_size_mb (int): Size budget of the cached scores, in MB.
+        blob_container (Any): `azure.storage.blob.ContainerClient` of the
+            blob tier. If None, scores are only cached locally.
+        blob_ttl_days (float): Blobs last written longer ago are ignored, and
+            rewritten once their scores are calculated again.
+            If None, blobs never expire.
+    """
+
+    path: Optional[str] = None
+    max_size_mb: int = 256
+    blob_container: Any = None
+    blob_ttl_days: Optional[float] = None
+
+    _connection: Optional[sqlite3.Connection] = attrs.field(init=False, default=None)
+    _lock: threading.Lock = attrs.field(init=False, factory=threading.Lock)
+    _hits: int = attrs.field(init=False, default=0)
+    _misses: int = attrs.field(init=False, default=0)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path) or self.blob_container is not None
+
+    @staticmethod
+    def key(
+        metric: str, config: dict, ground_truths: list[Data], prediction: Data
+    ) -> str:
+        """Cache key of the score of a metric for an evaluation pair."""
+        references = hashlib.sha256(
+            json.dumps([gt.get_text() for gt in ground_truths]).encode("utf-8")
+        ).hexdigest()
+        prediction_hash = hashlib.sha256(
+            prediction.get_text().encode("utf-8")
+        ).hexdigest()
+        config_json = json.dumps(config, sort_keys=True)
+        return hashlib.sha256(
+            "\0".join([metric, config_json, prediction_hash, references]).encode(
+                "utf-8"
+            )
+        ).hexdigest()
+
+    def calculate(
+        self,
+        metrics: dict[str, Type[Metric]],
+        ground_truths: list[list[Data]],
+        predictions: list[Data],
+        calculate: Callable[
+            [dict[str, Type[Metric]], list[list[Data]], list[Data]],
+            dict[str, list[Score]],
+        ],
+    ) -> dict[str, list[Score]]:
+        """Score evaluation pairs, only calculating the scores not cached.
+
+        Args:
+            metrics: Metric classes keyed by name.
+            ground_truths: Ground truths of each evaluation pair.
+            predictions: Prediction of each evaluation pair.
+            calculate: Calculates the scores of a subset of the metrics and of
+                the pairs, with the same arguments and result as this method.
+
+        Returns:
+            The scores of each metric, keyed by name, in the order of the pairs.
+        """
+        if not self.enabled:
+            return calculate(metrics, ground_truths, predictions)
+
+        keys = {
+            name: [
+                self.key(
+                    f"{metric_cls.__module__}.{metric_cls.__qualname__}",
+                    metric_cls.cache_config(),
+                    gts,
+                    prediction,
+                )
+                for gts, prediction in zip(ground_truths, predictions)
+            ]
+            for name, metric_cls in metrics.items()
+        }
+        cached = self.get_many([key for name in keys for key in keys[name]])
+        if self.blob_container is not None:
+            for name in metrics:
+                if any(key not in cached for key in keys[name]):
+                    blob_scores = {
+                        key: score
+                        for key, score in self._get_blob(keys[name]).items()
+                        if key not in cached
+                    }
+                    self._put_local(blob_scores)
+                    cached.update(blob_scores)
+                    with self._lock:
+                        self._hits += len(blob_scores)
+                        self._misses -= len(blob_scores)
+
+        scores = {name: [cached.get(key) for key in keys[name]] for name in metrics}
+        # Metrics missing the same pairs, usually all of them or none, are
+        # calculated together, so the caller can batch them
+        missing: dict[tuple[int, ...], dict[str, Type[Metric]]] = {}
+        for name, metric_cls in metrics.items():
+            indices = tuple(
+                i for i, score in enumerate(scores[name]) if score is None
+            )
+            if indices:
+                missing.setdefault(indices, {})[name] = metric_cls
+
+        for indices, missing_metrics in missing.items():
+            calculated = calculate(
+                missing_metrics,
+                [ground_truths[i] for i in indices],
+                [predictions[i] for i in indices],
+            )
+            new_entries = {}
+            for name, metric_scores in calculated.items():
+                for i, score in zip(indices, metric_scores):
+                    scores[name][i] = score
+                    if not isinstance(score, str):
+                        new_entries[keys[name][i]] = score
+            self.put_many(new_entries)
+
+            if self.blob_container is not None:
+                for name in missing_metrics:
+                    self._put_blob(
+                        keys[name],
+                        {
+                            key: score
+                            for key, score in zip(keys[name], scores[name])
+                            if not isinstance(score, str)
+                        },
+                    )
+
+        return scores
+
+    def get_many(self, keys: list[str]) -> dict[str, Score]:
+        """Get the locally cached scores of the keys found."""
+        found = self._get_local(keys)
+        with self._lock:
+            self._hits += len(found)
+            self._misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, scores: dict[str, Score]) -> None:
+        """Cache scores locally, keyed by `key`."""
+        if scores:
+            self._put_local(scores)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "path": self.path,
+            "size_mb": self._size_bytes() / 2**20,
+            "max_size_mb": self.max_size_mb,
+            "blob_tier": self.blob_container is not None,
+        }
+
+    def _connect(self) -> Optional[sqlite3.Connection]:
+        if not self.path:
+            return None
+        if self._connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(
+                self.path, timeout=30, check_same_thread=False, isolation_level=None
+            )
+            # Readers do not block the writer, e.g. other worker processes
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS scores ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "size INTEGER NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS scores_accessed_at ON scores (accessed_at)"
+            )
+            self._connection = connection
+        return self._connection
+
+    def _get_local(self, keys: list[str]) -> dict[str, Score]:
+        found = {}
+        try:
+            with self._lock:
+                connection = self._connect()
+                if connection is None:
+                    return found
+                # Stay below SQLite's limit of variables per statement
+                for start in range(0, len(keys), 500):
+                    chunk = keys[start : start + 500]
+                    placeholders = ",".join("?" * len(chunk))
+                    rows = connection.execute(
+                        f"SELECT key, value FROM scores WHERE key IN ({placeholders})",
+                        chunk,
+                    ).fetchall()
+                    found.update((key, json.loads(value)) for key, value in rows)
+                with _transaction(connection):
+                    connection.executemany(
+                        "UPDATE scores SET accessed_at = ? WHERE key = ?",
+                        [(time.time(), key) for key in found],
+                    )
+        except sqlite3.Error as e:
+            logging.warning(f"Could not read metric scores from {self.path}: {e}")
+        return found
+
+    def _put_local(self, scores: dict[str, Score]) -> None:
+        if not scores:
+            return
+        now = time.time()
+        rows = []
+        for key, score in scores.items():
+            value = json.dumps(score)
+            rows.append((key, value, len(key) + len(value), now))
+
+        try:
+            with self._lock:
+                connection = self._connect()
+                if connection is None:
+                    return
+                with _transaction(connection):
+                    connection.executemany(
+                        "INSERT OR REPLACE INTO scores VALUES (?, ?, ?, ?)", rows
+                    )
+                    self._evict_to_budget(connection)
+        except sqlite3.Error as e:
+            logging.warning(f"Could not write metric scores to {self.path}: {e}")
+
+    def _evict_to_budget(self, connection: sqlite3.Connection) -> None:
+        (size,) = connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM scores"
+        ).fetchone()
+        budget = self.max_size_mb * 2**20
+        if size <= budget:
+            return
+
+        # Evict down to 90% of the budget, so evictions are not run on every put
+        to_free = size - int(0.9 * budget)
+        freed, evicted = 0, []
+        for key, entry_size in connection.execute(
+            "SELECT key, size FROM scores ORDER BY accessed_at"
+        ):
+            if freed >= to_free:
+                break
+            evicted.append((key,))
+            freed += entry_size
+        connection.executemany("DELETE FROM scores WHERE key = ?", evicted)
+        logging.info(
+            f"Evicted {len(evicted)} metric scores from {self.path} "
+            f"to stay within {self.max_size_mb}MB."
+        )
+
+    def _size_bytes(self) -> int:
+        try:
+            with self._lock:
+                connection = self._connect()
+                if connection is None:
+                    return 0
+                return connection.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM scores"
+                ).fetchone()[0]
+        except sqlite3.Error:
+            return 0
+
+    def _get_blob(self, keys: list[str]) -> dict[str, Score]:
+        from azure.core.exceptions import ResourceNotFoundError
+
+        name = _blob_name(keys)
+        try:
+            blob = self.blob_container.download_blob(name)
+            last_modified = blob.properties.last_modified
+            if self.blob_ttl_days is not None and last_modified is not None:
+                age_days = (time.time() - last_modified.timestamp()) / 86400
+                if age_days > self.blob_ttl_days:
+                    return {}
+            return json.loads(blob.readall())
+        except ResourceNotFoundError:
+            return {}
+        except Exception as e:
+            logging.warning(f"Could not read cached metric scores {name}: {e}")
+            return {}
+
+    def _put_blob(self, keys: list[str], scores: dict[str, Score]) -> None:
+        # Rewritten whole, with the scores of earlier runs of the same pairs
+        if not scores:
+            return
+        name = _blob_name(keys)
+        try:
+            self.blob_container.upload_blob(name, json.dumps(scores), overwrite=True)
+        except Exception as e:
+            logging.warning(f"Could not write cached metric scores {name}: {e}")
+
+
+@contextmanager
+def _transaction(connection: sqlite3.Connection) -> Iterator[None]:
+    # Connections are in autocommit mode, so writes are batched explicitly
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    connection.execute("COMMIT")
+
+
+def _blob_name(keys: list[str]) -> str:
+    # The keys of a metric's pairs, in order, identify the blob of their scores
+    digest = hashlib.sha256("\n".join(keys).encode("utf-8")).hexdigest()
+    return f"{digest[:2]}/{digest}.json"
+
+
+# The container is only connected to when scores are first looked up
+metric_result_cache = MetricResultCache(
+    path=settings.metrics_cache_path,
+    max_size_mb=settings.metrics_cache_max_size_mb,
+    blob_container=container_client(settings.metrics_cache_blob_container),
+    blob_ttl_days=settings.metrics_cache_blob_ttl_days or None,
+)
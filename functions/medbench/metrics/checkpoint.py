@@ -0,0 +1,162 @@
+import json
+import logging
+import os
+import threading
+from typing import Any, Optional
+
+import attrs
+
+from medbench.config import settings
+from medbench.storage import container_client
+
+
+@attrs.define
+class MetricCheckpoint:
+    """Checkpoint of the instance-level results of a metric job.
+
+    Results are appended to a local JSON Lines file as soon as they are added,
+    and, if a blob container is set, the whole checkpoint is uploaded to it
+    every `interval` results, so a retried invocation of the job, on the same
+    worker or another one, resumes from the results already computed.
+
+    Attributes:
+        name (str): Name of the checkpoint, unique to the job and its content
+            (see `for_job`).
+        directory (str): Directory of the local checkpoint files.
+            If None, checkpoints are only stored in the blob container.
+        blob_container (Any): `azure.storage.blob.ContainerClient` storing
+            checkpoints. If None, checkpoints are only stored locally.
+        interval (int): Number of results added between blob uploads.
+    """
+
+    name: str
+    directory: Optional[str] = None
+    blob_container: Any = None
+    interval: int = 20
+
+    _results: dict[str, Any] = attrs.field(init=False, factory=dict)
+    _pending: int = attrs.field(init=False, default=0)
+    _lock: threading.Lock = attrs.field(init=False, factory=threading.Lock)
+
+    @classmethod
+    def for_job(cls, job: str, sha256: str) -> "MetricCheckpoint":
+        """Checkpoint of a job blob, configured from the settings.
+
+        The checkpoint is keyed by the job name and the hash of its content,
+        so a job uploaded again with other content does not resume from it.
+        """
+        return cls(
+            name=f"{job}.{sha256[:16]}",
+            directory=settings.metrics_checkpoint_path,
+            blob_container=container_client(
+                settings.metrics_checkpoint_blob_container
+            ),
+            interval=settings.metrics_checkpoint_interval,
+        )
+
+    @property
+    def path(self) -> Optional[str]:
+        if not self.directory:
+            return None
+        return os.path.join(self.directory, f"{self.name}.jsonl")
+
+    @property
+    def blob_name(self) -> str:
+        return f"{self.name}.jsonl"
+
+    def load(self) -> dict[str, Any]:
+        """Load the results checkpointed by previous attempts, keyed by id."""
+        # The blob holds the results of attempts on any worker, and the local
+        # file those of attempts on this worker, up to the last result
+        lines = []
+        if self.blob_container is not None:
+            lines.extend(self._download().splitlines())
+        if self.path and os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                lines.extend(f.read().splitlines())
+
+        results = {}
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # The attempt was stopped while writing this line
+                continue
+            results[entry["id"]] = entry["result"]
+
+        with self._lock:
+            self._results = dict(results)
+        if results:
+            logging.info(
+                f"Resuming {self.name} from {len(results)} checkpointed results"
+            )
+        return results
+
+    def add(self, results: dict[str, Any]) -> None:
+        """Checkpoint the results of instances, keyed by id."""
+        if not results:
+            return
+        lines = _dumps(results)
+        with self._lock:
+            self._results.update(results)
+            self._pending += len(results)
+            if self.path:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                with open(self.path, "ab") as f:
+                    f.write(lines)
+            data = None
+            if self.blob_container is not None and self._pending >= self.interval:
+                self._pending = 0
+                data = _dumps(self._results)
+        if data is not None:
+            self._upload(data)
+
+    def flush(self) -> None:
+        """Upload results added since the last upload to the blob container."""
+        with self._lock:
+            if self.blob_container is None or not self._pending:
+                return
+            self._pending = 0
+            data = _dumps(self._results)
+        self._upload(data)
+
+    def clear(self) -> None:
+        """Delete the checkpoint, once the results of the job are written."""
+        with self._lock:
+            self._results = {}
+            self._pending = 0
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+        if self.blob_container is not None:
+            from azure.core.exceptions import ResourceNotFoundError
+
+            try:
+                self.blob_container.delete_blob(self.blob_name)
+            except ResourceNotFoundError:
+                pass
+            except Exception as e:
+                logging.warning(f"Could not delete checkpoint {self.blob_name}: {e}")
+
+    def _download(self) -> bytes:
+        from azure.core.exceptions import ResourceNotFoundError
+
+        try:
+            return self.blob_container.download_blob(self.blob_name).readall()
+        except ResourceNotFoundError:
+            return b""
+        except Exception as e:
+            logging.warning(f"Could not read checkpoint {self.blob_name}: {e}")
+            return b""
+
+    def _upload(self, data: bytes) -> None:
+        try:
+            self.blob_container.upload_blob(self.blob_name, data, overwrite=True)
+        except Exception as e:
+            logging.warning(f"Could not write checkpoint {self.blob_name}: {e}")
+
+
+def _dumps(results: dict[str, Any]) -> bytes:
+    return "".join(
+        json.dumps({"id": instance_id, "result": result}) + "\n"
+        for instance_id, result in results.items()
+    ).encode("utf-8")
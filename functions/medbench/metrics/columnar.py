@@ -0,0 +1,138 @@
+"""Columnar export of instance-level metrics, for analysis across many runs.
+
+Instance-level metrics are written in long format, one row per instance and
+metric, as Parquet (compact, for blob storage) or Arrow IPC files (memory
+mappable). Thousands of these files load as a single table:
+
+    from medbench.metrics.columnar import read_instance_metrics
+
+    table = read_instance_metrics("results/")
+    df = table.to_pandas()
+"""
+
+import glob
+import io
+import os
+from typing import TYPE_CHECKING, Iterable
+
+from medbench.models import ModelRun
+
+if TYPE_CHECKING:
+    import pyarrow as pa
+
+# File formats, by extension
+PARQUET_EXTENSION = ".parquet"
+ARROW_EXTENSION = ".arrow"
+
+
+def instance_metrics_schema() -> "pa.Schema":
+    import pyarrow as pa
+
+    # Dictionary encoding keeps repeated strings (e.g. metric names) compact
+    # both in files and in memory
+    return pa.schema(
+        [
+            pa.field("run_id", pa.dictionary(pa.int32(), pa.string())),
+            pa.field("model", pa.dictionary(pa.int32(), pa.string())),
+            pa.field("instance_id", pa.string()),
+            pa.field("split", pa.dictionary(pa.int32(), pa.string())),
+            pa.field("metric", pa.dictionary(pa.int32(), pa.string())),
+            pa.field("value", pa.float64()),
+            # Error message of instances the metric failed on
+            pa.field("error", pa.string()),
+        ]
+    )
+
+
+def instance_metrics_table(
+    model_run: ModelRun, instance_level_metrics: list[dict]
+) -> "pa.Table":
+    """Build the long table of the instance-level metrics of a model run.
+
+    Args:
+        model_run: Scored model run. Instance-level metrics are in the order
+            of its instances.
+        instance_level_metrics: Metrics of each instance, keyed by name.
+            Failed metrics hold an error message instead of a score.
+    """
+    import pyarrow as pa
+
+    columns = {name: [] for name in instance_metrics_schema().names}
+    for instance, metrics in zip(model_run.dataset.instances, instance_level_metrics):
+        for metric, value in metrics.items():
+            failed = isinstance(value, str)
+            columns["instance_id"].append(instance.id)
+            columns["split"].append(instance.split)
+            columns["metric"].append(metric)
+            columns["value"].append(
+                None if failed or value is None else float(value)
+            )
+            columns["error"].append(value if failed else None)
+
+    num_rows = len(columns["metric"])
+    columns["run_id"] = [model_run.id] * num_rows
+    columns["model"] = [model_run.model.name if model_run.model else None] * num_rows
+    return pa.Table.from_pydict(columns, schema=instance_metrics_schema())
+
+
+def dump_instance_metrics(table: "pa.Table", format: str = "parquet") -> bytes:
+    """Serialize an instance metrics table to Parquet or Arrow IPC file bytes."""
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = io.BytesIO()
+    if format == "parquet":
+        pq.write_table(table, sink, compression="zstd")
+    elif format == "arrow":
+        with pa.ipc.new_file(sink, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        raise ValueError(f"Unknown instance metrics format: {format}")
+    return sink.getvalue()
+
+
+def read_instance_metrics(paths: str | Iterable[str]) -> "pa.Table":
+    """Load instance metrics files as a single table.
+
+    Arrow IPC files are memory-mapped without copying, so tables larger than
+    memory can be loaded, and Parquet files are memory-mapped while decoded.
+    Tables are concatenated without copying their columns, and only the
+    dictionary indices of string columns are remapped to shared dictionaries.
+
+    Args:
+        paths: Files, directories (read recursively) or glob patterns of
+            `.parquet` and `.arrow` files.
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    tables = []
+    for path in _expand(paths):
+        if path.endswith(ARROW_EXTENSION):
+            with pa.memory_map(path, "r") as source:
+                tables.append(pa.ipc.open_file(source).read_all())
+        else:
+            tables.append(pq.read_table(path, memory_map=True))
+
+    if not tables:
+        return instance_metrics_schema().empty_table()
+    # Files have their own dictionaries, which group_by and joins cannot mix
+    return pa.concat_tables(tables, promote_options="permissive").unify_dictionaries()
+
+
+def _expand(paths: str | Iterable[str]) -> list[str]:
+    if isinstance(paths, str):
+        paths = [paths]
+
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for extension in (PARQUET_EXTENSION, ARROW_EXTENSION):
+                files.extend(
+                    glob.glob(os.path.join(path, "**", f"*{extension}"), recursive=True)
+                )
+        elif glob.has_magic(path):
+            files.extend(glob.glob(path, recursive=True))
+        else:
+            files.append(path)
+    return sorted(files)
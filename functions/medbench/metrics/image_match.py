@@ -1,7 +1,7 @@
 from medbench.datasets import Data
 from medbench.models import ModelRun
 
-from .base import get_evaluation_pairs, aggregate_metrics
+from .base import get_evaluation_pairs, aggregate_results
 
 
 def calculate_image_metrics(model_run: ModelRun) -> list[dict[str, float]]:
@@ -19,7 +19,7 @@ def calculate_image_metrics(model_run: ModelRun) -> list[dict[str, float]]:
         )
 
     metrics = {
-        "aggregated_metrics": aggregate_metrics(instance_level_metrics),
+        **aggregate_results(instance_level_metrics),
         "instance_level_metrics": instance_level_metrics,
     }
 
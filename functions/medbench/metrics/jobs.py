@@ -0,0 +1,128 @@
+import io
+import logging
+import time
+from typing import BinaryIO, Callable, Iterator, Optional
+
+import attrs
+import ijson
+
+from medbench.datasets import Instance
+from medbench.dedup import content_hash
+from medbench.models import ModelOutput, ModelRun
+
+INSTANCES_PREFIX = "model_run.dataset.instances"
+RESULTS_PREFIX = "model_run.results"
+
+
+@attrs.define
+class MetricJob:
+    """Metric job read from a `metricjobs` blob.
+
+    Jobs are parsed incrementally: instances and model outputs are built one at
+    a time, while the JSON text, its decoded string and its dictionary tree are
+    never held in memory at once. Instance inputs, which metrics do not use and
+    which may inline large base64 images, are dropped as soon as each instance
+    is parsed, so the model run only keeps references and completions.
+
+    Attributes:
+        metrics_type (str): Type of metrics to compute, e.g. "summarization".
+        metrics (list of str): Names of the metrics to compute.
+            If None, all the metrics of `metrics_type` are computed.
+        model_run (ModelRun): Model run to score, without instance inputs.
+        summary (dict): The job without its instances and model outputs,
+            replaced by their number, to echo along with the results.
+        shard (dict): If the job is a shard of a larger job, the name of that
+            job, the index of the shard, the number of shards and the range of
+            instances of the shard (see `medbench.metrics.shards`).
+    """
+
+    metrics_type: str
+    metrics: Optional[list[str]]
+    model_run: ModelRun
+    summary: dict
+    shard: Optional[dict] = None
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "MetricJob":
+        """Parse a job from its JSON bytes, without decoding them."""
+        # BytesIO shares the buffer of `data`, so each pass reads it in place
+        return cls.from_opener(lambda: io.BytesIO(data))
+
+    @classmethod
+    def from_file(cls, path: str) -> "MetricJob":
+        """Parse a job from a JSON file, without reading it into memory."""
+        return cls.from_opener(lambda: open(path, "rb"))
+
+    @classmethod
+    def from_opener(cls, open_stream: Callable[[], BinaryIO]) -> "MetricJob":
+        """Parse a job from binary streams over the same JSON.
+
+        The job is read in three passes, one for everything but instances and
+        model outputs, one for instances and one for model outputs, each
+        keeping at most one item in memory while it is parsed.
+        """
+        start = time.perf_counter()
+        with open_stream() as stream:
+            summary = _read_summary(stream)
+
+        model_run_json = summary.get("model_run") or {}
+        model_run = ModelRun.from_json(model_run_json)
+        with open_stream() as stream:
+            instances = list(_iter_instances(stream))
+        with open_stream() as stream:
+            results = list(_iter_results(stream))
+        model_run.dataset.instances = instances
+        model_run.results = results
+
+        model_run_json.get("dataset", {}).pop("instances", None)
+        model_run_json.pop("results", None)
+        model_run_json["num_instances"] = len(instances)
+        model_run_json["num_results"] = len(results)
+
+        logging.info(
+            f"Read metric job for model run {model_run.id} with {len(instances)} "
+            f"instances in {time.perf_counter() - start:.2f}s."
+        )
+        return cls(
+            metrics_type=summary.get("metrics_type", "summarization"),
+            metrics=summary.get("metrics"),
+            model_run=model_run,
+            summary=summary,
+            shard=summary.get("shard"),
+        )
+
+    def content_hash(self) -> str:
+        """Canonical hash of the job, the same for duplicates of its content.
+
+        Instance inputs are left out: they are dropped while parsing, and
+        metrics never depend on them.
+        """
+        return content_hash(
+            self.summary,
+            [instance.to_json() for instance in self.model_run.dataset.instances],
+            [result.to_json() for result in self.model_run.results],
+        )
+
+
+def _read_summary(stream: BinaryIO) -> dict:
+    """Build the job JSON, leaving instance and model output arrays empty."""
+    builder = ijson.ObjectBuilder()
+    skipped = (f"{INSTANCES_PREFIX}.item", f"{RESULTS_PREFIX}.item")
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if prefix.startswith(skipped):
+            continue
+        builder.event(event, value)
+    return builder.value
+
+
+def _iter_instances(stream: BinaryIO) -> Iterator[Instance]:
+    for item in ijson.items(stream, f"{INSTANCES_PREFIX}.item", use_float=True):
+        # Metrics only use references, so inputs are never deserialized
+        item["input"] = {"content": []}
+        yield Instance.from_json(item)
+
+
+def _iter_results(stream: BinaryIO) -> Iterator[ModelOutput]:
+    for item in ijson.items(stream, f"{RESULTS_PREFIX}.item", use_float=True):
+        yield ModelOutput.from_json(item)
+
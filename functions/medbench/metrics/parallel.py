@@ -0,0 +1,180 @@
+import logging
+import math
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Type
+
+import attrs
+
+from medbench.config import settings
+from medbench.datasets import Data
+
+from .base import Metric
+from .pool import metric_pool
+
+
+def _init_worker(metrics: tuple[Type[Metric], ...]) -> None:
+    """Set up and warm up the metrics once per worker process."""
+    metric_pool.warm_up(metrics)
+
+
+def _calculate_shard(
+    metrics: tuple[Type[Metric], ...],
+    ground_truths: list[list[Data]],
+    predictions: list[Data],
+    batched: bool,
+) -> list[list[float | dict[str, float] | str]]:
+    """Score a shard of evaluation pairs with each metric, in a worker process."""
+    scores = []
+    for metric_cls in metrics:
+        # Set up by the initializer, or on first use if the pool was started
+        # for other metrics
+        metric = metric_pool.get(metric_cls)
+        if batched:
+            scores.append(metric.calculate_batch(ground_truths, predictions))
+        else:
+            scores.append(
+                [
+                    metric.calculate(instance_ground_truths, prediction)
+                    for instance_ground_truths, prediction in zip(
+                        ground_truths, predictions
+                    )
+                ]
+            )
+    return scores
+
+
+@attrs.define
+class MetricProcessPool:
+    """Process pool computing CPU-bound metrics in parallel.
+
+    METEOR, sacreBLEU and ROUGE stemming are pure Python, so they only use a
+    single core of the worker. The pool shards the evaluation pairs of a model
+    run across worker processes, each of which sets the metrics up once and
+    keeps them warm in its own `metric_pool` for the following jobs.
+
+    Workers are spawned rather than forked, so they do not inherit the threads,
+    models and torch state of the Functions worker.
+
+    Attributes:
+        num_workers (int): Number of worker processes. If 1 or less, metrics
+            are computed in the calling process.
+        shards_per_worker (int): Number of shards per worker. More shards
+            balance uneven text lengths better, at a small dispatch cost.
+    """
+
+    num_workers: int = 1
+    shards_per_worker: int = 4
+
+    _executor: Optional[ProcessPoolExecutor] = attrs.field(init=False, default=None)
+    _lock: threading.Lock = attrs.field(init=False, factory=threading.Lock)
+
+    @property
+    def enabled(self) -> bool:
+        return self.num_workers > 1
+
+    def calculate(
+        self,
+        metrics: dict[str, Type[Metric]],
+        ground_truths: list[list[Data]],
+        predictions: list[Data],
+        batched: bool = True,
+    ) -> dict[str, list[float | dict[str, float] | str]]:
+        """Score evaluation pairs with each metric, across worker processes.
+
+        Args:
+            metrics: Metric classes keyed by name.
+            ground_truths: Ground truths of each evaluation pair.
+            predictions: Prediction of each evaluation pair.
+            batched: Whether workers score their shard with `calculate_batch`,
+                or with one `calculate` call per pair.
+
+        Returns:
+            The scores of each metric, keyed by name, in the order of the pairs.
+        """
+        if len(ground_truths) != len(predictions):
+            raise ValueError(
+                f"Got {len(ground_truths)} ground truths for "
+                f"{len(predictions)} predictions."
+            )
+        metric_classes = tuple(metrics.values())
+        if not self.enabled or not metrics or not predictions:
+            scores = _calculate_shard(
+                metric_classes, ground_truths, predictions, batched
+            )
+            return dict(zip(metrics, scores))
+
+        shard_size = math.ceil(
+            len(predictions) / (self.num_workers * self.shards_per_worker)
+        )
+        starts = range(0, len(predictions), shard_size)
+
+        start = time.perf_counter()
+        try:
+            # `map` returns shards in submission order, whichever finishes first
+            shard_scores = list(
+                self._get_executor(metric_classes).map(
+                    _calculate_shard,
+                    [metric_classes] * len(starts),
+                    [ground_truths[i : i + shard_size] for i in starts],
+                    [predictions[i : i + shard_size] for i in starts],
+                    [batched] * len(starts),
+                )
+            )
+        except BrokenProcessPool as e:
+            # A worker died, e.g. killed when running out of memory
+            logging.error(
+                f"Metric process pool is broken: {e}. "
+                "Computing metrics in the calling process."
+            )
+            self.shutdown()
+            scores = _calculate_shard(
+                metric_classes, ground_truths, predictions, batched
+            )
+            return dict(zip(metrics, scores))
+
+        logging.info(
+            f"Computed {', '.join(metrics)} for {len(predictions)} pairs in "
+            f"{len(starts)} shards across {self.num_workers} processes in "
+            f"{time.perf_counter() - start:.2f}s."
+        )
+        return {
+            name: [score for shard in shard_scores for score in shard[i]]
+            for i, name in enumerate(metrics)
+        }
+
+    def shutdown(self) -> None:
+        """Stop the worker processes. They are restarted on the next call."""
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+                self._executor = None
+
+    def _get_executor(self, metrics: tuple[Type[Metric], ...]) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.num_workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_worker,
+                    initargs=(metrics,),
+                )
+                logging.info(
+                    f"Started metric process pool with {self.num_workers} processes."
+                )
+            return self._executor
+
+
+def _available_cores() -> int:
+    if hasattr(os, "sched_getaffinity"):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+metric_process_pool = MetricProcessPool(
+    num_workers=settings.metrics_num_workers or _available_cores()
+)
@@ -0,0 +1,125 @@
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Iterable, Type
+
+import attrs
+
+from medbench.config import settings
+
+from .base import Metric, MetricRegistry
+
+
+@attrs.define
+class MetricPool:
+    """Process-wide pool of set up metrics.
+
+    Setting up a metric loads `evaluate` modules, tokenizers and models, which
+    can take several seconds. The pool sets each metric up on first use and
+    keeps it warm, so following jobs on the same worker reuse it.
+
+    Warm metrics are kept within a memory budget, estimated from each metric's
+    `memory_footprint_mb`. When the budget is exceeded, the least recently used
+    metrics are evicted.
+
+    Attributes:
+        memory_budget_mb (int): Memory budget for warm metrics, in MB.
+    """
+
+    memory_budget_mb: int = 4096
+
+    _metrics: "OrderedDict[Type[Metric], Metric]" = attrs.field(
+        init=False, factory=OrderedDict
+    )
+    _lock: threading.RLock = attrs.field(init=False, factory=threading.RLock)
+
+    @property
+    def memory_usage_mb(self) -> int:
+        """Estimated memory taken by the warm metrics, in MB."""
+        return sum(metric.memory_footprint_mb for metric in self._metrics)
+
+    def get(self, metric: str | Type[Metric]) -> Metric:
+        """Get a set up metric, setting it up on first use.
+
+        Args:
+            metric: Metric class, or the name it was registered with
+                in the `MetricRegistry`.
+        """
+        metric_cls = self._resolve(metric)
+        with self._lock:
+            if metric_cls in self._metrics:
+                self._metrics.move_to_end(metric_cls)
+                return self._metrics[metric_cls]
+
+            start = time.perf_counter()
+            instance = metric_cls.setup()
+            logging.info(
+                f"Set up {metric_cls.__name__} in "
+                f"{time.perf_counter() - start:.2f}s."
+            )
+
+            self._metrics[metric_cls] = instance
+            self._evict_to_budget(keep=metric_cls)
+            return instance
+
+    def warm_up(self, metrics: Iterable[str | Type[Metric]]) -> None:
+        """Set up and warm up metrics ahead of the first job.
+
+        Failures are logged and skipped, so a faulty metric does not prevent
+        the remaining ones from warming up.
+        """
+        for metric in metrics:
+            try:
+                start = time.perf_counter()
+                instance = self.get(metric)
+                instance.warm_up()
+                logging.info(
+                    f"Warmed up {type(instance).__name__} in "
+                    f"{time.perf_counter() - start:.2f}s."
+                )
+            except Exception as e:
+                logging.error(f"Error warming up metric {metric}: {e}")
+
+    def evict(self, metric: str | Type[Metric]) -> None:
+        """Evict a metric from the pool, if present."""
+        metric_cls = self._resolve(metric)
+        with self._lock:
+            self._metrics.pop(metric_cls, None)
+
+    def clear(self) -> None:
+        """Evict all metrics from the pool."""
+        with self._lock:
+            self._metrics.clear()
+
+    def stats(self) -> dict:
+        """Summary of the pool state."""
+        with self._lock:
+            return {
+                "metrics": [metric_cls.__name__ for metric_cls in self._metrics],
+                "memory_usage_mb": self.memory_usage_mb,
+                "memory_budget_mb": self.memory_budget_mb,
+            }
+
+    def _resolve(self, metric: str | Type[Metric]) -> Type[Metric]:
+        if isinstance(metric, str):
+            return MetricRegistry.get(metric.strip())
+        return metric
+
+    def _evict_to_budget(self, keep: Type[Metric]) -> None:
+        while self.memory_usage_mb > self.memory_budget_mb:
+            lru_cls = next(iter(self._metrics))
+            if lru_cls is keep:
+                logging.warning(
+                    f"{keep.__name__} alone exceeds the metric pool memory "
+                    f"budget of {self.memory_budget_mb}MB."
+                )
+                return
+            del self._metrics[lru_cls]
+            logging.info(
+                f"Evicted {lru_cls.__name__} from the metric pool "
+                f"to stay within {self.memory_budget_mb}MB."
+            )
+
+
+metric_pool = MetricPool(memory_budget_mb=settings.metrics_pool_memory_budget_mb)
@@ -0,0 +1,64 @@
+import gzip
+import hashlib
+import logging
+import time
+
+import orjson
+
+
+def dump_results(data: dict, compact: bool = True) -> bytes:
+    """Serialize metric results to JSON bytes.
+
+    Uses orjson, which is several times faster than `json` and writes bytes
+    directly, so results are never held as a string too. NaN scores are
+    written as null, keeping the output valid JSON for the backend.
+
+    Args:
+        data: Results to serialize.
+        compact: If False, the JSON is indented for readability.
+    """
+    option = orjson.OPT_SERIALIZE_NUMPY
+    if not compact:
+        option |= orjson.OPT_INDENT_2
+    return orjson.dumps(data, option=option)
+
+
+def input_reference(name: str, data: bytes) -> dict:
+    """Reference to the job a result was computed from, instead of its copy."""
+    return {
+        "blob": name,
+        "sha256": hashlib.sha256(data).hexdigest(),
+        "size": len(data),
+    }
+
+
+def upload_results(
+    connection_string: str,
+    container: str,
+    name: str,
+    data: bytes,
+    compress: bool = False,
+    content_type: str = "application/json",
+) -> None:
+    """Upload results to a blob, for results not written by an output binding.
+
+    If `compress` is set, results are compressed with gzip content encoding.
+    Clients honoring `Content-Encoding` (e.g. browsers, `curl --compressed`)
+    decompress the blob transparently, while others read the gzip bytes.
+    """
+    from azure.storage.blob import BlobClient, ContentSettings
+
+    start = time.perf_counter()
+    content_settings = ContentSettings(content_type=content_type)
+    body = data
+    if compress:
+        body = gzip.compress(data, compresslevel=6)
+        content_settings.content_encoding = "gzip"
+    BlobClient.from_connection_string(
+        connection_string, container_name=container, blob_name=name
+    ).upload_blob(body, overwrite=True, content_settings=content_settings)
+    logging.info(
+        f"Uploaded {container}/{name} ({len(data) / 2**20:.1f}MB"
+        + (f", {len(body) / 2**20:.1f}MB compressed" if compress else "")
+        + f") in {time.perf_counter() - start:.2f}s."
+    )
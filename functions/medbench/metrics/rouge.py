@@ -0,0 +1,107 @@
+import re
+from collections import Counter
+from functools import lru_cache
+from typing import Callable
+
+import attrs
+from rouge_score import rouge_scorer, tokenizers
+
+ROUGE_TYPES = ("rouge1", "rouge2", "rougeL", "rougeLsum")
+
+
+@attrs.define
+class RougeScorer:
+    """Multi-variant ROUGE scorer with memoized tokenization.
+
+    Equivalent to `rouge_score.rouge_scorer.RougeScorer.score_multi`, the scorer
+    used by `evaluate`'s rouge module, but all ROUGE variants are computed from
+    a single tokenization of each text. Tokens (and their n-grams) are memoized
+    per text, so references shared by many predictions are only tokenized and
+    stemmed once.
+
+    Attributes:
+        rouge_types (tuple of str): ROUGE variants to compute.
+            Supports `rougeN`, `rougeL` and `rougeLsum`.
+        use_stemmer (bool): Whether to Porter stem tokens.
+        cache_size (int): Maximum number of texts to keep tokenized, in each
+            of the token, sentence and n-gram caches. A 200 token text takes
+            about 50KB across them, so the default holds about 200MB.
+    """
+
+    rouge_types: tuple[str, ...] = ROUGE_TYPES
+    use_stemmer: bool = True
+    cache_size: int = 4096
+
+    _tokenizer: tokenizers.Tokenizer = attrs.field(init=False)
+    _tokens: Callable[[str], tuple[str, ...]] = attrs.field(init=False)
+    _sentence_tokens: Callable[[str], tuple[tuple[str, ...], ...]] = attrs.field(
+        init=False
+    )
+    _ngrams: Callable[[str, int], Counter] = attrs.field(init=False)
+
+    def __attrs_post_init__(self):
+        for rouge_type in self.rouge_types:
+            if rouge_type not in ("rougeL", "rougeLsum") and not re.match(
+                r"rouge[1-9]$", rouge_type
+            ):
+                raise ValueError(f"Invalid rouge type: {rouge_type}")
+
+        self._tokenizer = tokenizers.DefaultTokenizer(use_stemmer=self.use_stemmer)
+        # Memoized per scorer, so the caches are released along with it.
+        self._tokens = lru_cache(maxsize=self.cache_size)(self._tokenize)
+        self._sentence_tokens = lru_cache(maxsize=self.cache_size)(
+            self._tokenize_sentences
+        )
+        self._ngrams = lru_cache(maxsize=self.cache_size)(self._create_ngrams)
+
+    def score(self, references: list[str], prediction: str) -> dict[str, float]:
+        """Score a prediction against one or more references.
+
+        For each ROUGE variant, the F-measure of the best matching reference
+        is returned.
+        """
+        best: dict[str, float] = {}
+        for reference in references:
+            for rouge_type, score in self._score(reference, prediction).items():
+                # Keep the first reference on ties, as `score_multi` does.
+                if rouge_type not in best or score.fmeasure > best[rouge_type]:
+                    best[rouge_type] = score.fmeasure
+        return best
+
+    def cache_info(self) -> dict[str, int]:
+        """Hit and miss counters of the token memoization."""
+        info = self._tokens.cache_info()
+        return {"hits": info.hits, "misses": info.misses, "size": info.currsize}
+
+    def _score(
+        self, reference: str, prediction: str
+    ) -> dict[str, rouge_scorer.scoring.Score]:
+        result = {}
+        for rouge_type in self.rouge_types:
+            if rouge_type == "rougeL":
+                result[rouge_type] = rouge_scorer._score_lcs(
+                    self._tokens(reference), self._tokens(prediction)
+                )
+            elif rouge_type == "rougeLsum":
+                result[rouge_type] = rouge_scorer._summary_level_lcs(
+                    self._sentence_tokens(reference),
+                    self._sentence_tokens(prediction),
+                )
+            else:
+                n = int(rouge_type[5:])
+                result[rouge_type] = rouge_scorer._score_ngrams(
+                    self._ngrams(reference, n), self._ngrams(prediction, n)
+                )
+        return result
+
+    def _tokenize(self, text: str) -> tuple[str, ...]:
+        return tuple(self._tokenizer.tokenize(text))
+
+    def _tokenize_sentences(self, text: str) -> tuple[tuple[str, ...], ...]:
+        # Sentences are assumed to be separated by newlines, as in `rouge_score`.
+        return tuple(
+            self._tokens(sentence) for sentence in text.split("\n") if sentence
+        )
+
+    def _create_ngrams(self, text: str, n: int) -> Counter:
+        return rouge_scorer._create_ngrams(self._tokens(text), n)
@@ -0,0 +1,135 @@
+import copy
+import math
+from typing import Optional
+
+import orjson
+
+from .base import aggregate_results
+from .jobs import MetricJob
+
+# Containers of the shard jobs, and of their results until they are merged
+SHARDS_CONTAINER = "metricshards"
+SHARD_RESULTS_CONTAINER = "metricshardresults"
+
+# Metric types whose aggregated metrics only depend on instance-level metrics,
+# so they can be recomputed when merging shards. Exact match also reports a
+# run-level macro F1 over answers, which shards cannot be merged into.
+SHARDABLE_METRICS_TYPES = ("summarization", "image_quality")
+
+
+def should_shard(job: MetricJob, shard_size: int) -> bool:
+    """Whether a job is large enough to be split into shards."""
+    return (
+        bool(shard_size)
+        and job.shard is None
+        and job.metrics_type in SHARDABLE_METRICS_TYPES
+        and len(job.model_run.dataset.instances) > shard_size
+    )
+
+
+def split_job(
+    job: MetricJob,
+    name: str,
+    shard_size: int,
+    input: Optional[dict] = None,
+    content_hash: Optional[str] = None,
+) -> list[tuple[str, bytes]]:
+    """Split a job into shard jobs of consecutive instances.
+
+    Args:
+        job: Job to split.
+        name: Name of the job blob, without its container.
+        shard_size: Maximum number of instances per shard.
+        input: Reference to the job blob, echoed in the merged results.
+        content_hash: Deduplication key of the job, to store the merged
+            results under (see `medbench.dedup`). Also keys the shard results
+            of the job, or else its content hash is.
+
+    Returns:
+        The blob name and JSON content of each shard job, to upload to the
+        `SHARDS_CONTAINER`.
+    """
+    instances = job.model_run.dataset.instances
+    results = job.model_run.results
+    count = math.ceil(len(instances) / shard_size)
+    results_key = (content_hash or job.content_hash())[:16]
+
+    shards = []
+    for index in range(count):
+        start, stop = index * shard_size, min((index + 1) * shard_size, len(instances))
+        shard_job = copy.deepcopy(job.summary)
+        model_run = shard_job["model_run"]
+        model_run.pop("num_instances", None)
+        model_run.pop("num_results", None)
+        model_run["dataset"]["instances"] = [
+            instance.to_json() for instance in instances[start:stop]
+        ]
+        model_run["results"] = [result.to_json() for result in results[start:stop]]
+        shard_job["shard"] = {
+            "job": name,
+            "index": index,
+            "count": count,
+            "start": start,
+            "stop": stop,
+            "input": input,
+            "original_run": job.summary,
+            "content_hash": content_hash,
+            "results_key": results_key,
+        }
+        shards.append((shard_blob_name(name, index, count), orjson.dumps(shard_job)))
+
+    return shards
+
+
+def shard_blob_name(job: str, index: int, count: int) -> str:
+    return f"{job}/shard-{index:05d}-of-{count:05d}.json"
+
+
+def shard_results_prefix(shard: dict) -> str:
+    """Prefix of the results of the shards of a job in `SHARD_RESULTS_CONTAINER`.
+
+    The prefix is unique to the content of the job and its number of shards,
+    so results of earlier uploads of a job under the same name are never
+    merged with the new ones.
+    """
+    return f"{shard['job']}/{shard['results_key']}-of-{shard['count']:05d}/"
+
+
+def shard_result_blob_name(shard: dict) -> str:
+    return f"{shard_results_prefix(shard)}shard-{shard['index']:05d}-results.json"
+
+
+def merge_shard_results(shard_results: list[dict]) -> dict:
+    """Merge the metrics results of all the shards of a job.
+
+    Instance-level metrics are concatenated in instance order, and aggregated
+    metrics are recomputed over all of them.
+
+    Raises:
+        ValueError: If a shard is missing, or failed.
+    """
+    shard_results = sorted(shard_results, key=lambda result: result["shard"]["index"])
+    count = shard_results[0]["shard"]["count"] if shard_results else 0
+    if [result["shard"]["index"] for result in shard_results] != list(range(count)):
+        raise ValueError(
+            f"Expected {count} shard results, got shards "
+            f"{[result['shard']['index'] for result in shard_results]}."
+        )
+
+    errors = [
+        f"Shard {result['shard']['index']}: {result['error']}"
+        for result in shard_results
+        if "error" in result
+    ]
+    if errors:
+        raise ValueError("\n".join(errors))
+
+    instance_level_metrics = [
+        instance_metrics
+        for result in shard_results
+        for instance_metrics in result["metrics_results"]["instance_level_metrics"]
+    ]
+    return {
+        **aggregate_results(instance_level_metrics),
+        "instance_level_metrics": instance_level_metrics,
+    }
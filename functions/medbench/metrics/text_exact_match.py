@@ -1,71 +1,186 @@
+import string
+from collections import Counter
+from functools import lru_cache
+from typing import ClassVar
+
 import attrs
-import evaluate
 
 from medbench.datasets import Data
 from medbench.models import ModelRun
 
-from .base import Metric, get_evaluation_pairs, aggregate_metrics
+from .base import (
+    Metric,
+    MetricRegistry,
+    add_metric_score,
+    aggregate_results,
+    get_evaluation_pairs,
+)
+from .pool import metric_pool
+
+# Precompiled translation tables, applied after lowercasing.
+# Exact match ignores case, punctuation and all whitespace, as `evaluate`'s
+# exact_match with ignore_case, ignore_punctuation and ignore_whitespace.
+_EXACT_MATCH_TABLE = str.maketrans("", "", string.punctuation + string.whitespace)
+# Token F1 ignores case and punctuation, and splits tokens on whitespace.
+_TOKEN_TABLE = str.maketrans("", "", string.punctuation)
 
 
 def calculate_exact_match_metrics(model_run: ModelRun) -> list[dict[str, float]]:
-    """Calculate exact match metrics for a model run."""
-    exact_match = ExactMatchMetric.setup()
+    """Calculate exact match metrics for a model run.
+
+    Besides the mean of the instance-level metrics, the aggregated metrics
+    include the run-level accuracy and macro F1 over the answers.
+    """
+    exact_match = metric_pool.get(ExactMatchMetric)
+
+    evaluation_pairs = list(get_evaluation_pairs(model_run))
+    ground_truths = [pair[0] for pair in evaluation_pairs]
+    predictions = [pair[1] for pair in evaluation_pairs]
 
-    instance_level_metrics = []
-    for ground_truths, prediction in get_evaluation_pairs(model_run):
-        instance_level_metrics.append(
-            {
-                "exact_match": exact_match.calculate(ground_truths, prediction),
-            }
-        )
+    instance_level_metrics = [{} for _ in evaluation_pairs]
+    for instance_metrics, score in zip(
+        instance_level_metrics, exact_match.calculate_batch(ground_truths, predictions)
+    ):
+        add_metric_score(instance_metrics, "exact_match", score)
 
     metrics = {
-        "aggregated_metrics": aggregate_metrics(instance_level_metrics),
+        **aggregate_results(instance_level_metrics),
         "instance_level_metrics": instance_level_metrics,
     }
-
-    # TODO: F1 and Accuracy are aggregated metrics,
-    # so they must be calculated for the entire model run.
-    # "f1": calculate_f1(ground_truths, prediction),
-    # "accuracy": calculate_accuracy(ground_truths, prediction),
+    metrics["aggregated_metrics"].update(
+        exact_match.calculate_run(ground_truths, predictions)
+    )
 
     return metrics
 
 
+@MetricRegistry.register("exact_match")
 @attrs.define
 class ExactMatchMetric(Metric):
-    metric: evaluate.EvaluationModule
+    """Exact match and token F1 of predictions against their ground truths.
+
+    Exact match scores match `evaluate`'s exact_match module ignoring case,
+    punctuation and whitespace, but texts are normalized with precompiled
+    translation tables, and only once per unique text of a batch.
+
+    Returns a dictionary with the "exact_match" (either 1 or 0) and the
+    "token_f1" of the best matching ground truth.
+    """
+
+    memory_footprint_mb: ClassVar[int] = 1
 
     @classmethod
     def setup(cls) -> "ExactMatchMetric":
-        metric = evaluate.load("exact_match")
-        return cls(metric=metric)
-
-    def _calculate(self, ground_truths: list[Data], prediction: Data) -> float:
-        """Calculate exact match metric for a model run."""
-        results = [
-            self.metric.compute(
-                predictions=[prediction.get_text()],
-                references=[
-                    gt.get_text(),
-                ],
-                ignore_whitespace=True,
-                ignore_case=True,
-                ignore_punctuation=True,
-            )["exact_match"]
-            for gt in ground_truths
+        return cls()
+
+    def _calculate(
+        self, ground_truths: list[Data], prediction: Data
+    ) -> dict[str, float]:
+        return self._calculate_batch([ground_truths], [prediction])[0]
+
+    def _calculate_batch(
+        self, ground_truths: list[list[Data]], predictions: list[Data]
+    ) -> list[dict[str, float]]:
+        normalized = _normalize_all(ground_truths, predictions)
+
+        scores = []
+        for gts, prediction in zip(ground_truths, predictions):
+            exact_prediction, prediction_tokens = normalized[prediction.get_text()]
+            references = [normalized[gt.get_text()] for gt in gts]
+            scores.append(
+                {
+                    "exact_match": float(
+                        any(exact == exact_prediction for exact, _ in references)
+                    ),
+                    "token_f1": max(
+                        (
+                            token_f1(prediction_tokens, tokens)
+                            for _, tokens in references
+                        ),
+                        default=0.0,
+                    ),
+                }
+            )
+        return scores
+
+    def calculate_run(
+        self, ground_truths: list[list[Data]], predictions: list[Data]
+    ) -> dict[str, float]:
+        """Run-level accuracy and macro F1 over the normalized answers.
+
+        Each answer is a class. A prediction matching any of its ground truths
+        counts as a true positive of that answer, otherwise as a false positive
+        of the predicted answer and a false negative of the first ground truth.
+        """
+        normalized = _normalize_all(ground_truths, predictions)
+
+        true_positives = Counter()
+        false_positives = Counter()
+        false_negatives = Counter()
+        for gts, prediction in zip(ground_truths, predictions):
+            predicted, _ = normalized[prediction.get_text()]
+            expected = [normalized[gt.get_text()][0] for gt in gts]
+            if predicted in expected:
+                true_positives[predicted] += 1
+                continue
+            false_positives[predicted] += 1
+            if expected:
+                false_negatives[expected[0]] += 1
+
+        answers = set(true_positives) | set(false_negatives)
+        f1_scores = [
+            2
+            * true_positives[answer]
+            / (
+                2 * true_positives[answer]
+                + false_positives[answer]
+                + false_negatives[answer]
+            )
+            for answer in answers
         ]
+        return {
+            "accuracy": (
+                sum(true_positives.values()) / len(predictions) if predictions else 0.0
+            ),
+            "f1": sum(f1_scores) / len(f1_scores) if f1_scores else 0.0,
+        }
+
+
+def normalize_exact_match(text: str) -> str:
+    """Normalize a text for exact match, ignoring case, punctuation and spaces."""
+    return text.lower().translate(_EXACT_MATCH_TABLE)
+
+
+def normalize_tokens(text: str) -> tuple[str, ...]:
+    """Split a text into tokens for token F1, ignoring case and punctuation."""
+    return tuple(text.lower().translate(_TOKEN_TABLE).split())
+
+
+def token_f1(prediction: tuple[str, ...], reference: tuple[str, ...]) -> float:
+    """F1 of the tokens shared by a prediction and a reference, as in SQuAD."""
+    if not prediction or not reference:
+        # Two empty answers match
+        return float(prediction == reference)
 
-        # Either 1 or 0
-        return max(results)
+    common = sum((Counter(prediction) & Counter(reference)).values())
+    if common == 0:
+        return 0.0
+    precision = common / len(prediction)
+    recall = common / len(reference)
+    return 2 * precision * recall / (precision + recall)
 
 
-# def calculate_f1(ground_truths: list[Data], prediction: Data) -> float:
-#     """Calculate F1 metric for a model run."""
-#     # Placeholder implementation
-#     return 0.0
+def _normalize_all(
+    ground_truths: list[list[Data]], predictions: list[Data]
+) -> dict[str, tuple[str, tuple[str, ...]]]:
+    """Normalize each unique text of a batch, for both exact match and token F1."""
+    texts = {prediction.get_text() for prediction in predictions}
+    texts.update(gt.get_text() for gts in ground_truths for gt in gts)
+    return {text: _normalize(text) for text in texts}
 
 
-# def calculate_accuracy(ground_truths: list[Data], prediction: Data) -> float:
-#     """Calculate accuracy metric for a model run."""
-#     return 0.0
\ No newline at end of file
+@lru_cache(maxsize=65536)
+def _normalize(text: str) -> tuple[str, tuple[str, ...]]:
+    # Memoized, so answer options shared by many instances, and texts scored
+    # both per instance and per run, are only normalized once.
+    return normalize_exact_match(text), normalize_tokens(text)
@@ -1,58 +1,187 @@
 from abc import ABC
+from functools import partial
+from typing import TYPE_CHECKING, ClassVar, Optional, Type
 
 import attrs
-import evaluate
-from evaluate import EvaluationModule
 
+from medbench.config import settings
 from medbench.datasets import Data
 from medbench.models import ModelRun
 
-from .base import Metric, get_evaluation_pairs, aggregate_metrics
-
-
-def calculate_summarization_metrics(model_run: ModelRun) -> list[dict[str, float]]:
-    """Calculate summarization metrics for a model run."""
-    rouge1 = Rouge1Metric.setup()
-    rouge2 = Rouge2Metric.setup()
-    rougeL = RougeLMetric.setup()
-    bleu = BleuMetric.setup()
-    meteor = MeteorMetric.setup()
-    bert_score = BertScoreMetric.setup()
-
-    instance_level_metrics = []
-    for ground_truths, prediction in get_evaluation_pairs(model_run):
-        instance_level_metrics.append(
-            {
-                "rouge1": rouge1.calculate(ground_truths, prediction),
-                "rouge2": rouge2.calculate(ground_truths, prediction),
-                "rougeL": rougeL.calculate(ground_truths, prediction),
-                "bleu": bleu.calculate(ground_truths, prediction),
-                "meteor": meteor.calculate(ground_truths, prediction),
-                "bert_score": bert_score.calculate(ground_truths, prediction),
-            }
-        )
+from .bertscore import BertScoreEngine, EmbeddingCache
+from .cache import metric_result_cache
+from .base import (
+    Metric,
+    MetricRegistry,
+    add_metric_score,
+    aggregate_results,
+    get_evaluation_pairs,
+)
+from .parallel import metric_process_pool
+from .pool import metric_pool
+
+if TYPE_CHECKING:
+    # Imported on setup, so jobs not using these metrics never load them
+    from evaluate import EvaluationModule
+
+    from .rouge import RougeScorer
+
+# Metrics computed when a job does not name the metrics it wants
+SUMMARIZATION_METRICS = ("rouge", "bleu", "meteor", "bert_score")
+
+
+def calculate_summarization_metrics(
+    model_run: ModelRun,
+    batched: bool = True,
+    metrics: Optional[list[str]] = None,
+) -> list[dict[str, float]]:
+    """Calculate summarization metrics for a model run.
+
+    Scores already computed for the same pairs are reused from the
+    `metric_result_cache`. CPU-bound metrics are computed across the
+    `metric_process_pool` when it is enabled (`METRICS_NUM_WORKERS`), the
+    others in the calling process.
+
+    Args:
+        model_run (ModelRun): Model run with the predictions to score.
+        batched (bool): If True, each metric scores the whole run (or each
+            shard of it) in a single call, instead of paying the `evaluate`
+            per-call overhead once per instance.
+        metrics (list of str): Names of the metrics to compute, as registered
+            in the `MetricRegistry`. Only these metrics are set up, so models
+            and corpora of the others are never loaded.
+            Defaults to `SUMMARIZATION_METRICS`.
+    """
+    # "rouge" fans out to the rouge1, rouge2 and rougeL keys
+    summarization_metrics = {
+        name: MetricRegistry.get(name)
+        for name in (SUMMARIZATION_METRICS if metrics is None else metrics)
+    }
+
+    evaluation_pairs = list(get_evaluation_pairs(model_run))
+    ground_truths = [pair[0] for pair in evaluation_pairs]
+    predictions = [pair[1] for pair in evaluation_pairs]
+
+    scores = metric_result_cache.calculate(
+        summarization_metrics,
+        ground_truths,
+        predictions,
+        partial(_calculate_scores, batched=batched),
+    )
+
+    instance_level_metrics = [{} for _ in evaluation_pairs]
+    for name in summarization_metrics:
+        for instance_metrics, score in zip(instance_level_metrics, scores[name]):
+            add_metric_score(instance_metrics, name, score)
 
     metrics = {
-        "aggregated_metrics": aggregate_metrics(instance_level_metrics),
+        **aggregate_results(instance_level_metrics),
         "instance_level_metrics": instance_level_metrics,
     }
 
     return metrics
 
 
+def _calculate_scores(
+    metrics: dict[str, Type[Metric]],
+    ground_truths: list[list[Data]],
+    predictions: list[Data],
+    batched: bool = True,
+) -> dict[str, list[float | dict[str, float] | str]]:
+    """Score evaluation pairs with each metric, keyed by metric name."""
+    scores = metric_process_pool.calculate(
+        {
+            name: metric_cls
+            for name, metric_cls in metrics.items()
+            if metric_cls.cpu_bound and metric_process_pool.enabled
+        },
+        ground_truths,
+        predictions,
+        batched=batched,
+    )
+    for name, metric_cls in metrics.items():
+        if name in scores:
+            continue
+        metric = metric_pool.get(metric_cls)
+        if batched:
+            scores[name] = metric.calculate_batch(ground_truths, predictions)
+        else:
+            scores[name] = [
+                metric.calculate(instance_ground_truths, prediction)
+                for instance_ground_truths, prediction in zip(
+                    ground_truths, predictions
+                )
+            ]
+    return scores
+
+
 @attrs.define
 class RougeMetric(Metric, ABC):
-    metric: EvaluationModule
+    metric: "EvaluationModule"
     use_stemmer: bool = True
+    rouge_type: ClassVar[str]
+
+    cpu_bound: ClassVar[bool] = True
 
     @classmethod
     def setup(cls) -> "Rouge1Metric":
+        import evaluate
+
         rouge = evaluate.load("rouge")
         return cls(metric=rouge)
 
+    def _calculate_batch(
+        self, ground_truths: list[list[Data]], predictions: list[Data]
+    ) -> list[float]:
+        return self.metric.compute(
+            predictions=[prediction.get_text() for prediction in predictions],
+            references=[[gt.get_text() for gt in gts] for gts in ground_truths],
+            rouge_types=[self.rouge_type],
+            use_stemmer=self.use_stemmer,
+            use_aggregator=False,
+        )[self.rouge_type]
+
+
+@MetricRegistry.register("rouge")
+@attrs.define
+class MultiRougeMetric(Metric):
+    """ROUGE metric computing several variants in a single scorer pass.
+
+    Texts are tokenized and stemmed once for all variants, and tokens are
+    memoized across calls, so references shared by many predictions are only
+    tokenized once. Scores match `evaluate`'s rouge module.
+
+    Unlike single variant metrics, it returns a dictionary with the F-measure
+    of each variant, keyed by the variant name (e.g. "rouge1").
+    """
+
+    scorer: "RougeScorer"
+
+    # Memoized tokens and n-grams, bounded by the scorer cache size.
+    memory_footprint_mb: ClassVar[int] = 256
+    cpu_bound: ClassVar[bool] = True
+
+    @classmethod
+    def setup(
+        cls, rouge_types: tuple[str, ...] = ("rouge1", "rouge2", "rougeL")
+    ) -> "MultiRougeMetric":
+        from .rouge import RougeScorer
+
+        return cls(scorer=RougeScorer(rouge_types=rouge_types))
 
+    def _calculate(
+        self, ground_truths: list[Data], prediction: Data
+    ) -> dict[str, float]:
+        return self.scorer.score(
+            [gt.get_text() for gt in ground_truths], prediction.get_text()
+        )
+
+
+@MetricRegistry.register("rouge1")
 @attrs.define
 class Rouge1Metric(RougeMetric):
+    rouge_type: ClassVar[str] = "rouge1"
+
     def _calculate(self, ground_truths: list[Data], prediction: Data) -> float:
         return self.metric.compute(
             predictions=[prediction.get_text()],
@@ -62,8 +191,11 @@ class Rouge1Metric(RougeMetric):
         )["rouge1"]
 
 
+@MetricRegistry.register("rouge2")
 @attrs.define
 class Rouge2Metric(RougeMetric):
+    rouge_type: ClassVar[str] = "rouge2"
+
     def _calculate(self, ground_truths: list[Data], prediction: Data) -> float:
         return self.metric.compute(
             predictions=[prediction.get_text()],
@@ -73,8 +205,11 @@ class Rouge2Metric(RougeMetric):
         )["rouge2"]
 
 
+@MetricRegistry.register("rougeL")
 @attrs.define
 class RougeLMetric(RougeMetric):
+    rouge_type: ClassVar[str] = "rougeL"
+
     def _calculate(self, ground_truths: list[Data], prediction: Data) -> float:
         return self.metric.compute(
             predictions=[prediction.get_text()],
@@ -84,12 +219,17 @@ class RougeLMetric(RougeMetric):
         )["rougeL"]
 
 
+@MetricRegistry.register("bleu")
 @attrs.define
 class BleuMetric(Metric):
-    metric: EvaluationModule
+    metric: "EvaluationModule"
+
+    cpu_bound: ClassVar[bool] = True
 
     @classmethod
     def setup(cls) -> "BleuMetric":
+        import evaluate
+
         bleu = evaluate.load("sacrebleu")
         return cls(metric=bleu)
 
@@ -103,13 +243,36 @@ class BleuMetric(Metric):
             / 100
         )
 
+    def _calculate_batch(
+        self, ground_truths: list[list[Data]], predictions: list[Data]
+    ) -> list[float]:
+        # `evaluate`'s sacrebleu only reports a corpus-level score, so sentence
+        # scores are computed with the same sacrebleu settings it uses.
+        from sacrebleu.metrics import BLEU
+
+        bleu = BLEU(effective_order=True)
+        return [
+            bleu.sentence_score(
+                prediction.get_text(), [gt.get_text() for gt in gts]
+            ).score
+            / 100
+            for gts, prediction in zip(ground_truths, predictions)
+        ]
+
 
+@MetricRegistry.register("meteor")
 @attrs.define
 class MeteorMetric(Metric):
-    metric: EvaluationModule
+    metric: "EvaluationModule"
+
+    # WordNet is loaded into memory on first use.
+    memory_footprint_mb: ClassVar[int] = 256
+    cpu_bound: ClassVar[bool] = True
 
     @classmethod
     def setup(cls) -> "MeteorMetric":
+        import evaluate
+
         meteor = evaluate.load("meteor")
         return cls(metric=meteor)
 
@@ -119,21 +282,81 @@ class MeteorMetric(Metric):
             references=[gt.get_text() for gt in ground_truths],
         )["meteor"]
 
+    def warm_up(self) -> None:
+        self.metric.compute(predictions=["warm up"], references=["warm up"])
+
+    def _calculate_batch(
+        self, ground_truths: list[list[Data]], predictions: list[Data]
+    ) -> list[float]:
+        # `evaluate`'s meteor only reports the mean score, so instance scores
+        # are computed with NLTK directly, using the same default parameters.
+        from nltk import word_tokenize
+        from nltk.translate import meteor_score
 
+        return [
+            meteor_score.meteor_score(
+                [word_tokenize(gt.get_text()) for gt in gts],
+                word_tokenize(prediction.get_text()),
+            )
+            for gts, prediction in zip(ground_truths, predictions)
+        ]
+
+
+@MetricRegistry.register("bert_score")
 @attrs.define
 class BertScoreMetric(Metric):
-    metric: EvaluationModule
+    """BERTScore F1 metric.
+
+    Scores match `evaluate`'s bertscore module, but token embeddings are
+    cached by content hash across calls (see `BertScoreEngine`), so references
+    shared by several model runs are only encoded once.
+    """
+
+    engine: BertScoreEngine
     model_type: str = "bert-base-uncased"
 
+    memory_footprint_mb: ClassVar[int] = 1024
+
+    @classmethod
+    def cache_config(cls) -> dict:
+        # Cached scores are looked up before the metric is set up, so they are
+        # keyed by the model `setup` loads by default. Quantized embeddings
+        # give slightly different scores.
+        return {
+            "model_type": attrs.fields(cls).model_type.default,
+            "backend": settings.bertscore_backend,
+        }
+
     @classmethod
-    def setup(cls) -> "BertScoreMetric":
-        bertscore = evaluate.load("bertscore")
-        return cls(metric=bertscore)
+    def setup(cls, model_type: Optional[str] = None) -> "BertScoreMetric":
+        model_type = model_type or attrs.fields(cls).model_type.default
+        engine = BertScoreEngine(
+            model_type=model_type,
+            max_batch_tokens=settings.bertscore_max_batch_tokens,
+            num_threads=settings.bertscore_num_threads or None,
+            cache=EmbeddingCache(
+                cache_dir=settings.bertscore_cache_dir,
+                max_memory_mb=settings.bertscore_cache_memory_mb,
+                max_disk_mb=settings.bertscore_cache_disk_mb,
+            ),
+            cache_predictions=settings.bertscore_cache_predictions,
+            backend=settings.bertscore_backend,
+            onnx_model_dir=settings.bertscore_onnx_model_dir,
+        )
+        return cls(engine=engine.load(), model_type=model_type)
 
     def _calculate(self, ground_truths: list[Data], prediction: Data) -> float:
-        return self.metric.compute(
-            predictions=[prediction.get_text()],
-            references=[gt.get_text() for gt in ground_truths],
-            lang="en",
-            model_type=self.model_type,
-        )["f1"][0]
+        return self.engine.score(
+            [prediction.get_text()], [[gt.get_text() for gt in ground_truths]]
+        )[0]
+
+    def warm_up(self) -> None:
+        self.engine.embed(["warm up"], cache=False)
+
+    def _calculate_batch(
+        self, ground_truths: list[list[Data]], predictions: list[Data]
+    ) -> list[float]:
+        return self.engine.score(
+            [prediction.get_text() for prediction in predictions],
+            [[gt.get_text() for gt in gts] for gts in ground_truths],
+        )
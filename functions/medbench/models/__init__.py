@@ -1,13 +1,8 @@
 # flake8: noqa: F401
+from typing import TYPE_CHECKING
+
+from medbench.lazy import lazy_attributes
 
-from .aml import AzureMLModel, AzureMLRunner
-from .azureoai import (
-    AzureOpenAIRunner,
-    BaseOpenAIModel,
-    OpenAIChatModel,
-    OpenAIReasoningModel,
-)
-from .cxrreportgen import CXRReportGenModel, CXRReportGenRunner
 from .schema import (
     Model,
     ModelOutput,
@@ -16,3 +11,31 @@ from .schema import (
     Runner,
     SystemPromptModel,
 )
+
+# Model implementations import their clients (e.g. `openai`), so they are only
+# imported when used, or when their registered name is looked up
+__getattr__, __dir__ = lazy_attributes(
+    __name__,
+    {
+        "AzureMLModel": ".aml",
+        "AzureMLRunner": ".aml",
+        "AzureOpenAIRunner": ".azureoai",
+        "AzureOpenAIBatchRunner": ".batch",
+        "BaseOpenAIModel": ".azureoai",
+        "OpenAIChatModel": ".azureoai",
+        "OpenAIReasoningModel": ".azureoai",
+        "CXRReportGenModel": ".cxrreportgen",
+        "CXRReportGenRunner": ".cxrreportgen",
+    },
+)
+
+if TYPE_CHECKING:
+    from .aml import AzureMLModel, AzureMLRunner
+    from .azureoai import (
+        AzureOpenAIRunner,
+        BaseOpenAIModel,
+        OpenAIChatModel,
+        OpenAIReasoningModel,
+    )
+    from .batch import AzureOpenAIBatchRunner
+    from .cxrreportgen import CXRReportGenModel, CXRReportGenRunner
@@ -1,20 +1,67 @@
+import asyncio
 import logging
 import time
 from typing import Any, Dict, List, Optional
 
 import attrs
-from openai import AzureOpenAI, BadRequestError, RateLimitError
+from openai import (
+    APIConnectionError,
+    AsyncAzureOpenAI,
+    AzureOpenAI,
+    BadRequestError,
+    InternalServerError,
+    RateLimitError,
+)
+from openai.types.chat import ChatCompletion, ChatCompletionMessage
+from openai.types.chat.chat_completion import Choice
 
 from medbench.config import settings
 from medbench.datasets import CORRECT_TAG, Data, EMediaObjectType, Instance
 
+from .cache import ResponseCache, response_cache
+from .clients import openai_client_pool
+from .ratelimit import RateLimiter, estimate_tokens, rate_limiters
 from .schema import ModelOutput, ModelRegistry, ModelRun, Runner, SystemPromptModel
 
+# Errors retried after a backoff, the others failing the instance right away.
+# Clients do not retry themselves, so retries go through the rate limiter.
+RETRYABLE_ERRORS = (RateLimitError, APIConnectionError, InternalServerError)
+
 
 @attrs.define
 class AzureOpenAIRunner(Runner):
+    """Runner of Azure OpenAI chat models.
+
+    `run` completes instances one at a time. `arun` completes them
+    concurrently with the async client, up to `max_concurrency` requests in
+    flight, and is used by evaluators.
+
+    If the model streams, completions are assembled from the streamed deltas.
+    Outputs record the token usage and the latency of their completion,
+    i.e. the time to the first token when streaming, the total latency and
+    the tokens generated per second, to compare models on responsiveness.
+
+    Requests to a deployment go through a rate limiter shared by all the
+    runners of the worker process, which keeps them under the deployment
+    quota and honors `Retry-After`. If the response cache is enabled,
+    completions of requests made before are read from it.
+
+    Attributes:
+        max_retries (int): Attempts of each completion, when rate limited or
+            on connection and server errors. Clients do not retry, so with the
+            default backoff, the attempts span about a minute or more.
+        max_concurrency (int): Maximum number of requests in flight in `arun`.
+        use_cache (bool): Whether completions are read from and written to
+            the response cache, if it is enabled.
+    """
+
     _client: AzureOpenAI = attrs.field(init=False)
-    max_retries: int = 3
+    _rate_limiter: RateLimiter = attrs.field(init=False)
+    max_retries: int = 6
+    use_cache: bool = True
+    max_concurrency: int = attrs.field(
+        factory=lambda: settings.azure_openai_max_concurrency
+    )
 
     @property
     def model(self) -> "BaseOpenAIModel":
@@ -27,12 +74,14 @@ class AzureOpenAIRunner(Runner):
             self.model, BaseOpenAIModel
         ), "Unsuported `Model` class in ModelRun. Model must be an `BaseOpenAIModel` instance."
 
-        self._client = AzureOpenAI(
-            azure_endpoint=self.model.endpoint,
-            azure_deployment=self.model.name,
-            api_key=self.model.api_key,
+        # Clients are shared across runners, so their connections are reused
+        self._client = openai_client_pool.get(
+            endpoint=self.model.endpoint,
+            deployment=self.model.name,
             api_version=self.model.version,
+            api_key=self.model.api_key,
         )
+        self._rate_limiter = rate_limiters.get(self.model.endpoint, self.model.name)
 
     def run(self) -> None:
         if self._model_run is None:
@@ -43,6 +92,39 @@ class AzureOpenAIRunner(Runner):
             messages = self._build_chat_prompt(instance)
             self._model_run.results.append(self._chat(instance.id, messages))
 
+    async def arun(self) -> None:
+        """Run the model on all instances concurrently.
+
+        Results are appended in the order of the instances, as by `run`.
+        """
+        if self._model_run is None:
+            raise ValueError(
+                "`ModelRun` is not set. Please call `setup` before running this model."
+            )
+        # Async clients are bound to the running event loop, so they are got
+        # on it rather than in `setup`
+        client = openai_client_pool.get_async(
+            endpoint=self.model.endpoint,
+            deployment=self.model.name,
+            api_version=self.model.version,
+            api_key=self.model.api_key,
+        )
+        semaphore = asyncio.Semaphore(max(self.max_concurrency, 1))
+
+        async def complete(instance_id, messages):
+            async with semaphore:
+                return await self._achat(client, instance_id, messages)
+
+        prompts = [
+            (instance.id, self._build_chat_prompt(instance))
+            for instance in self._model_run.dataset.instances
+        ]
+        self._model_run.results.extend(
+            await asyncio.gather(
+                *(complete(instance_id, messages) for instance_id, messages in prompts)
+            )
+        )
+
     def build_system_input(self) -> str:
         return {
             "role": "system",
@@ -122,7 +204,146 @@ class AzureOpenAIRunner(Runner):
 
     def _chat(self, instance_id: str, messages: List[Dict[str, Any]]) -> ModelOutput:
         retries = self.max_retries
+        completions_create_kwargs = self._completions_create_kwargs(messages)
+        tokens = estimate_tokens(messages, self.model.max_tokens)
+        cache_key = self._cache_key(completions_create_kwargs)
+        cached = self._cached_output(instance_id, cache_key)
+        if cached is not None:
+            return cached
 
+        for attempt in range(retries):
+            # Wait for the deployment quota shared with concurrent runners
+            time.sleep(self._rate_limiter.reserve(tokens))
+            try:
+                # Latency is measured from the request, excluding rate limiting
+                started = time.perf_counter()
+                response = self._client.chat.completions.with_raw_response.create(
+                    **completions_create_kwargs
+                )
+                completion = self._parse_response(response)
+                first_token_at = None
+                if self.model.stream:
+                    stream = _ChatStream()
+                    for chunk in completion:
+                        stream.add(chunk)
+                    completion = stream.completion()
+                    first_token_at = stream.first_token_at
+                output = self._completed(
+                    instance_id, completion, tokens, started, first_token_at
+                )
+                self._cache_output(cache_key, output)
+                return output
+            except RETRYABLE_ERRORS as e:
+                logging.debug(f"Failed to complete instance {instance_id}. Error: {e}")
+
+                if attempt < retries - 1:
+                    time.sleep(self._backoff(attempt, e))
+                else:
+                    return self._error_output(instance_id, e)
+            except Exception as e:
+                return self._failed_output(instance_id, e)
+
+    async def _achat(
+        self,
+        client: AsyncAzureOpenAI,
+        instance_id: str,
+        messages: List[Dict[str, Any]],
+    ) -> ModelOutput:
+        """Async `_chat`, waiting without blocking the event loop."""
+        retries = self.max_retries
+        completions_create_kwargs = self._completions_create_kwargs(messages)
+        tokens = estimate_tokens(messages, self.model.max_tokens)
+        cache_key = self._cache_key(completions_create_kwargs)
+        cached = self._cached_output(instance_id, cache_key)
+        if cached is not None:
+            return cached
+
+        for attempt in range(retries):
+            await asyncio.sleep(self._rate_limiter.reserve(tokens))
+            try:
+                started = time.perf_counter()
+                response = await client.chat.completions.with_raw_response.create(
+                    **completions_create_kwargs
+                )
+                completion = self._parse_response(response)
+                first_token_at = None
+                if self.model.stream:
+                    stream = _ChatStream()
+                    async for chunk in completion:
+                        stream.add(chunk)
+                    completion = stream.completion()
+                    first_token_at = stream.first_token_at
+                output = self._completed(
+                    instance_id, completion, tokens, started, first_token_at
+                )
+                self._cache_output(cache_key, output)
+                return output
+            except RETRYABLE_ERRORS as e:
+                logging.debug(f"Failed to complete instance {instance_id}. Error: {e}")
+
+                if attempt < retries - 1:
+                    await asyncio.sleep(self._backoff(attempt, e))
+                else:
+                    return self._error_output(instance_id, e)
+            except Exception as e:
+                return self._failed_output(instance_id, e)
+
+    def _backoff(self, attempt: int, e: Exception) -> float:
+        return self._rate_limiter.backoff(
+            attempt, _headers(e), rate_limited=isinstance(e, RateLimitError)
+        )
+
+    def _parse_response(self, response: Any) -> Any:
+        """Parse a raw completion response, or the stream of its chunks,
+        updating the rate limiter."""
+        self._rate_limiter.update(response.headers)
+        return response.parse()
+
+    def _completed(
+        self,
+        instance_id: str,
+        completion: Any,
+        tokens: int,
+        started: float,
+        first_token_at: Optional[float] = None,
+    ) -> ModelOutput:
+        """Output of a completion requested at `started`, refunding the tokens
+        it did not use to the rate limiter."""
+        ended = time.perf_counter()
+        usage = getattr(completion, "usage", None)
+        if usage is not None and usage.total_tokens:
+            # `max_tokens` was reserved, but only the tokens used count
+            self._rate_limiter.refund(tokens - usage.total_tokens)
+        latency = _latency_metadata(started, ended, first_token_at, usage)
+        return self._completion_output(instance_id, completion, latency)
+
+    def _cache_key(self, completions_create_kwargs: Dict[str, Any]) -> Optional[str]:
+        if not self.use_cache or not response_cache.enabled:
+            return None
+        return ResponseCache.key(
+            self.model.name, self.model.version, completions_create_kwargs
+        )
+
+    def _cached_output(
+        self, instance_id: str, cache_key: Optional[str]
+    ) -> Optional[ModelOutput]:
+        cached = response_cache.get(cache_key) if cache_key else None
+        if cached is None:
+            return None
+        return ModelOutput.from_json(
+            {**cached, "input_id": instance_id, "metadata": {"cached": True}}
+        )
+
+    def _cache_output(self, cache_key: Optional[str], output: ModelOutput) -> None:
+        if cache_key and output.error is None:
+            cached = output.to_json()
+            cached.pop("input_id")
+            cached.pop("metadata", None)
+            response_cache.put(cache_key, cached)
+
+    def _completions_create_kwargs(
+        self, messages: List[Dict[str, Any]]
+    ) -> Dict[str, Any]:
         completions_create_kwargs = {
             "model": self.model.name,
             "messages": messages,
@@ -130,6 +351,9 @@ class AzureOpenAIRunner(Runner):
             "stop": self.model.stop,
             "stream": self.model.stream,
         }
+        if self.model.stream:
+            # The usage is only sent, in a last chunk, if requested
+            completions_create_kwargs["stream_options"] = {"include_usage": True}
         if hasattr(self.model, "temperature"):
             completions_create_kwargs["temperature"] = self.model.temperature
         if hasattr(self.model, "top_p"):
@@ -140,61 +364,134 @@ class AzureOpenAIRunner(Runner):
             )
         if hasattr(self.model, "presence_penalty"):
             completions_create_kwargs["presence_penalty"] = self.model.presence_penalty
+        return completions_create_kwargs
+
+    def _completion_output(
+        self,
+        instance_id: str,
+        completion: Any,
+        latency: Optional[Dict[str, float]] = None,
+    ) -> ModelOutput:
+        completion_data: Data | None = None
+        if completion.choices[0].message.content:
+            completion_data = Data.from_text(
+                data=completion.choices[0].message.content
+            )
 
-        for attempt in range(retries):
-            try:
-                completion = self._client.chat.completions.create(
-                    **completions_create_kwargs
-                )
+        return ModelOutput(
+            input_id=instance_id,
+            completions=completion_data,
+            finish_reason=completion.choices[0].finish_reason,
+            error=None
+            if completion_data is not None
+            else f"The model did not generate any token. Finish reason: {completion.choices[0].finish_reason}",
+            metadata=_completion_metadata(completion, latency),
+        )
 
-                completion_data: Data | None = None
-                if completion.choices[0].message.content:
-                    completion_data = Data.from_text(
-                        data=completion.choices[0].message.content
-                    )
+    def _failed_output(self, instance_id: str, e: Exception) -> ModelOutput:
+        if isinstance(e, BadRequestError):
+            logging.error(f"Failed to complete instance {instance_id}. Error: {e}")
+        else:
+            logging.error(
+                f"Failed to complete instance {instance_id}. Error: {e} {type(e)=}"
+            )
+        return self._error_output(instance_id, e)
+
+    def _error_output(self, instance_id: str, e: Exception | str) -> ModelOutput:
+        return ModelOutput(
+            input_id=instance_id,
+            completions=None,
+            finish_reason="error",
+            error=str(e),
+        )
 
-                return ModelOutput(
-                    input_id=instance_id,
-                    completions=completion_data,
-                    finish_reason=completion.choices[0].finish_reason,
-                    error=None
-                    if completion_data is not None
-                    else f"The model did not generate any token. Finish reason: {completion.choices[0].finish_reason}",
-                )
-            except RateLimitError as e:
-                logging.debug(f"Failed to complete instance {instance_id}. Error: {e}")
 
-                if attempt < retries - 1:
-                    time.sleep(60)
-                else:
-                    return ModelOutput(
-                        input_id=instance_id,
-                        completions=None,
-                        finish_reason="error",
-                        error=str(e),
-                    )
-            except BadRequestError as e:
-                logging.error(f"Failed to complete instance {instance_id}. Error: {e}")
-                return ModelOutput(
-                    input_id=instance_id,
-                    completions=None,
-                    finish_reason="error",
-                    error=str(e),
-                )
-            except Exception as e:
-                logging.error(
-                    (
-                        f"Failed to complete instance {instance_id}. Error: {e} "
-                        f"{completion=} "
-                        f"{type(e)=}"
-                    )
-                )
-                return ModelOutput(
-                    input_id=instance_id,
-                    completions=None,
-                    finish_reason="error",
-                    error=str(e),
-                )
+@attrs.define
+class _ChatStream:
+    """Chat completion assembled from the chunks of a streamed response.
+
+    Only the first choice is kept, as runners request a single one.
+    """
+
+    first_token_at: Optional[float] = None
+    _id: str = ""
+    _created: int = 0
+    _model: str = ""
+    _content: List[str] = attrs.field(factory=list)
+    _finish_reason: Optional[str] = None
+    _usage: Any = None
+
+    def add(self, chunk: Any) -> None:
+        self._id = self._id or chunk.id
+        self._created = self._created or chunk.created
+        self._model = self._model or chunk.model
+        if chunk.usage is not None:
+            self._usage = chunk.usage
+        for choice in chunk.choices:
+            if choice.index != 0:
+                continue
+            if choice.delta is not None and choice.delta.content:
+                if self.first_token_at is None:
+                    self.first_token_at = time.perf_counter()
+                self._content.append(choice.delta.content)
+            if choice.finish_reason:
+                self._finish_reason = choice.finish_reason
+
+    def completion(self) -> ChatCompletion:
+        # Constructed without validation, as an interrupted stream has no
+        # finish reason
+        message = ChatCompletionMessage.model_construct(
+            role="assistant", content="".join(self._content) or None
+        )
+        choice = Choice.model_construct(
+            index=0, message=message, finish_reason=self._finish_reason
+        )
+        return ChatCompletion.model_construct(
+            id=self._id,
+            object="chat.completion",
+            created=self._created,
+            model=self._model,
+            choices=[choice],
+            usage=self._usage,
+        )
+
+
+def _latency_metadata(
+    started: float,
+    ended: float,
+    first_token_at: Optional[float] = None,
+    usage: Any = None,
+) -> Dict[str, float]:
+    # Tokens per second are measured from the first token when streaming,
+    # so they exclude the time to process the prompt
+    latency = {"total_seconds": ended - started}
+    generation_seconds = ended - started
+    if first_token_at is not None:
+        latency["time_to_first_token_seconds"] = first_token_at - started
+        generation_seconds = ended - first_token_at
+    completion_tokens = getattr(usage, "completion_tokens", None)
+    if completion_tokens and generation_seconds > 0:
+        latency["tokens_per_second"] = completion_tokens / generation_seconds
+    return latency
+
+
+def _completion_metadata(
+    completion: Any, latency: Optional[Dict[str, float]] = None
+) -> Optional[Dict[str, Any]]:
+    # Token usage of the completion, to measure the cost of runs, and its
+    # latency, to measure their responsiveness
+    metadata = {}
+    usage = getattr(completion, "usage", None)
+    if usage is not None:
+        metadata["usage"] = usage.model_dump(exclude_none=True)
+    if latency:
+        metadata["latency"] = latency
+    return metadata or None
+
+
+def _headers(e: Exception) -> Optional[Any]:
+    response = getattr(e, "response", None)
+    return getattr(response, "headers", None)
 
 
 @ModelRegistry.register("openai-base-model", runner=AzureOpenAIRunner)
@@ -0,0 +1,344 @@
+"""Azure OpenAI Batch API execution mode for large runs.
+
+Runs of tens of thousands of instances are slow and rate limited as
+individual chat completions. `AzureOpenAIBatchRunner` instead submits every
+instance in a single batch job, processed by the service within its
+completion window at a lower price and under a separate quota, and maps
+the completions back to model outputs.
+
+Compare the throughput and cost of both modes, offline against a local
+stand-in server or against a global batch deployment, with e.g.:
+
+    python -m medbench.models.batch --local --instances 500
+    python -m medbench.models.batch --instances 500 \\
+        --input-price 2.5 --output-price 10
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+import attrs
+
+from medbench.datasets import Data, Dataset, Instance
+
+from .azureoai import AzureOpenAIRunner, OpenAIChatModel
+from .schema import ModelOutput, ModelRun
+
+# Statuses of batch jobs that are done processing
+TERMINAL_STATUSES = ("completed", "failed", "expired", "cancelled")
+
+
+@attrs.define
+class AzureOpenAIBatchRunner(AzureOpenAIRunner):
+    """Runner submitting all the instances of a run as one batch job.
+
+    Requests are built as by `AzureOpenAIRunner`, written to a JSON Lines
+    file with the instance ids as custom ids, and submitted to the Batch API
+    of the deployment, which must be a batch deployment. Instances with cached
+    completions are not submitted, and completions are cached once read.
+
+    Attributes:
+        poll_seconds (float): Interval between checks of the batch status.
+        timeout_seconds (float): Time after which the batch is cancelled,
+            and its missing completions are errors.
+        completion_window (str): Completion window of the batch job.
+    """
+
+    poll_seconds: float = 30
+    timeout_seconds: float = 24 * 3600
+    completion_window: str = "24h"
+
+    def run(self) -> None:
+        if self._model_run is None:
+            raise ValueError(
+                "`ModelRun` is not set. Please call `setup` before running this model."
+            )
+
+        outputs: Dict[str, ModelOutput] = {}
+        requests, cache_keys = [], {}
+        for instance in self._model_run.dataset.instances:
+            body = self._completions_create_kwargs(self._build_chat_prompt(instance))
+            # Batch jobs do not stream
+            body["stream"] = False
+            body.pop("stream_options", None)
+            cache_key = self._cache_key(body)
+            cached = self._cached_output(instance.id, cache_key)
+            if cached is not None:
+                outputs[instance.id] = cached
+                continue
+            cache_keys[instance.id] = cache_key
+            requests.append(
+                {
+                    "custom_id": instance.id,
+                    "method": "POST",
+                    "url": "/chat/completions",
+                    "body": body,
+                }
+            )
+
+        if requests:
+            for output in self._run_batch(requests):
+                self._cache_output(cache_keys.get(output.input_id), output)
+                outputs[output.input_id] = output
+
+        self._model_run.results.extend(
+            outputs.get(instance.id)
+            or self._error_output(instance.id, "Missing from the batch output")
+            for instance in self._model_run.dataset.instances
+        )
+
+    async def arun(self) -> None:
+        # Waiting on the batch job blocks, so it runs outside of the event loop
+        await asyncio.to_thread(self.run)
+
+    def _run_batch(self, requests: List[Dict[str, Any]]) -> List[ModelOutput]:
+        data = "".join(json.dumps(request) + "\n" for request in requests)
+        input_file = self._client.files.create(
+            file=("batch.jsonl", data.encode("utf-8")), purpose="batch"
+        )
+        batch = self._client.batches.create(
+            input_file_id=input_file.id,
+            endpoint="/chat/completions",
+            completion_window=self.completion_window,
+        )
+        logging.info(
+            f"Submitted batch {batch.id} of {len(requests)} requests "
+            f"to {self.model.name}."
+        )
+
+        deadline = time.monotonic() + self.timeout_seconds
+        while batch.status not in TERMINAL_STATUSES:
+            if time.monotonic() > deadline:
+                logging.error(f"Batch {batch.id} timed out, cancelling it.")
+                batch = self._client.batches.cancel(batch.id)
+                break
+            time.sleep(self.poll_seconds)
+            batch = self._client.batches.retrieve(batch.id)
+        logging.info(f"Batch {batch.id} {batch.status}: {batch.request_counts}")
+
+        outputs = []
+        for file_id in (batch.output_file_id, batch.error_file_id):
+            if file_id:
+                content = self._client.files.content(file_id).text
+                outputs.extend(
+                    self._batch_output(json.loads(line))
+                    for line in content.splitlines()
+                    if line.strip()
+                )
+                self._delete_file(file_id)
+        self._delete_file(input_file.id)
+
+        if batch.status != "completed":
+            done = {output.input_id for output in outputs}
+            outputs.extend(
+                self._error_output(request["custom_id"], f"Batch {batch.status}")
+                for request in requests
+                if request["custom_id"] not in done
+            )
+        return outputs
+
+    def _batch_output(self, line: Dict[str, Any]) -> ModelOutput:
+        from openai.types.chat import ChatCompletion
+
+        instance_id = line["custom_id"]
+        response = line.get("response") or {}
+        if response.get("status_code") == 200:
+            completion = ChatCompletion.model_validate(response["body"])
+            return self._completion_output(instance_id, completion)
+
+        error = line.get("error") or (response.get("body") or {}).get("error") or {}
+        return self._error_output(instance_id, error.get("message") or str(error))
+
+    def _delete_file(self, file_id: str) -> None:
+        try:
+            self._client.files.delete(file_id)
+        except Exception as e:
+            logging.warning(f"Could not delete batch file {file_id}: {e}")
+
+
+def run_report(
+    mode: str,
+    model_run: ModelRun,
+    seconds: float,
+    input_price: float = 0.0,
+    output_price: float = 0.0,
+    discount: float = 0.0,
+) -> Dict[str, Any]:
+    """Throughput and cost of a run, from the token usage of its outputs,
+    and the percentiles of their latencies, if recorded.
+
+    Args:
+        mode: Name of the execution mode, e.g. "online" or "batch".
+        model_run: Run, with its results.
+        seconds: Wall time of the run.
+        input_price: Price of 1M prompt tokens.
+        output_price: Price of 1M completion tokens.
+        discount: Discount of the mode, e.g. 0.5 for batch deployments.
+    """
+    usages = [
+        result.metadata["usage"]
+        for result in model_run.results
+        if result.metadata and "usage" in result.metadata
+    ]
+    prompt_tokens = sum(usage.get("prompt_tokens", 0) for usage in usages)
+    completion_tokens = sum(usage.get("completion_tokens", 0) for usage in usages)
+    seconds = max(seconds, 1e-9)
+    cost = (prompt_tokens * input_price + completion_tokens * output_price) / 1e6
+    report = {
+        "mode": mode,
+        "instances": len(model_run.results),
+        "failed": sum(result.error is not None for result in model_run.results),
+        "seconds": round(seconds, 3),
+        "instances_per_second": round(len(model_run.results) / seconds, 2),
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "tokens_per_second": round((prompt_tokens + completion_tokens) / seconds, 1),
+        "estimated_cost": round(cost * (1 - discount), 6),
+    }
+    latencies = [
+        result.metadata["latency"]
+        for result in model_run.results
+        if result.metadata and "latency" in result.metadata
+    ]
+    for name in ("time_to_first_token_seconds", "total_seconds"):
+        values = [latency[name] for latency in latencies if name in latency]
+        if values:
+            report[name] = _percentiles(values)
+    return report
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    if len(values) == 1:
+        return {"p50": round(values[0], 4), "p95": round(values[0], 4)}
+    quantiles = statistics.quantiles(values, n=20, method="inclusive")
+    return {"p50": round(quantiles[9], 4), "p95": round(quantiles[18], 4)}
+
+
+def _benchmark_run(model: OpenAIChatModel, instances: int) -> ModelRun:
+    return ModelRun(
+        id="batch-benchmark",
+        model=model,
+        dataset=Dataset(
+            name="batch-benchmark",
+            description="Synthetic prompts comparing online and batch modes",
+            instances=[
+                Instance(
+                    id=f"instance-{i}",
+                    input=Data.from_text(
+                        data=f"Summarize the findings of patient note {i}."
+                    ),
+                    references=[],
+                    split="benchmark",
+                )
+                for i in range(instances)
+            ],
+        ),
+    )
+
+
+def compare(
+    model: OpenAIChatModel,
+    instances: int,
+    poll_seconds: float,
+    input_price: float = 0.0,
+    output_price: float = 0.0,
+    batch_discount: float = 0.5,
+) -> List[Dict[str, Any]]:
+    """Run the same prompts online, concurrently, and as a batch job.
+
+    The online mode streams if the model does.
+    """
+    from medbench import aio
+
+    reports = []
+    for mode, runner in (
+        ("online", AzureOpenAIRunner(use_cache=False)),
+        ("batch", AzureOpenAIBatchRunner(use_cache=False, poll_seconds=poll_seconds)),
+    ):
+        model_run = _benchmark_run(model, instances)
+        runner.setup(model_run)
+        start = time.perf_counter()
+        aio.run(runner.arun())
+        reports.append(
+            run_report(
+                mode,
+                model_run,
+                time.perf_counter() - start,
+                input_price,
+                output_price,
+                discount=batch_discount if mode == "batch" else 0.0,
+            )
+        )
+    return reports
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    from medbench.config import settings
+
+    from .localserver import LocalOpenAIServer
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--instances", type=int, default=100)
+    parser.add_argument(
+        "--local",
+        action="store_true",
+        help="Run against a local stand-in server instead of the deployment.",
+    )
+    parser.add_argument("--poll-seconds", type=float, default=None)
+    parser.add_argument("--max-tokens", type=int, default=256)
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream online completions, measuring their time to first token.",
+    )
+    parser.add_argument(
+        "--input-price", type=float, default=0.0, help="Price of 1M prompt tokens."
+    )
+    parser.add_argument(
+        "--output-price", type=float, default=0.0, help="Price of 1M output tokens."
+    )
+    parser.add_argument("--batch-discount", type=float, default=0.5)
+    args = parser.parse_args(argv)
+
+    server = (
+        LocalOpenAIServer(latency_seconds=0.05, chunk_seconds=0.005).start()
+        if args.local
+        else None
+    )
+    try:
+        model = OpenAIChatModel(
+            name=settings.azure_openai_deployment or "local",
+            version=settings.azure_openai_version or "2024-10-21",
+            endpoint=server.endpoint if server else settings.azure_openai_endpoint,
+            api_key="local" if server else settings.azure_openai_api_key,
+            system_prompt="You are a clinical assistant.",
+            max_tokens=args.max_tokens,
+            stream=args.stream,
+            temperature=0.0,
+            top_p=1.0,
+        )
+        poll_seconds = args.poll_seconds or (0.1 if server else 30)
+        reports = compare(
+            model,
+            args.instances,
+            poll_seconds,
+            args.input_price,
+            args.output_price,
+            args.batch_discount,
+        )
+    finally:
+        if server is not None:
+            server.stop()
+
+    print(json.dumps(reports, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator, Optional
+
+import attrs
+
+from medbench.config import settings
+from medbench.dedup import content_hash
+
+# Request parameters that do not change the completion
+_UNCACHED_PARAMS = ("stream", "stream_options")
+
+
+@attrs.define
+class ResponseCache:
+    """Persistent cache of LLM completions.
+
+    Judge prompts are deterministic for identical inputs, so re-running an
+    evaluation of an unchanged run reads its completions from the cache
+    instead of paying for them again. Completions are keyed by a hash of the
+    deployment, its API version, the messages and the sampling parameters.
+
+    Completions are stored in a local SQLite file, shared by all the processes
+    of a worker. They expire after `ttl_seconds`, and the least recently used
+    are evicted once the file grows beyond `max_size_mb`. Failed completions
+    are never cached.
+
+    Attributes:
+        path (str): SQLite file to store completions in.
+            If None, the cache is disabled.
+        max_size_mb (int): Size budget of the cached completions, in MB.
+        ttl_seconds (float): Time after which completions expire.
+            If 0, completions never expire.
+    """
+
+    path: Optional[str] = None
+    max_size_mb: int = 256
+    ttl_seconds: float = 7 * 24 * 3600
+
+    _connection: Optional[sqlite3.Connection] = attrs.field(init=False, default=None)
+    _lock: threading.Lock = attrs.field(init=False, factory=threading.Lock)
+    _hits: int = attrs.field(init=False, default=0)
+    _misses: int = attrs.field(init=False, default=0)
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.path)
+
+    @staticmethod
+    def key(deployment: str, version: str, request: dict[str, Any]) -> str:
+        """Cache key of a chat completion request.
+
+        Args:
+            deployment: Name of the deployment.
+            version: API version of the deployment.
+            request: Arguments of `chat.completions.create`, i.e. the messages
+                and the sampling parameters.
+        """
+        request = {
+            name: value
+            for name, value in request.items()
+            if name not in _UNCACHED_PARAMS
+        }
+        return content_hash(deployment, version, request)
+
+    def get(self, key: str) -> Optional[dict]:
+        """Get a cached completion, or None if missing or expired."""
+        if not self.enabled:
+            return None
+
+        value = None
+        try:
+            with self._lock:
+                connection = self._connect()
+                row = connection.execute(
+                    "SELECT value, created_at FROM responses WHERE key = ?", (key,)
+                ).fetchone()
+                now = time.time()
+                if row is not None and self._expired(row[1], now):
+                    connection.execute("DELETE FROM responses WHERE key = ?", (key,))
+                elif row is not None:
+                    value = json.loads(row[0])
+                    connection.execute(
+                        "UPDATE responses SET accessed_at = ? WHERE key = ?",
+                        (now, key),
+                    )
+        except sqlite3.Error as e:
+            logging.warning(f"Could not read LLM responses from {self.path}: {e}")
+
+        with self._lock:
+            if value is None:
+                self._misses += 1
+            else:
+                self._hits += 1
+        return value
+
+    def put(self, key: str, value: dict) -> None:
+        if not self.enabled:
+            return
+
+        data = json.dumps(value)
+        now = time.time()
+        try:
+            with self._lock:
+                connection = self._connect()
+                with _transaction(connection):
+                    connection.execute(
+                        "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                        (key, data, len(key) + len(data), now, now),
+                    )
+                    self._evict(connection, now)
+        except sqlite3.Error as e:
+            logging.warning(f"Could not write LLM responses to {self.path}: {e}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits, misses = self._hits, self._misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "path": self.path,
+            "size_mb": self._size_bytes() / 2**20,
+            "max_size_mb": self.max_size_mb,
+        }
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return bool(self.ttl_seconds) and now - created_at > self.ttl_seconds
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            connection = sqlite3.connect(
+                self.path, timeout=30, check_same_thread=False, isolation_level=None
+            )
+            # Readers do not block the writer, e.g. other worker processes
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, size INTEGER NOT NULL, "
+                "created_at REAL NOT NULL, accessed_at REAL NOT NULL)"
+            )
+            connection.execute(
+                "CREATE INDEX IF NOT EXISTS responses_accessed_at "
+                "ON responses (accessed_at)"
+            )
+            self._connection = connection
+        return self._connection
+
+    def _evict(self, connection: sqlite3.Connection, now: float) -> None:
+        if self.ttl_seconds:
+            connection.execute(
+                "DELETE FROM responses WHERE created_at < ?", (now - self.ttl_seconds,)
+            )
+
+        (size,) = connection.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        budget = self.max_size_mb * 2**20
+        if size <= budget:
+            return
+
+        # Evict down to 90% of the budget, so evictions are not run on every put
+        to_free = size - int(0.9 * budget)
+        freed, evicted = 0, []
+        for key, entry_size in connection.execute(
+            "SELECT key, size FROM responses ORDER BY accessed_at"
+        ):
+            if freed >= to_free:
+                break
+            evicted.append((key,))
+            freed += entry_size
+        connection.executemany("DELETE FROM responses WHERE key = ?", evicted)
+        logging.info(
+            f"Evicted {len(evicted)} LLM responses from {self.path} "
+            f"to stay within {self.max_size_mb}MB."
+        )
+
+    def _size_bytes(self) -> int:
+        if not self.enabled:
+            return 0
+        try:
+            with self._lock:
+                return (
+                    self._connect()
+                    .execute("SELECT COALESCE(SUM(size), 0) FROM responses")
+                    .fetchone()[0]
+                )
+        except sqlite3.Error:
+            return 0
+
+
+@contextmanager
+def _transaction(connection: sqlite3.Connection) -> Iterator[None]:
+    # Connections are in autocommit mode, so writes are batched explicitly
+    connection.execute("BEGIN IMMEDIATE")
+    try:
+        yield
+    except BaseException:
+        connection.execute("ROLLBACK")
+        raise
+    connection.execute("COMMIT")
+
+
+response_cache = ResponseCache(
+    path=settings.azure_openai_cache_path,
+    max_size_mb=settings.azure_openai_cache_max_size_mb,
+    ttl_seconds=settings.azure_openai_cache_ttl_hours * 3600,
+)
@@ -0,0 +1,194 @@
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+from typing import TYPE_CHECKING, Any, NamedTuple, Optional
+
+import attrs
+
+from medbench.config import settings
+
+if TYPE_CHECKING:
+    import openai
+
+
+class ClientKey(NamedTuple):
+    endpoint: str
+    deployment: str
+    api_version: str
+    # Hash of the API key, so clients are not shared across credentials
+    credentials: str
+
+
+@attrs.define
+class OpenAIClientPool:
+    """Process-wide pool of Azure OpenAI clients.
+
+    Clients hold an HTTP connection pool, so building one per runner, or per
+    request, pays a TCP and TLS handshake on every first call. Clients are
+    instead shared by all the runners of a worker process, keyed by endpoint,
+    deployment, API version and API key, so connections survive across
+    invocations.
+
+    Async clients are bound to the event loop they are first used on, so they
+    should be used on the long-lived loop of `medbench.aio`. Getting one from
+    another loop (e.g. under `asyncio.run`) replaces it with a new client.
+
+    Attributes:
+        http2 (bool): Whether clients negotiate HTTP/2, multiplexing requests
+            over a single connection. Requires the `h2` package.
+    """
+
+    http2: bool = False
+
+    _clients: dict[tuple[str, ClientKey], Any] = attrs.field(init=False, factory=dict)
+    # Event loops async clients were created on
+    _loops: dict[ClientKey, Any] = attrs.field(init=False, factory=dict)
+    # Async clients whose connection was opened by `connect`
+    _connected: set[ClientKey] = attrs.field(init=False, factory=set)
+    _lock: threading.Lock = attrs.field(init=False, factory=threading.Lock)
+
+    def get(
+        self, endpoint: str, deployment: str, api_version: str, api_key: str
+    ) -> "openai.AzureOpenAI":
+        """Get the synchronous client of a deployment, creating it on first use."""
+        return self._get("sync", endpoint, deployment, api_version, api_key)
+
+    def get_async(
+        self, endpoint: str, deployment: str, api_version: str, api_key: str
+    ) -> "openai.AsyncAzureOpenAI":
+        """Get the async client of a deployment, creating it on first use."""
+        return self._get("async", endpoint, deployment, api_version, api_key)
+
+    async def connect(
+        self, endpoint: str, deployment: str, api_version: str, api_key: str
+    ) -> float:
+        """Open the connection of the async client of a deployment.
+
+        Lists the models of the endpoint, which uses no tokens, so the first
+        LLM call does not pay for the TCP and TLS handshakes. Await it on the
+        loop runners use, i.e. through `medbench.aio.run`, as async clients
+        are bound to their loop.
+
+        Returns:
+            The seconds taken to connect.
+        """
+        client = self.get_async(endpoint, deployment, api_version, api_key)
+        start = time.perf_counter()
+        await client.models.list()
+        with self._lock:
+            self._connected.add(_client_key(endpoint, deployment, api_version, api_key))
+        return time.perf_counter() - start
+
+    def stats(self) -> dict:
+        """Summary of the pool state."""
+        with self._lock:
+            return {
+                "clients": [
+                    f"{kind}:{key.deployment}@{key.endpoint}"
+                    for kind, key in self._clients
+                ],
+                "connected": [
+                    f"async:{key.deployment}@{key.endpoint}" for key in self._connected
+                ],
+                "http2": self.http2,
+            }
+
+    def _get(
+        self,
+        kind: str,
+        endpoint: str,
+        deployment: str,
+        api_version: str,
+        api_key: str,
+    ) -> Any:
+        key = _client_key(endpoint, deployment, api_version, api_key)
+        loop = _running_loop() if kind == "async" else None
+        with self._lock:
+            client = self._clients.get((kind, key))
+            if client is not None and loop is not None:
+                # Clients got outside of a loop bind to the first one using them
+                bound_loop = self._loops.setdefault(key, loop)
+                if bound_loop is not loop:
+                    client = None
+            if client is None:
+                client = self._create(kind, key, api_key)
+                if kind == "async":
+                    self._connected.discard(key)
+                self._clients[(kind, key)] = client
+                if loop is not None:
+                    self._loops[key] = loop
+                logging.info(
+                    f"Created {kind} Azure OpenAI client for {deployment} "
+                    f"({api_version}) at {endpoint}."
+                )
+            return client
+
+    def _create(self, kind: str, key: ClientKey, api_key: str) -> Any:
+        import openai
+
+        client_cls, http_client_cls = (
+            (openai.AzureOpenAI, openai.DefaultHttpxClient)
+            if kind == "sync"
+            else (openai.AsyncAzureOpenAI, openai.DefaultAsyncHttpxClient)
+        )
+        return client_cls(
+            azure_endpoint=key.endpoint,
+            azure_deployment=key.deployment,
+            api_key=api_key,
+            api_version=key.api_version,
+            http_client=http_client_cls(http2=self.http2),
+            # Runners retry requests themselves, through their rate limiter
+            max_retries=0,
+        )
+
+
+def _client_key(
+    endpoint: str, deployment: str, api_version: str, api_key: str
+) -> ClientKey:
+    return ClientKey(
+        endpoint=endpoint,
+        deployment=deployment,
+        api_version=api_version,
+        credentials=hashlib.sha256((api_key or "").encode("utf-8")).hexdigest(),
+    )
+
+
+def _running_loop() -> Optional[asyncio.AbstractEventLoop]:
+    try:
+        return asyncio.get_running_loop()
+    except RuntimeError:
+        return None
+
+
+openai_client_pool = OpenAIClientPool(http2=settings.azure_openai_http2)
+
+
+def warm_up_clients() -> dict:
+    """Connect the async client of the Azure OpenAI deployment of the settings.
+
+    The client is created and connected on the long-lived loop of
+    `medbench.aio`, which TBFact and the evaluators run on, so their first
+    LLM call finds it warm.
+
+    Returns:
+        Whether the client connected, reported by the health routes.
+    """
+    from medbench import aio
+
+    if not settings.azure_openai_endpoint:
+        return {"connected": False, "error": "AZURE_OPENAI_ENDPOINT is not set."}
+    try:
+        seconds = aio.run(
+            openai_client_pool.connect(
+                endpoint=settings.azure_openai_endpoint,
+                deployment=settings.azure_openai_deployment,
+                api_version=settings.azure_openai_version,
+                api_key=settings.azure_openai_api_key,
+            )
+        )
+    except Exception as e:
+        logging.warning(f"Could not connect the Azure OpenAI client: {e}")
+        return {"connected": False, "error": str(e)}
+    return {"connected": True, "seconds": round(seconds, 3)}
@@ -0,0 +1,305 @@
+"""Local stand-in for the Azure OpenAI chat completions, files and batch APIs.
+
+Serves the requests of `openai.AzureOpenAI` clients offline, completing
+chat requests with a `responder`, so runners, including the batch mode, can
+be tested and benchmarked without a deployment:
+
+    with LocalOpenAIServer() as server:
+        model = OpenAIChatModel(endpoint=server.endpoint, api_key="local", ...)
+"""
+
+import email.parser
+import itertools
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Optional
+
+import attrs
+
+Responder = Callable[[dict[str, Any]], str]
+
+
+def echo_responder(body: dict[str, Any]) -> str:
+    """Complete a chat request with the text of its last message."""
+    content = body["messages"][-1]["content"]
+    if isinstance(content, str):
+        return content
+    return "".join(part.get("text", "") for part in content)
+
+
+@attrs.define
+class LocalOpenAIServer:
+    """HTTP server implementing the subset of the Azure OpenAI API used by
+    `AzureOpenAIRunner` and `AzureOpenAIBatchRunner`.
+
+    Attributes:
+        responder (Callable): Completes the body of a chat completions request.
+            Exceptions it raises are returned as 400 errors.
+        latency_seconds (float): Simulated latency of each chat completion,
+            before its first token when streamed.
+        chunk_seconds (float): Simulated time between the chunks of streamed
+            chat completions.
+        batch_seconds (float): Simulated time to process a batch job.
+    """
+
+    responder: Responder = echo_responder
+    latency_seconds: float = 0.0
+    chunk_seconds: float = 0.0
+    batch_seconds: float = 0.0
+
+    files: dict[str, dict] = attrs.field(init=False, factory=dict)
+    batches: dict[str, dict] = attrs.field(init=False, factory=dict)
+    requests: int = attrs.field(init=False, default=0)
+    _ids: Any = attrs.field(init=False, factory=itertools.count)
+    _server: Optional[ThreadingHTTPServer] = attrs.field(init=False, default=None)
+    _lock: threading.Lock = attrs.field(init=False, factory=threading.Lock)
+
+    @property
+    def endpoint(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def start(self) -> "LocalOpenAIServer":
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                server._handle(self, "GET")
+
+            def do_POST(self):
+                server._handle(self, "POST")
+
+            def do_DELETE(self):
+                server._handle(self, "DELETE")
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def __enter__(self) -> "LocalOpenAIServer":
+        return self.start()
+
+    def __exit__(self, *args) -> None:
+        self.stop()
+
+    def complete(self, body: dict[str, Any]) -> dict[str, Any]:
+        """Chat completion object of a request body."""
+        with self._lock:
+            self.requests += 1
+        content = self.responder(body)
+        prompt_tokens = len(json.dumps(body["messages"])) // 4
+        completion_tokens = max(len(content) // 4, 1)
+        return {
+            "id": self._id("chatcmpl"),
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [
+                {
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content},
+                    "finish_reason": "stop",
+                }
+            ],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "total_tokens": prompt_tokens + completion_tokens,
+            },
+        }
+
+    def _id(self, prefix: str) -> str:
+        with self._lock:
+            return f"{prefix}-{next(self._ids)}"
+
+    def _handle(self, handler: BaseHTTPRequestHandler, method: str) -> None:
+        path = handler.path.split("?", 1)[0]
+        length = int(handler.headers.get("Content-Length") or 0)
+        body = handler.rfile.read(length) if length else b""
+        try:
+            status, response = self._route(method, path, handler.headers, body)
+        except Exception as e:
+            status, response = 400, {"error": {"message": str(e), "code": "error"}}
+
+        if isinstance(response, list):
+            self._send_events(handler, status, response)
+            return
+        if isinstance(response, bytes):
+            data, content_type = response, "application/octet-stream"
+        else:
+            data, content_type = json.dumps(response).encode(), "application/json"
+        handler.send_response(status)
+        handler.send_header("Content-Type", content_type)
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    def _send_events(
+        self, handler: BaseHTTPRequestHandler, status: int, chunks: list[dict]
+    ) -> None:
+        # Server-sent events, delimited by the end of the connection
+        handler.send_response(status)
+        handler.send_header("Content-Type", "text/event-stream")
+        handler.end_headers()
+        for i, chunk in enumerate(chunks):
+            if i:
+                time.sleep(self.chunk_seconds)
+            handler.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            handler.wfile.flush()
+        handler.wfile.write(b"data: [DONE]\n\n")
+
+    def _route(self, method: str, path: str, headers: Any, body: bytes):
+        if method == "POST" and re.fullmatch(
+            r"/openai/deployments/[^/]+/chat/completions", path
+        ):
+            time.sleep(self.latency_seconds)
+            request = json.loads(body)
+            completion = self.complete(request)
+            if request.get("stream"):
+                include_usage = (request.get("stream_options") or {}).get(
+                    "include_usage", False
+                )
+                return 200, _chunks(completion, include_usage)
+            return 200, completion
+        if method == "GET" and path == "/openai/models":
+            # Listed by `OpenAIClientPool.connect` to open connections
+            return 200, {"object": "list", "data": []}
+        if method == "POST" and path == "/openai/files":
+            return 200, self._create_file(headers["Content-Type"], body)
+        if match := re.fullmatch(r"/openai/files/([^/]+)(/content)?", path):
+            file = self.files[match.group(1)]
+            if method == "DELETE":
+                del self.files[file["id"]]
+                return 200, {"id": file["id"], "object": "file", "deleted": True}
+            if match.group(2):
+                return 200, file["content"]
+            return 200, _public(file)
+        if method == "POST" and path == "/openai/batches":
+            return 200, self._create_batch(json.loads(body))
+        if match := re.fullmatch(r"/openai/batches/([^/]+)(/cancel)?", path):
+            batch = self.batches[match.group(1)]
+            if match.group(2) and batch["status"] in ("validating", "in_progress"):
+                batch["status"] = "cancelled"
+            return 200, batch
+        return 404, {"error": {"message": f"Not found: {method} {path}"}}
+
+    def _create_file(self, content_type: str, body: bytes) -> dict:
+        message = email.parser.BytesParser().parsebytes(
+            f"Content-Type: {content_type}\r\n\r\n".encode() + body
+        )
+        fields = {
+            part.get_param("name", header="content-disposition"): part
+            for part in message.get_payload()
+        }
+        return self._add_file(
+            fields["file"].get_payload(decode=True),
+            fields["file"].get_filename() or "file.jsonl",
+            fields["purpose"].get_payload(decode=True).decode(),
+        )
+
+    def _add_file(self, content: bytes, filename: str, purpose: str) -> dict:
+        file = {
+            "id": self._id("file"),
+            "object": "file",
+            "bytes": len(content),
+            "created_at": int(time.time()),
+            "filename": filename,
+            "purpose": purpose,
+            "status": "processed",
+            "content": content,
+        }
+        self.files[file["id"]] = file
+        return _public(file)
+
+    def _create_batch(self, request: dict) -> dict:
+        batch = {
+            "id": self._id("batch"),
+            "object": "batch",
+            "endpoint": request["endpoint"],
+            "input_file_id": request["input_file_id"],
+            "completion_window": request["completion_window"],
+            "status": "validating",
+            "created_at": int(time.time()),
+            "output_file_id": None,
+            "error_file_id": None,
+            "request_counts": {"total": 0, "completed": 0, "failed": 0},
+        }
+        self.batches[batch["id"]] = batch
+        threading.Thread(target=self._process_batch, args=(batch,), daemon=True).start()
+        return batch
+
+    def _process_batch(self, batch: dict) -> None:
+        lines = self.files[batch["input_file_id"]]["content"].splitlines()
+        batch["status"] = "in_progress"
+        time.sleep(self.batch_seconds)
+        outputs, errors = [], []
+        for line in lines:
+            request = json.loads(line)
+            custom_id = request["custom_id"]
+            try:
+                body = self.complete(request["body"])
+            except Exception as e:
+                error = {"code": "error", "message": str(e)}
+                errors.append({"custom_id": custom_id, "response": None, "error": error})
+                continue
+            response = {"status_code": 200, "body": body}
+            outputs.append({"custom_id": custom_id, "response": response})
+        batch["request_counts"] = {
+            "total": len(lines),
+            "completed": len(outputs),
+            "failed": len(errors),
+        }
+        if batch["status"] == "cancelled":
+            return
+        if outputs:
+            batch["output_file_id"] = self._add_file(
+                _jsonl(outputs), "output.jsonl", "batch_output"
+            )["id"]
+        if errors:
+            batch["error_file_id"] = self._add_file(
+                _jsonl(errors), "errors.jsonl", "batch_output"
+            )["id"]
+        batch["status"] = "completed"
+
+
+def _public(file: dict) -> dict:
+    return {key: value for key, value in file.items() if key != "content"}
+
+
+def _chunks(completion: dict, include_usage: bool) -> list[dict]:
+    """Chunks streaming a chat completion, one word at a time."""
+    base = {
+        "id": completion["id"],
+        "object": "chat.completion.chunk",
+        "created": completion["created"],
+        "model": completion["model"],
+    }
+    content = completion["choices"][0]["message"]["content"]
+    deltas = [{"role": "assistant", "content": ""}]
+    deltas.extend({"content": word} for word in re.findall(r"\s*\S+|\s+$", content))
+    chunks = [
+        {**base, "choices": [{"index": 0, "delta": delta, "finish_reason": None}]}
+        for delta in deltas
+    ]
+    chunks.append(
+        {**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+    )
+    if include_usage:
+        chunks.append({**base, "choices": [], "usage": completion["usage"]})
+    return chunks
+
+
+def _jsonl(items: list[dict]) -> bytes:
+    return "".join(json.dumps(item) + "\n" for item in items).encode()
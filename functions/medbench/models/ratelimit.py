@@ -0,0 +1,238 @@
+import logging
+import random
+import threading
+import time
+from typing import Any, Iterable, Mapping, Optional
+
+import attrs
+
+from medbench.config import settings
+
+# Estimated tokens of an image input, for low detail images
+IMAGE_TOKENS = 85
+# Characters per token of English text, to estimate prompt tokens
+CHARS_PER_TOKEN = 4
+
+
+@attrs.define
+class TokenBucket:
+    """Token bucket refilled at a rate per minute.
+
+    Capacity is a sixth of the rate, as Azure OpenAI enforces quotas over
+    10 second windows too. Reservations are taken in order and may overdraw
+    the bucket, so concurrent callers are spaced out instead of all retrying
+    once it refills.
+
+    Attributes:
+        per_minute (float): Refill rate. If 0, the bucket never limits.
+    """
+
+    per_minute: float
+
+    _level: float = attrs.field(init=False)
+    _updated: Optional[float] = attrs.field(init=False, default=None)
+
+    def __attrs_post_init__(self):
+        self._level = self.capacity
+
+    @property
+    def capacity(self) -> float:
+        return max(self.per_minute / 6, 1)
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take an amount from the bucket, returning the seconds to wait for it."""
+        if not self.per_minute:
+            return 0.0
+        self._refill(now)
+        # Requests larger than the capacity wait for a full bucket
+        needed = min(amount, self.capacity)
+        delay = max(needed - self._level, 0) / (self.per_minute / 60)
+        self._level -= amount
+        return delay
+
+    def refund(self, amount: float, now: float) -> None:
+        if self.per_minute:
+            self._refill(now)
+            self._level = min(self._level + amount, self.capacity)
+
+    def limit(self, remaining: float, now: float) -> None:
+        """Lower the level to the amount remaining according to the service."""
+        if self.per_minute:
+            self._refill(now)
+            self._level = min(self._level, remaining)
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated if self._updated is not None else 0.0
+        self._updated = now
+        self._level = min(self._level + elapsed * self.per_minute / 60, self.capacity)
+
+
+@attrs.define
+class RateLimiter:
+    """Rate limiter of the requests and tokens sent to a deployment.
+
+    Requests reserve a request and their estimated tokens before being sent,
+    and wait for them if the deployment's quota would be exceeded. Response
+    headers correct the estimate with the quota remaining, and `Retry-After`
+    pauses every request until the service accepts requests again.
+
+    Attributes:
+        requests_per_minute (int): Request quota. If 0, requests are not limited.
+        tokens_per_minute (int): Token quota. If 0, tokens are not limited.
+        backoff_base (float): Backoff of the first retry without `Retry-After`,
+            in seconds, doubled on each retry.
+        rate_limit_backoff_base (float): Backoff of the first retry of rate
+            limited requests without `Retry-After`, in seconds, doubled on
+            each retry. Quotas are enforced over 10 second windows, so
+            retrying sooner is rate limited again.
+        backoff_max (float): Maximum backoff, in seconds.
+    """
+
+    requests_per_minute: int = 0
+    tokens_per_minute: int = 0
+    backoff_base: float = 2.0
+    rate_limit_backoff_base: float = 10.0
+    backoff_max: float = 60.0
+
+    _requests: TokenBucket = attrs.field(init=False)
+    _tokens: TokenBucket = attrs.field(init=False)
+    _paused_until: float = attrs.field(init=False, default=0.0)
+    _lock: threading.Lock = attrs.field(init=False, factory=threading.Lock)
+
+    def __attrs_post_init__(self):
+        self._requests = TokenBucket(self.requests_per_minute)
+        self._tokens = TokenBucket(self.tokens_per_minute)
+
+    def reserve(self, tokens: int) -> float:
+        """Reserve a request of an estimated number of tokens.
+
+        Returns:
+            The number of seconds to wait before sending the request.
+        """
+        with self._lock:
+            now = time.monotonic()
+            delay = max(
+                self._requests.reserve(1, now),
+                self._tokens.reserve(tokens, now),
+                self._paused_until - now,
+            )
+        return max(delay, 0.0)
+
+    def refund(self, tokens: int) -> None:
+        """Give back tokens reserved but not used, e.g. when the completion is
+        shorter than `max_tokens`."""
+        if tokens > 0:
+            with self._lock:
+                self._tokens.refund(tokens, time.monotonic())
+
+    def update(self, headers: Optional[Mapping[str, str]]) -> None:
+        """Update the limiter from the headers of a response."""
+        if not headers:
+            return
+        remaining_requests = _float_header(headers, "x-ratelimit-remaining-requests")
+        remaining_tokens = _float_header(headers, "x-ratelimit-remaining-tokens")
+        retry_after = retry_after_seconds(headers)
+        with self._lock:
+            now = time.monotonic()
+            if remaining_requests is not None:
+                self._requests.limit(remaining_requests, now)
+            if remaining_tokens is not None:
+                self._tokens.limit(remaining_tokens, now)
+            if retry_after is not None:
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+    def backoff(
+        self,
+        attempt: int,
+        headers: Optional[Mapping[str, str]] = None,
+        rate_limited: bool = False,
+    ) -> float:
+        """Seconds to wait before retrying a failed request.
+
+        The `Retry-After` of a response is honored, and pauses other requests
+        too. Otherwise, the backoff grows exponentially with the attempt, from
+        a longer base for rate limited requests. It is jittered between half
+        and all of it, so concurrent retries are spread out, but never retried
+        right away.
+        """
+        retry_after = retry_after_seconds(headers) if headers else None
+        if retry_after is not None:
+            self.update(headers)
+            return retry_after + random.uniform(0, self.backoff_base)
+        base = self.rate_limit_backoff_base if rate_limited else self.backoff_base
+        backoff = min(self.backoff_max, base * 2**attempt)
+        return random.uniform(backoff / 2, backoff)
+
+
+@attrs.define
+class RateLimiterPool:
+    """Rate limiters shared by all the runners of a worker process, keyed by
+    endpoint and deployment, so concurrent runs share the deployment quota."""
+
+    requests_per_minute: int = 0
+    tokens_per_minute: int = 0
+
+    _limiters: dict[tuple[str, str], RateLimiter] = attrs.field(
+        init=False, factory=dict
+    )
+    _lock: threading.Lock = attrs.field(init=False, factory=threading.Lock)
+
+    def get(self, endpoint: str, deployment: str) -> RateLimiter:
+        with self._lock:
+            limiter = self._limiters.get((endpoint, deployment))
+            if limiter is None:
+                limiter = RateLimiter(
+                    requests_per_minute=self.requests_per_minute,
+                    tokens_per_minute=self.tokens_per_minute,
+                )
+                self._limiters[(endpoint, deployment)] = limiter
+                logging.info(
+                    f"Created rate limiter for {deployment} at {endpoint} "
+                    f"({self.requests_per_minute} RPM, {self.tokens_per_minute} TPM)."
+                )
+            return limiter
+
+
+def estimate_tokens(messages: Iterable[dict[str, Any]], max_tokens: int = 0) -> int:
+    """Estimate the tokens a chat completion counts against the quota.
+
+    Azure OpenAI counts the prompt tokens and `max_tokens` when admitting a
+    request. Prompt tokens are estimated from the length of the text.
+    """
+    chars, images = 0, 0
+    for message in messages:
+        content = message.get("content")
+        if isinstance(content, str):
+            chars += len(content)
+            continue
+        for part in content or []:
+            if part.get("type") == "text":
+                chars += len(part.get("text") or "")
+            elif part.get("type") == "image_url":
+                images += 1
+    return chars // CHARS_PER_TOKEN + images * IMAGE_TOKENS + (max_tokens or 0)
+
+
+def retry_after_seconds(headers: Mapping[str, str]) -> Optional[float]:
+    """Seconds to wait according to `retry-after-ms` or `retry-after` headers."""
+    retry_after_ms = _float_header(headers, "retry-after-ms")
+    if retry_after_ms is not None:
+        return retry_after_ms / 1000
+    # HTTP dates are not used by Azure OpenAI, and are ignored
+    return _float_header(headers, "retry-after")
+
+
+def _float_header(headers: Mapping[str, str], name: str) -> Optional[float]:
+    value = headers.get(name)
+    if value is None:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        return None
+
+
+rate_limiters = RateLimiterPool(
+    requests_per_minute=settings.azure_openai_requests_per_minute,
+    tokens_per_minute=settings.azure_openai_tokens_per_minute,
+)
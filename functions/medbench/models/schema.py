@@ -1,3 +1,4 @@
+import asyncio
 import json
 import os
 from abc import ABC, abstractmethod
@@ -11,6 +12,12 @@ from medbench.register import BaseRegistry
 
 
 class ModelRegistry(BaseRegistry["Model"]):
+    _plugins = (
+        "medbench.models.aml",
+        "medbench.models.azureoai",
+        "medbench.models.cxrreportgen",
+    )
+
     @classmethod
     def register(cls, name: str, runner: Type["Runner"], **kwargs):
         """Decorator for registering MedBench models."""
@@ -76,6 +83,14 @@ class Runner(ABC):
     def run(self) -> None:
         pass
 
+    async def arun(self) -> None:
+        """Run the model without blocking the event loop.
+
+        Runs `run` in a thread, unless the runner completes instances
+        concurrently itself.
+        """
+        await asyncio.to_thread(self.run)
+
     def save(
         self, path: str, overwrite: bool = False, skip_dataset: bool = False
     ) -> None:
@@ -0,0 +1,67 @@
+import os
+import resource
+import sys
+import threading
+from collections import deque
+from typing import Optional
+
+import attrs
+import numpy as np
+
+
+@attrs.define
+class LatencyTracker:
+    """Rolling latency percentiles of jobs, per kind of job.
+
+    Attributes:
+        window (int): Number of most recent jobs of each kind to keep.
+    """
+
+    window: int = 200
+
+    _latencies: dict[str, deque] = attrs.field(init=False, factory=dict)
+    _lock: threading.Lock = attrs.field(init=False, factory=threading.Lock)
+
+    def record(self, kind: str, seconds: float) -> None:
+        with self._lock:
+            self._latencies.setdefault(kind, deque(maxlen=self.window)).append(
+                seconds
+            )
+
+    @property
+    def count(self) -> int:
+        """Number of jobs recorded in the window, across kinds."""
+        with self._lock:
+            return sum(len(latencies) for latencies in self._latencies.values())
+
+    def stats(self) -> dict[str, dict[str, float]]:
+        """Number of jobs in the window, and p50 and p95 latency, per kind."""
+        with self._lock:
+            latencies = {
+                kind: np.array(values) for kind, values in self._latencies.items()
+            }
+        return {
+            kind: {
+                "count": len(values),
+                "p50_seconds": round(float(np.percentile(values, 50)), 3),
+                "p95_seconds": round(float(np.percentile(values, 95)), 3),
+            }
+            for kind, values in latencies.items()
+            if len(values)
+        }
+
+
+def process_rss_mb() -> Optional[float]:
+    """Resident memory of the current process, in MB."""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return round(pages * os.sysconf("SC_PAGE_SIZE") / 2**20, 1)
+    except (OSError, ValueError):
+        # Not Linux: fall back to the peak resident memory
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Reported in bytes on macOS, and in KB elsewhere
+        return round(max_rss / (2**20 if sys.platform == "darwin" else 2**10), 1)
+
+
+job_latencies = LatencyTracker()
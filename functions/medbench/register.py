@@ -1,3 +1,4 @@
+import importlib
 import logging
 from abc import ABC
 from typing import Any, ClassVar, Generic, MutableMapping, Type, TypeVar
@@ -22,12 +23,19 @@ class BaseRegistry(Generic[T], ABC):
     ```
     BaseFoo = FooRegister.get("base-foo")
     ```
+
+    Registers can list the modules registering their objects in `_plugins`.
+    These modules are imported on the first lookup of a name not registered
+    yet, so packages do not need to import them, and their dependencies,
+    until they are used.
     """
 
     # Be warned that we should not access "type" class variables while the type is still generic
     # https://github.com/python/mypy/issues/5144#issuecomment-439524567
     _registry: ClassVar[MutableMapping[str, Type[T]]] = dict()  # type: ignore
     _attrs_registry: ClassVar[MutableMapping[str, Any]] = dict()
+    _plugins: ClassVar[tuple[str, ...]] = ()
+    _plugins_loaded: ClassVar[bool] = False
 
     def __init_subclass__(cls, **kwargs):
         r"""Set TableType attribute at subclass creation.
@@ -53,6 +61,7 @@ class BaseRegistry(Generic[T], ABC):
         super().__init_subclass__(**kwargs)
         cls._registry = dict()
         cls._attrs_registry = dict()
+        cls._plugins_loaded = False
 
     @classmethod
     def manual_register(cls, name: str, medbench_class: Type[T], **kwargs) -> Type[T]:
@@ -74,6 +83,8 @@ class BaseRegistry(Generic[T], ABC):
     def get(cls, name: str) -> Type[T]:
         """Retrieve a registered class from its name."""
 
+        if name not in cls._registry:
+            cls._load_plugins()
         if name not in cls._registry:
             error_msg = (
                 f"Could not find object registered with name '{name}'. "
@@ -90,6 +101,8 @@ class BaseRegistry(Generic[T], ABC):
     def get_attr(cls, name: str, attr: str) -> Any:
         """Retrieve a registered class attribute from its name."""
         attr_key = f"{name}.{attr}"
+        if attr_key not in cls._attrs_registry:
+            cls._load_plugins()
         if attr_key not in cls._attrs_registry:
             error_msg = (
                 f"Could not find object registered with name '{attr_key}'. "
@@ -107,7 +120,19 @@ class BaseRegistry(Generic[T], ABC):
         for name, registered_class in cls._registry.items():
             if registered_class is medbench_class:
                 return name
+        if cls._load_plugins():
+            return cls.get_registered_name(medbench_class)
         raise KeyError(
             f"Could not find class {medbench_class.__name__} in registry. "
             "Make sure the class is registered before trying to retrieve its name."
         )
+
+    @classmethod
+    def _load_plugins(cls) -> bool:
+        """Import the plugin modules, once. Returns whether they were imported."""
+        if cls._plugins_loaded:
+            return False
+        cls._plugins_loaded = True
+        for module in cls._plugins:
+            importlib.import_module(module)
+        return True
@@ -0,0 +1,62 @@
+import os
+import threading
+from typing import Any, Optional
+
+import attrs
+
+from medbench.config import settings
+
+
+def connection_string() -> Optional[str]:
+    """Connection string of the storage account of caches and checkpoints.
+
+    `AZURE_STORAGE_CONNECTION_STRING` if set, or else `AzureWebJobsStorage`,
+    the account the function apps are deployed with and read jobs from.
+    """
+    return settings.azure_storage_connection_string or os.environ.get(
+        "AzureWebJobsStorage"
+    )
+
+
+@attrs.define
+class LazyContainerClient:
+    """`azure.storage.blob.ContainerClient` created on first use.
+
+    Module-level caches can then be built at import time without connecting
+    to, or even configuring, the storage account until a job uses them.
+
+    Attributes:
+        container_name (str): Name of the container.
+    """
+
+    container_name: str
+
+    _client: Any = attrs.field(init=False, default=None)
+    _lock: threading.Lock = attrs.field(init=False, factory=threading.Lock)
+
+    @property
+    def client(self) -> Any:
+        with self._lock:
+            if self._client is None:
+                from azure.storage.blob import ContainerClient
+
+                connection = connection_string()
+                if not connection:
+                    raise ValueError(
+                        "Set AZURE_STORAGE_CONNECTION_STRING or AzureWebJobsStorage "
+                        f"to use the {self.container_name} container."
+                    )
+                self._client = ContainerClient.from_connection_string(
+                    connection, container_name=self.container_name
+                )
+            return self._client
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("__"):
+            raise AttributeError(name)
+        return getattr(self.client, name)
+
+
+def container_client(container: Optional[str]) -> Optional[LazyContainerClient]:
+    """Client of a container of the storage account, or None if not set."""
+    return LazyContainerClient(container) if container else None
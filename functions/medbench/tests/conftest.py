@@ -0,0 +1,48 @@
+import json
+
+import pytest
+
+
+def text(data: str) -> dict:
+    return {"content": [{"type": "Text", "data": data}]}
+
+
+@pytest.fixture
+def make_job():
+    """Factory of serialized jobs, with text instances, references and results."""
+
+    def make(num_instances: int, metrics_type: str = "summarization") -> bytes:
+        return json.dumps(
+            {
+                "metrics_type": metrics_type,
+                "metrics": ["rouge"],
+                "model_run": {
+                    "id": "run",
+                    "model": {"name": "model", "version": "1"},
+                    "dataset": {
+                        "name": "dataset",
+                        "description": "Dataset",
+                        "instances": [
+                            {
+                                "id": f"id{i}",
+                                "input": text(f"Input {i}"),
+                                "references": [
+                                    {
+                                        "output": text(f"Reference {i}"),
+                                        "tags": ["Correct"],
+                                    }
+                                ],
+                                "split": "Test",
+                            }
+                            for i in range(num_instances)
+                        ],
+                    },
+                    "results": [
+                        {"input_id": f"id{i}", "completions": text(f"Prediction {i}")}
+                        for i in range(num_instances)
+                    ],
+                },
+            }
+        ).encode("utf-8")
+
+    return make
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from medbench.metrics import aggregate_metrics, aggregate_results, aggregate_statistics
+
+METRICS = [
+    {"rouge1": 0.5, "bleu": 0.1},
+    {"rouge1": 0.7, "bleu": "Error calculating bleu"},
+    {"rouge1": 0.9, "bleu": 0.3},
+    {"rouge1": 0.3},
+]
+
+
+def test_aggregate_metrics_skips_failures():
+    assert aggregate_metrics(METRICS) == {
+        "rouge1": pytest.approx(0.6),
+        "bleu": pytest.approx(0.2),
+    }
+
+
+def test_aggregate_metrics_drops_metrics_failing_everywhere():
+    assert aggregate_metrics([{"bleu": "error", "meteor": 1}]) == {"meteor": 1.0}
+
+
+def test_aggregate_statistics():
+    statistics = aggregate_statistics(METRICS, n_bootstrap=200)
+
+    rouge1 = statistics["rouge1"]
+    assert rouge1["count"] == 4
+    assert rouge1["failures"] == 0
+    assert rouge1["mean"] == pytest.approx(0.6)
+    assert rouge1["std"] == pytest.approx(np.std([0.5, 0.7, 0.9, 0.3], ddof=1))
+    assert rouge1["p50"] == pytest.approx(0.6)
+    assert 0.3 <= rouge1["ci_lower"] <= 0.6 <= rouge1["ci_upper"] <= 0.9
+
+    bleu = statistics["bleu"]
+    assert bleu["count"] == 2
+    assert bleu["failures"] == 2
+    assert 0.1 <= bleu["ci_lower"] <= bleu["ci_upper"] <= 0.3
+
+
+def test_aggregate_statistics_bootstrap_matches_resampling():
+    rng = np.random.default_rng(1)
+    values = rng.normal(0.5, 0.1, size=500)
+
+    statistics = aggregate_statistics(
+        [{"score": value} for value in values], n_bootstrap=2000
+    )
+
+    standard_error = values.std(ddof=1) / np.sqrt(len(values))
+    ci_width = statistics["score"]["ci_upper"] - statistics["score"]["ci_lower"]
+    assert ci_width == pytest.approx(2 * 1.96 * standard_error, rel=0.1)
+
+
+def test_aggregate_statistics_is_reproducible():
+    assert aggregate_statistics(METRICS) == aggregate_statistics(METRICS)
+
+
+def test_aggregate_statistics_undefined_values_are_none():
+    statistics = aggregate_statistics([{"bleu": "error"}, {"bleu": 0.2}])
+
+    assert statistics["bleu"]["std"] is None
+    assert statistics["bleu"]["mean"] == 0.2
+
+
+@pytest.mark.parametrize("metrics", [[], [{}], [{}, {}]])
+def test_aggregates_of_no_metrics_are_empty(metrics):
+    assert aggregate_metrics(metrics) == {}
+    assert aggregate_statistics(metrics) == {}
+
+
+def test_aggregates_numpy_scores():
+    metrics = [{"bleu": np.float32(0.5)}, {"bleu": np.int64(1)}]
+
+    assert aggregate_metrics(metrics) == {"bleu": 0.75}
+    assert aggregate_statistics(metrics)["bleu"]["count"] == 2
+
+
+def test_aggregate_results_matches_aggregates():
+    results = aggregate_results(METRICS)
+
+    assert results["aggregated_metrics"] == aggregate_metrics(METRICS)
+    assert results["aggregated_statistics"] == aggregate_statistics(METRICS)
+    assert type(results["aggregated_statistics"]["bleu"]["count"]) is int
+    assert type(results["aggregated_statistics"]["bleu"]["failures"]) is int
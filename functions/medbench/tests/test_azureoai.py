@@ -0,0 +1,151 @@
+import asyncio
+import random
+from types import SimpleNamespace
+
+from medbench.datasets import Data, Dataset, Instance
+from medbench.models import ModelRun, OpenAIChatModel, OpenAIReasoningModel
+from medbench.models import azureoai
+from medbench.models.azureoai import AzureOpenAIRunner
+from medbench.models.cache import ResponseCache
+from medbench.models.clients import OpenAIClientPool
+from medbench.models.localserver import LocalOpenAIServer
+
+
+class FakeAsyncClient:
+    """Async client completing prompts with their text, in random order."""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.chat = SimpleNamespace(
+            completions=SimpleNamespace(
+                with_raw_response=SimpleNamespace(create=self.create)
+            )
+        )
+
+    async def create(self, messages, **kwargs):
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(random.uniform(0, 0.01))
+            text = messages[1]["content"][0]["text"]
+            if text == "Input 3":
+                raise ValueError("Connection reset")
+            message = SimpleNamespace(content=f"Completed {text}")
+            completion = SimpleNamespace(
+                choices=[SimpleNamespace(message=message, finish_reason="stop")]
+            )
+            return SimpleNamespace(headers={}, parse=lambda: completion)
+        finally:
+            self.in_flight -= 1
+
+
+def model_run(num_instances):
+    return ModelRun(
+        id="run",
+        model=OpenAIReasoningModel(
+            name="gpt-4o",
+            version="2024-05-01-preview",
+            endpoint="https://example.openai.azure.com/",
+            api_key="key",
+            system_prompt="",
+            max_tokens=100,
+        ),
+        dataset=Dataset(
+            name="dataset",
+            description="Dataset",
+            instances=[
+                Instance(
+                    id=f"id{i}",
+                    input=Data.from_text(data=f"Input {i}"),
+                    references=[],
+                    split="Test",
+                )
+                for i in range(num_instances)
+            ],
+        ),
+    )
+
+
+def test_arun_completes_concurrently_in_instance_order(monkeypatch):
+    client = FakeAsyncClient()
+    monkeypatch.setattr(OpenAIClientPool, "get_async", lambda self, **kwargs: client)
+    run = model_run(20)
+    runner = AzureOpenAIRunner(max_concurrency=4)
+    runner.setup(run)
+
+    asyncio.run(runner.arun())
+
+    assert [result.input_id for result in run.results] == [
+        f"id{i}" for i in range(20)
+    ]
+    assert run.results[0].completions.get_text() == "Completed Input 0"
+    assert run.results[3].completions is None
+    assert run.results[3].finish_reason == "error"
+    assert run.results[3].error == "Connection reset"
+    assert 1 < client.max_in_flight <= 4
+
+
+def test_run_reads_repeated_completions_from_cache(monkeypatch, tmp_path):
+    client = FakeAsyncClient()
+    monkeypatch.setattr(OpenAIClientPool, "get_async", lambda self, **kwargs: client)
+    cache = ResponseCache(path=str(tmp_path / "responses.sqlite"))
+    monkeypatch.setattr(azureoai, "response_cache", cache)
+
+    first, second = model_run(5), model_run(5)
+    for run in (first, second):
+        runner = AzureOpenAIRunner()
+        runner.setup(run)
+        asyncio.run(runner.arun())
+
+    # The failed completion is not cached, so it is requested again
+    assert cache.stats()["hits"] == 4
+    assert cache.stats()["misses"] == 6
+    assert [result.completions for result in second.results] == [
+        result.completions for result in first.results
+    ]
+    assert second.results[0].metadata == {"cached": True}
+    assert second.results[3].error == "Connection reset"
+
+
+def test_streamed_completions_record_latency():
+    def chat_model_run(endpoint, stream):
+        run = model_run(3)
+        run.model = OpenAIChatModel(
+            name="gpt-4o",
+            version="2024-10-21",
+            endpoint=endpoint,
+            api_key="local",
+            system_prompt="",
+            max_tokens=100,
+            temperature=0.0,
+            top_p=1.0,
+            stream=stream,
+        )
+        return run
+
+    with LocalOpenAIServer(latency_seconds=0.02, chunk_seconds=0.01) as server:
+        completed = chat_model_run(server.endpoint, stream=False)
+        streamed = chat_model_run(server.endpoint, stream=True)
+        streamed_async = chat_model_run(server.endpoint, stream=True)
+        for run in (completed, streamed, streamed_async):
+            runner = AzureOpenAIRunner(use_cache=False)
+            runner.setup(run)
+            if run is streamed_async:
+                asyncio.run(runner.arun())
+            else:
+                runner.run()
+
+    for run in (streamed, streamed_async):
+        for result, expected in zip(run.results, completed.results):
+            assert result.completions == expected.completions
+            assert result.finish_reason == "stop"
+            assert result.metadata["usage"] == expected.metadata["usage"]
+            latency = result.metadata["latency"]
+            assert 0.02 <= latency["time_to_first_token_seconds"]
+            assert latency["time_to_first_token_seconds"] < latency["total_seconds"]
+            assert latency["tokens_per_second"] > 0
+    assert set(completed.results[0].metadata["latency"]) == {
+        "total_seconds",
+        "tokens_per_second",
+    }
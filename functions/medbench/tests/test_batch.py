@@ -0,0 +1,82 @@
+from medbench.datasets import Data, Dataset, Instance
+from medbench.models import ModelRun, OpenAIChatModel
+from medbench.models.azureoai import AzureOpenAIRunner
+from medbench.models.batch import AzureOpenAIBatchRunner, run_report
+from medbench.models.localserver import LocalOpenAIServer, echo_responder
+
+
+def responder(body):
+    text = echo_responder(body)
+    if text == "Input 2":
+        raise ValueError("Content filtered")
+    return f"Completed {text}"
+
+
+def model_run(endpoint, num_instances=5):
+    return ModelRun(
+        id="run",
+        model=OpenAIChatModel(
+            name="gpt-4o-batch",
+            version="2024-10-21",
+            endpoint=endpoint,
+            api_key="local",
+            system_prompt="",
+            max_tokens=100,
+            temperature=0.0,
+            top_p=1.0,
+        ),
+        dataset=Dataset(
+            name="dataset",
+            description="Dataset",
+            instances=[
+                Instance(
+                    id=f"id{i}",
+                    input=Data.from_text(data=f"Input {i}"),
+                    references=[],
+                    split="Test",
+                )
+                for i in range(num_instances)
+            ],
+        ),
+    )
+
+
+def test_batch_runner_maps_outputs_by_custom_id():
+    with LocalOpenAIServer(responder=responder) as server:
+        run = model_run(server.endpoint)
+        runner = AzureOpenAIBatchRunner(use_cache=False, poll_seconds=0.01)
+        runner.setup(run)
+        runner.run()
+
+        assert len(server.batches) == 1
+        # Input, output and error files are deleted once read
+        assert server.files == {}
+
+    assert [result.input_id for result in run.results] == [
+        f"id{i}" for i in range(5)
+    ]
+    assert run.results[0].completions.get_text() == "Completed Input 0"
+    assert run.results[0].metadata["usage"]["total_tokens"] > 0
+    assert run.results[2].finish_reason == "error"
+    assert run.results[2].error == "Content filtered"
+
+
+def test_batch_and_online_modes_match():
+    with LocalOpenAIServer(responder=responder) as server:
+        runs = {}
+        for mode, runner in (
+            ("online", AzureOpenAIRunner(use_cache=False)),
+            ("batch", AzureOpenAIBatchRunner(use_cache=False, poll_seconds=0.01)),
+        ):
+            runs[mode] = model_run(server.endpoint)
+            runner.setup(runs[mode])
+            runner.run()
+
+    assert [result.completions for result in runs["batch"].results] == [
+        result.completions for result in runs["online"].results
+    ]
+    online = run_report("online", runs["online"], 1.0, input_price=2.0)
+    batch = run_report("batch", runs["batch"], 1.0, input_price=2.0, discount=0.5)
+    assert online["failed"] == batch["failed"] == 1
+    assert batch["prompt_tokens"] == online["prompt_tokens"] > 0
+    assert batch["estimated_cost"] == online["estimated_cost"] / 2
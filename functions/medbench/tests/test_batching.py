@@ -0,0 +1,132 @@
+import attrs
+import pytest
+
+from medbench.datasets import Data
+from medbench.metrics import Metric
+from medbench.metrics.text_summarization import (
+    BleuMetric,
+    MeteorMetric,
+    Rouge1Metric,
+    RougeLMetric,
+)
+
+REFERENCES = [
+    ["Patient is a 65-year-old male diagnosed with stage II lung cancer."],
+    [
+        "Fever and cough for two weeks.",
+        "The patient has had a cough and a fever for two weeks.",
+    ],
+    ["No acute distress."],
+    ["Blood pressure is 120/80 mmHg."],
+]
+PREDICTIONS = [
+    "The patient, a 65-year-old male, was diagnosed with lung cancer.",
+    "Patient running a fever, coughing for two weeks.",
+    "Distress",
+    "",
+]
+
+
+def pairs() -> tuple[list[list[Data]], list[Data]]:
+    ground_truths = [[Data.from_text(data=text) for text in gts] for gts in REFERENCES]
+    predictions = [Data.from_text(data=text) for text in PREDICTIONS]
+    return ground_truths, predictions
+
+
+def setup_or_skip(metric_cls):
+    # `evaluate` modules are downloaded from the Hugging Face Hub on first use
+    try:
+        return metric_cls.setup()
+    except Exception as e:
+        pytest.skip(f"{metric_cls.__name__} backend unavailable: {e}")
+
+
+@attrs.define
+class FlakyBatchMetric(Metric):
+    """Scores the prediction length, failing in batched mode."""
+
+    batch_calls: int = 0
+
+    @classmethod
+    def setup(cls) -> "FlakyBatchMetric":
+        return cls()
+
+    def _calculate(self, ground_truths, prediction) -> float:
+        if prediction.get_text() == "fail":
+            raise ValueError("Faulty instance")
+        return float(len(prediction.get_text()))
+
+    def _calculate_batch(self, ground_truths, predictions) -> list[float]:
+        self.batch_calls += 1
+        raise RuntimeError("Batched call failed")
+
+
+def test_failed_batch_falls_back_to_each_instance():
+    metric = FlakyBatchMetric.setup()
+    ground_truths, predictions = pairs()
+
+    scores = metric.calculate_batch(ground_truths, predictions)
+
+    assert metric.batch_calls == 1
+    assert scores == [
+        metric.calculate(gts, prediction)
+        for gts, prediction in zip(ground_truths, predictions)
+    ]
+
+
+def test_faulty_instance_fails_as_in_per_instance_mode():
+    metric = FlakyBatchMetric.setup()
+    ground_truths, predictions = pairs()
+    predictions[1] = Data.from_text(data="fail")
+
+    with pytest.raises(ValueError, match="Faulty instance"):
+        metric.calculate(ground_truths[1], predictions[1])
+    with pytest.raises(ValueError, match="Faulty instance"):
+        metric.calculate_batch(ground_truths, predictions)
+
+
+def test_batch_rejects_mismatched_pairs():
+    ground_truths, predictions = pairs()
+
+    with pytest.raises(ValueError):
+        FlakyBatchMetric.setup().calculate_batch(ground_truths[:2], predictions)
+    assert FlakyBatchMetric.setup().calculate_batch([], []) == []
+
+
+def test_bleu_batch_matches_corpus_bleu_of_each_pair():
+    sacrebleu = pytest.importorskip("sacrebleu")
+    ground_truths, predictions = pairs()
+
+    scores = BleuMetric(metric=None).calculate_batch(ground_truths, predictions)
+
+    # What `evaluate`'s sacrebleu computes for a single pair
+    assert scores == pytest.approx(
+        [
+            sacrebleu.corpus_bleu(
+                [prediction], [[ref] for ref in references], use_effective_order=True
+            ).score
+            / 100
+            for references, prediction in zip(REFERENCES, PREDICTIONS)
+        ]
+    )
+
+
+@pytest.mark.parametrize(
+    "metric_cls", [BleuMetric, MeteorMetric, Rouge1Metric, RougeLMetric]
+)
+def test_batch_matches_per_instance_evaluate(metric_cls):
+    metric = setup_or_skip(metric_cls)
+    ground_truths, predictions = pairs()
+    try:
+        expected = [
+            metric.calculate(gts, prediction)
+            for gts, prediction in zip(ground_truths, predictions)
+        ]
+    except LookupError as e:
+        # NLTK data (e.g. WordNet) is missing
+        pytest.skip(str(e))
+
+    # The batched path itself, not its per-instance fallback
+    assert metric._calculate_batch(ground_truths, predictions) == pytest.approx(
+        expected
+    )
@@ -0,0 +1,169 @@
+import os
+import time
+
+import numpy as np
+import pytest
+
+from medbench.metrics.bertscore import (
+    BertScoreEngine,
+    EmbeddingCache,
+    greedy_cosine_f1,
+)
+
+
+def _embedding(rows: int, seed: int) -> np.ndarray:
+    embedding = np.random.default_rng(seed).normal(size=(rows, 8)).astype(np.float32)
+    return embedding / np.linalg.norm(embedding, axis=-1, keepdims=True)
+
+
+def test_embedding_cache_persists_to_disk(tmp_path):
+    embedding = _embedding(5, seed=0)
+    key = EmbeddingCache.key("model/9", "some text")
+
+    EmbeddingCache(cache_dir=str(tmp_path)).put(key, embedding)
+    cached = EmbeddingCache(cache_dir=str(tmp_path)).get(key)
+
+    assert isinstance(cached, np.memmap)
+    np.testing.assert_array_equal(cached, embedding)
+
+
+def test_embedding_cache_evicts_least_recently_used():
+    cache = EmbeddingCache(max_memory_mb=1)
+    embedding = np.zeros((2**20 // 4 // 3, 1), dtype=np.float32)  # ~1/3 MB
+
+    for key in ["a", "b", "c"]:
+        cache.put(key, embedding)
+    cache.get("a")
+    cache.put("d", embedding)
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.stats()["entries"] == 3
+
+
+def test_embedding_cache_evicts_least_recently_loaded_from_disk(tmp_path):
+    cache = EmbeddingCache(cache_dir=str(tmp_path), max_disk_mb=1)
+    embedding = np.zeros((2**20 // 4 // 4, 1), dtype=np.float32)  # ~1/4 MB
+
+    for key in ["aa", "bb", "cc"]:
+        cache.put(key, embedding)
+    # "aa" is loaded again, e.g. by another worker, so "bb" is the least recent
+    now = time.time()
+    for key, atime in [("aa", now - 60), ("bb", now - 30), ("cc", now - 10)]:
+        os.utime(tmp_path / key[:2] / f"{key}.npy", (atime, atime))
+    EmbeddingCache(cache_dir=str(tmp_path)).get("aa")
+    cache.put("dd", embedding)
+
+    assert sorted(path.stem for path in tmp_path.glob("*/*.npy")) == ["aa", "cc", "dd"]
+    assert cache.stats()["disk_mb"] <= 0.9
+
+
+def test_greedy_cosine_f1_identical_texts():
+    embedding = _embedding(6, seed=1)
+
+    assert greedy_cosine_f1(embedding, embedding) == pytest.approx(1.0)
+
+
+def test_greedy_cosine_f1_empty_text():
+    assert greedy_cosine_f1(_embedding(2, seed=2), _embedding(6, seed=3)) == 0.0
+
+
+def test_engine_only_encodes_uncached_texts(mocker):
+    engine = BertScoreEngine(model_type="bert-base-uncased", num_layers=9)
+    encode = mocker.patch.object(
+        BertScoreEngine,
+        "_encode",
+        side_effect=lambda texts: [_embedding(4, seed=len(t)) for t in texts],
+    )
+
+    engine.score(["prediction a"], [["reference", "other reference"]])
+    engine.score(["prediction b"], [["reference"]])
+
+    assert encode.call_args_list == [
+        mocker.call(["reference", "other reference"]),
+        mocker.call(["prediction a"]),
+        mocker.call(["prediction b"]),
+    ]
+
+
+def test_length_buckets_respect_token_budget():
+    engine = BertScoreEngine(num_layers=9, batch_size=3, max_batch_tokens=100)
+    lengths = [10, 50, 12, 40, 11, 9, 30]
+
+    batches = engine._length_buckets(lengths)
+
+    assert batches == [[1, 3], [6, 2, 4], [0, 5]]
+    for batch in batches:
+        assert len(batch) * max(lengths[i] for i in batch) <= 100
+
+
+def _tiny_bert(tmp_path):
+    torch = pytest.importorskip("torch")
+    from transformers import BertConfig, BertModel, BertTokenizer
+
+    words = "the patient has chest pain fever cough no acute findings".split()
+    vocab = tmp_path / "vocab.txt"
+    vocab.write_text("\n".join(["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + words))
+    tokenizer = BertTokenizer(str(vocab), model_max_length=512)
+    torch.manual_seed(0)
+    model = BertModel(
+        BertConfig(
+            vocab_size=len(tokenizer),
+            hidden_size=32,
+            num_hidden_layers=2,
+            num_attention_heads=2,
+            intermediate_size=64,
+        )
+    )
+    return model.eval(), tokenizer
+
+
+def test_engine_matches_bert_score(tmp_path):
+    bert_score = pytest.importorskip("bert_score")
+    model, tokenizer = _tiny_bert(tmp_path)
+    model_type = str(tmp_path / "model")
+    model.save_pretrained(model_type)
+    tokenizer.save_pretrained(model_type)
+    predictions = ["the patient has chest pain", "no acute findings", "fever cough"]
+    references = [
+        ["chest pain no fever"],
+        ["the patient has no acute findings", "no findings"],
+        ["cough", "fever", "the patient has fever"],
+    ]
+
+    engine = BertScoreEngine(
+        model_type=model_type, num_layers=2, cache=EmbeddingCache()
+    )
+    scorer = bert_score.BERTScorer(model_type=model_type, num_layers=2, device="cpu")
+    _, _, f1 = scorer.score(predictions, references)
+
+    assert engine.score(predictions, references) == pytest.approx(
+        f1.tolist(), abs=1e-5
+    )
+
+
+def test_onnx_backend_matches_torch(tmp_path):
+    pytest.importorskip("onnxruntime")
+    from medbench.metrics.bertscore_onnx import export_onnx_encoder, measure_accuracy
+
+    model, tokenizer = _tiny_bert(tmp_path)
+    model_dir = str(tmp_path / "onnx")
+    export_onnx_encoder(model, tokenizer, model_dir, "bert-base-uncased", 9)
+    torch_engine = BertScoreEngine(num_layers=9, cache=EmbeddingCache())
+    torch_engine._model, torch_engine._tokenizer = model.eval(), tokenizer
+    onnx_engine = BertScoreEngine(
+        backend="onnx", onnx_model_dir=model_dir, cache=EmbeddingCache()
+    ).load()
+
+    accuracy = measure_accuracy(
+        onnx_engine,
+        torch_engine,
+        [
+            ("the patient has chest pain", "chest pain no fever"),
+            ("no acute findings", "the patient has no acute findings"),
+            ("fever cough", "cough"),
+        ],
+    )
+
+    assert onnx_engine.namespace != torch_engine.namespace
+    assert accuracy["max_abs_delta"] < 0.02
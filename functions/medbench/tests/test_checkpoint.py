@@ -0,0 +1,121 @@
+import asyncio
+
+from medbench.config import settings
+from medbench.datasets import CORRECT_TAG, Data, Dataset, Instance, Reference
+from medbench.evaluators import TBFactEvaluatorRunner
+from medbench.metrics.checkpoint import MetricCheckpoint
+from medbench.models import ModelOutput, ModelRun, SystemPromptModel
+
+
+class FakeContainer:
+    def __init__(self):
+        self.blobs = {}
+
+    def upload_blob(self, name, data, overwrite=False):
+        self.blobs[name] = data
+
+    def download_blob(self, name):
+        from azure.core.exceptions import ResourceNotFoundError
+
+        if name not in self.blobs:
+            raise ResourceNotFoundError(name)
+        data = self.blobs[name]
+        return type("Download", (), {"readall": lambda self: data})()
+
+    def delete_blob(self, name):
+        del self.blobs[name]
+
+
+def test_checkpoint_resumes_from_local_file(tmp_path):
+    checkpoint = MetricCheckpoint("job.json.0123", directory=str(tmp_path))
+    checkpoint.add({"id0": {"score": 0.5}})
+    checkpoint.add({"id1": {"score": 1.0}})
+    # The previous attempt was stopped while writing a result
+    with open(checkpoint.path, "a") as f:
+        f.write('{"id": "id2", "res')
+
+    resumed = MetricCheckpoint("job.json.0123", directory=str(tmp_path))
+
+    assert resumed.load() == {"id0": {"score": 0.5}, "id1": {"score": 1.0}}
+    resumed.clear()
+    assert MetricCheckpoint("job.json.0123", directory=str(tmp_path)).load() == {}
+
+
+def test_checkpoint_uploads_every_interval():
+    container = FakeContainer()
+    checkpoint = MetricCheckpoint("job", blob_container=container, interval=2)
+
+    checkpoint.add({"id0": {"score": 0.5}})
+    assert container.blobs == {}
+    checkpoint.add({"id1": {"score": 1.0}})
+    checkpoint.add({"id2": {"score": 0.0}})
+    assert MetricCheckpoint("job", blob_container=container).load() == {
+        "id0": {"score": 0.5},
+        "id1": {"score": 1.0},
+    }
+
+    checkpoint.flush()
+    assert len(MetricCheckpoint("job", blob_container=container).load()) == 3
+    checkpoint.clear()
+    assert container.blobs == {}
+
+
+def test_tbfact_runner_resumes_completed_results():
+    model_run = ModelRun(
+        id="run",
+        model=SystemPromptModel(name="model", version="1", system_prompt=""),
+        dataset=Dataset(
+            name="dataset",
+            description="Dataset",
+            instances=[
+                Instance(
+                    id=f"id{i}",
+                    input=Data.from_text(data=f"Input {i}"),
+                    references=[
+                        Reference(
+                            output=Data.from_text(data=f"Truth {i}"),
+                            tags=[CORRECT_TAG],
+                        )
+                    ],
+                    split="Test",
+                )
+                for i in range(3)
+            ],
+        ),
+        results=[
+            ModelOutput(input_id=f"id{i}", completions=Data.from_text(data=f"Out {i}"))
+            for i in range(3)
+        ],
+    )
+    evaluated, checkpointed = [], {}
+
+    async def evaluate(generated_text, reference_text, reference_id):
+        evaluated.append(reference_id)
+        return {"score": 1.0, "explanation": "", "details": {}}
+
+    runner = TBFactEvaluatorRunner(
+        predictions_model_run=model_run,
+        evaluator=SystemPromptModel(name="judge", version="1", system_prompt=""),
+        evaluator_runner=object(),
+        batch_size=2,
+        completed_results={"id1": {"score": 0.5, "explanation": "", "details": {}}},
+        on_batch_complete=checkpointed.update,
+    )
+    runner.tbfact.evaluate = evaluate
+
+    results = asyncio.run(runner.evaluate())
+
+    assert evaluated == ["id0", "id2"]
+    assert [result["score"] for result in results] == [1.0, 0.5, 1.0]
+    assert sorted(checkpointed) == ["id0", "id2"]
+    assert len(runner.tbfact_evaluation_model_run.results) == 3
+
+
+def test_blob_checkpoints_use_function_app_storage(monkeypatch):
+    monkeypatch.setattr(settings, "metrics_checkpoint_blob_container", "checkpoints")
+    monkeypatch.setattr(settings, "azure_storage_connection_string", None)
+    monkeypatch.setenv("AzureWebJobsStorage", "UseDevelopmentStorage=true")
+
+    checkpoint = MetricCheckpoint.for_job("job.json", "0" * 64)
+
+    assert checkpoint.blob_container.client.container_name == "checkpoints"
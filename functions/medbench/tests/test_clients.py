@@ -0,0 +1,99 @@
+import asyncio
+
+import pytest
+
+from medbench.aio import EventLoopThread
+from medbench.models.clients import OpenAIClientPool
+
+DEPLOYMENT = {
+    "endpoint": "https://example.openai.azure.com/",
+    "deployment": "gpt-4o",
+    "api_version": "2024-05-01-preview",
+    "api_key": "key",
+}
+
+
+def test_client_pool_reuses_clients_per_deployment():
+    pool = OpenAIClientPool()
+
+    client = pool.get(**DEPLOYMENT)
+
+    assert pool.get(**DEPLOYMENT) is client
+    assert pool.get(**{**DEPLOYMENT, "deployment": "gpt-4.1"}) is not client
+    assert pool.get(**{**DEPLOYMENT, "api_key": "other"}) is not client
+    async_client = pool.get_async(**DEPLOYMENT)
+    assert async_client is not client
+    assert pool.get_async(**DEPLOYMENT) is async_client
+
+
+def test_event_loop_is_reused_across_runs():
+    event_loop = EventLoopThread()
+
+    async def current_loop():
+        return asyncio.get_running_loop()
+
+    try:
+        loop = event_loop.run(current_loop())
+        assert event_loop.run(current_loop()) is loop
+        assert not loop.is_closed()
+    finally:
+        event_loop.stop()
+
+
+def test_event_loop_cannot_wait_on_itself():
+    event_loop = EventLoopThread()
+
+    async def nested():
+        event_loop.run(asyncio.sleep(0))
+
+    try:
+        with pytest.raises(RuntimeError, match="await it instead"):
+            event_loop.run(nested())
+    finally:
+        event_loop.stop()
+
+
+def test_warm_up_connects_async_client_on_event_loop(monkeypatch):
+    from medbench import aio
+    from medbench.config import settings
+    from medbench.models import clients
+    from medbench.models.localserver import LocalOpenAIServer
+
+    pool = OpenAIClientPool()
+    monkeypatch.setattr(clients, "openai_client_pool", pool)
+
+    with LocalOpenAIServer() as server:
+        endpoint = server.endpoint
+        monkeypatch.setattr(settings, "azure_openai_endpoint", endpoint)
+        monkeypatch.setattr(settings, "azure_openai_deployment", "gpt-4o")
+        monkeypatch.setattr(settings, "azure_openai_version", "2024-05-01-preview")
+        monkeypatch.setattr(settings, "azure_openai_api_key", "local")
+        info = clients.warm_up_clients()
+
+        async def get_async():
+            return pool.get_async(
+                endpoint=endpoint,
+                deployment="gpt-4o",
+                api_version="2024-05-01-preview",
+                api_key="local",
+            )
+
+        client = aio.run(get_async())
+
+    assert info["connected"]
+    # The client runners get on the event loop is the connected one
+    assert pool.stats()["connected"] == [f"async:gpt-4o@{endpoint}"]
+    assert pool.stats()["clients"] == [f"async:gpt-4o@{endpoint}"]
+    assert aio.run(get_async()) is client
+
+
+def test_warm_up_reports_unconfigured_clients_as_not_connected(monkeypatch):
+    from medbench.config import settings
+    from medbench.models import clients
+
+    pool = OpenAIClientPool()
+    monkeypatch.setattr(clients, "openai_client_pool", pool)
+    monkeypatch.setattr(settings, "azure_openai_endpoint", None)
+
+    assert not clients.warm_up_clients()["connected"]
+    assert pool.stats()["connected"] == []
@@ -0,0 +1,77 @@
+import pytest
+
+from medbench.datasets import Data, Dataset, Instance, Reference
+from medbench.metrics import read_instance_metrics
+from medbench.metrics.columnar import dump_instance_metrics, instance_metrics_table
+from medbench.models import ModelRun, SystemPromptModel
+
+
+def model_run(run_id, num_instances=2):
+    return ModelRun(
+        id=run_id,
+        model=SystemPromptModel(name="model", version="1", system_prompt=""),
+        dataset=Dataset(
+            name="dataset",
+            description="Dataset",
+            instances=[
+                Instance(
+                    id=f"id{i}",
+                    input=Data.from_text(data=f"Input {i}"),
+                    references=[Reference(output=Data.from_text(data=f"Truth {i}"))],
+                    split="Test",
+                )
+                for i in range(num_instances)
+            ],
+        ),
+    )
+
+
+def test_instance_metrics_table():
+    table = instance_metrics_table(
+        model_run("run"),
+        [{"rouge1": 0.5, "bleu": 0.25}, {"rouge1": "Error: timeout", "bleu": None}],
+    )
+
+    rows = table.to_pylist()
+    assert [(row["instance_id"], row["metric"]) for row in rows] == [
+        ("id0", "rouge1"),
+        ("id0", "bleu"),
+        ("id1", "rouge1"),
+        ("id1", "bleu"),
+    ]
+    assert [row["value"] for row in rows] == [0.5, 0.25, None, None]
+    assert [row["error"] for row in rows] == [None, None, "Error: timeout", None]
+    assert {(row["run_id"], row["model"], row["split"]) for row in rows} == {
+        ("run", "model", "Test")
+    }
+
+
+@pytest.mark.parametrize("format", ["parquet", "arrow"])
+def test_read_instance_metrics_of_many_runs(tmp_path, format):
+    for i in range(3):
+        table = instance_metrics_table(
+            model_run(f"run{i}"), [{"rouge1": i / 10}, {"rouge1": 1.0}]
+        )
+        path = tmp_path / "runs" / f"run{i}.{format}"
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(dump_instance_metrics(table, format=format))
+
+    table = read_instance_metrics(str(tmp_path))
+
+    assert table.num_rows == 6
+    means = table.group_by("run_id").aggregate([("value", "mean")]).to_pydict()
+    assert {
+        str(run_id): round(mean, 2)
+        for run_id, mean in zip(means["run_id"], means["value_mean"])
+    } == {
+        "run0": 0.5,
+        "run1": 0.55,
+        "run2": 0.6,
+    }
+
+
+def test_read_instance_metrics_without_files(tmp_path):
+    table = read_instance_metrics(str(tmp_path / "*.parquet"))
+
+    assert table.num_rows == 0
+    assert "value" in table.schema.names
@@ -0,0 +1,179 @@
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+from medbench.config import settings
+from medbench.dedup import JobDeduplicator, content_hash
+
+
+class FakeLease:
+    def __init__(self, blob):
+        self.blob = blob
+
+    def renew(self):
+        pass
+
+    def release(self):
+        self.blob.leased = False
+
+
+class FakeBlob:
+    def __init__(self):
+        self.leased = False
+        self.lock = threading.Lock()
+
+    def upload_blob(self, data, overwrite=False):
+        pass
+
+    def acquire_lease(self, lease_duration):
+        from azure.core.exceptions import HttpResponseError
+
+        with self.lock:
+            if self.leased:
+                error = HttpResponseError(message="LeaseAlreadyPresent")
+                error.status_code = 409
+                raise error
+            self.leased = True
+            return FakeLease(self)
+
+
+class FakeContainer:
+    def __init__(self):
+        self.blobs = {}
+        self.locks = {}
+
+    def get_blob_client(self, name):
+        return self.locks.setdefault(name, FakeBlob())
+
+    def upload_blob(self, name, data, overwrite=False, last_modified=None):
+        self.blobs[name] = (data, last_modified or datetime.now(timezone.utc))
+
+    def download_blob(self, name):
+        from azure.core.exceptions import ResourceNotFoundError
+
+        if name not in self.blobs:
+            raise ResourceNotFoundError(name)
+        data, last_modified = self.blobs[name]
+        return SimpleNamespace(
+            properties=SimpleNamespace(last_modified=last_modified),
+            readall=lambda: data,
+        )
+
+
+def test_content_hash_ignores_key_order():
+    assert content_hash({"a": 1, "b": [1, {"c": 2, "d": 3}]}) == content_hash(
+        {"b": [1, {"d": 3, "c": 2}], "a": 1}
+    )
+    assert content_hash({"a": 1}) != content_hash({"a": 2})
+    assert content_hash({"a": 1}, "gpt-4o") != content_hash({"a": 1}, "gpt-4.1")
+
+
+def test_claim_reuses_stored_result(tmp_path):
+    deduplicator = JobDeduplicator(directory=str(tmp_path))
+
+    with deduplicator.claim("key") as claim:
+        assert claim.result is None
+        claim.set({"aggregated_metrics": {"rouge1": 0.5}})
+
+    # A later duplicate, e.g. on a restarted worker
+    with JobDeduplicator(directory=str(tmp_path)).claim("key") as claim:
+        assert claim.result == {"aggregated_metrics": {"rouge1": 0.5}}
+
+
+def test_concurrent_duplicates_across_workers_compute_once():
+    container = FakeContainer()
+    computed, results = [], []
+
+    def run_job():
+        # Each thread stands for a worker, sharing only the blob container
+        deduplicator = JobDeduplicator(blob_container=container, poll_seconds=0.01)
+        with deduplicator.claim("key") as claim:
+            if claim.result is None:
+                time.sleep(0.1)
+                computed.append(1)
+                claim.set({"score": 1.0})
+            results.append(claim.result)
+
+    threads = [threading.Thread(target=run_job) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(computed) == 1
+    assert results == [{"score": 1.0}] * 4
+
+
+def test_released_claims_drop_their_lock(tmp_path):
+    deduplicator = JobDeduplicator(directory=str(tmp_path))
+
+    for key in ("a", "b"):
+        with deduplicator.claim(key) as claim:
+            assert list(deduplicator._locks) == [key]
+            claim.set({"score": 1.0})
+
+    assert deduplicator._locks == {}
+
+
+def test_failed_claim_is_computed_by_next_duplicate():
+    container = FakeContainer()
+    deduplicator = JobDeduplicator(blob_container=container)
+
+    try:
+        with deduplicator.claim("key"):
+            raise RuntimeError("Rate limited")
+    except RuntimeError:
+        pass
+
+    with deduplicator.claim("key") as claim:
+        assert claim.result is None
+
+
+def test_expired_results_are_computed_again(tmp_path):
+    container = FakeContainer()
+    deduplicator = JobDeduplicator(
+        directory=str(tmp_path), blob_container=container, ttl_seconds=3600
+    )
+    deduplicator.put("key", {"score": 1.0})
+    path = tmp_path / "key.json"
+    created_at = time.time() - 7200
+    os.utime(path, (created_at, created_at))
+
+    # Expired in the container too
+    data, _ = container.blobs["key.json"]
+    expired_at = datetime.now(timezone.utc) - timedelta(hours=2)
+    container.upload_blob("key.json", data, last_modified=expired_at)
+
+    assert deduplicator.get("key") is None
+    assert not path.exists()
+
+
+def test_least_recently_used_results_are_evicted(tmp_path):
+    deduplicator = JobDeduplicator(directory=str(tmp_path), max_size_mb=1)
+    result = {"values": "x" * 300_000}
+    for key in ("a", "b", "c"):
+        deduplicator.put(key, result)
+    # "a" is used again, so "b" is the least recently used
+    now = time.time()
+    os.utime(tmp_path / "b.json", (now - 60, now))
+    deduplicator.get("a")
+
+    deduplicator.put("d", result)
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "a.json",
+        "c.json",
+        "d.json",
+    ]
+
+
+def test_blob_container_uses_function_app_storage(monkeypatch):
+    monkeypatch.setattr(settings, "job_dedup_blob_container", "dedup")
+    monkeypatch.setattr(settings, "azure_storage_connection_string", None)
+    monkeypatch.setenv("AzureWebJobsStorage", "UseDevelopmentStorage=true")
+
+    deduplicator = JobDeduplicator.from_settings("metrics")
+
+    assert deduplicator.blob_container.client.container_name == "dedup"
@@ -0,0 +1,68 @@
+import importlib.util
+import json
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from medbench.config import settings
+from medbench.datasets import Data
+from medbench.dedup import JobDeduplicator
+
+EVALUATOR_APP = os.path.join(
+    os.path.dirname(__file__), "..", "..", "addons", "evaluator", "function_app.py"
+)
+
+
+@pytest.fixture
+def evaluator_app(monkeypatch, tmp_path):
+    spec = importlib.util.spec_from_file_location("evaluator_app", EVALUATOR_APP)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+
+    deduplicator = JobDeduplicator(directory=str(tmp_path))
+    monkeypatch.setattr(module, "_job_deduplicator", lambda: deduplicator)
+    for name in ("deployment", "version", "endpoint", "api_key"):
+        monkeypatch.setattr(settings, f"azure_openai_{name}", "local")
+    return module
+
+
+def evaluated(error=None):
+    results = [
+        SimpleNamespace(
+            input_id="id0", error=error, completions=Data.from_text(data="Score: 4")
+        )
+    ]
+    return SimpleNamespace(
+        questions_generator_runner=SimpleNamespace(_model_run=None),
+        evaluator_runner=SimpleNamespace(
+            _model_run=SimpleNamespace(id="run-evaluation", results=results)
+        ),
+    )
+
+
+def evaluate(evaluator_app, make_job, evaluator):
+    async def run_summary_evaluator(*args, **kwargs):
+        return evaluator
+
+    evaluator_app.run_summary_evaluator = run_summary_evaluator
+    data = make_job(1)
+    outputs = []
+    evaluator_app.summary_evaluator(
+        SimpleNamespace(name="evaluatorjobs/job.json", read=lambda: data),
+        SimpleNamespace(set=outputs.append),
+    )
+    return json.loads(outputs[0])["output"]
+
+
+def test_degraded_evaluations_are_not_reused(evaluator_app, make_job):
+    deduplicator = evaluator_app._job_deduplicator()
+
+    # An instance failed, e.g. rate limited, and was skipped
+    assert evaluate(evaluator_app, make_job, evaluated(error="Rate limited")) == (
+        "Score: 4"
+    )
+    assert os.listdir(deduplicator.directory) == []
+
+    assert evaluate(evaluator_app, make_job, evaluated()) == "Score: 4"
+    assert len(os.listdir(deduplicator.directory)) == 1
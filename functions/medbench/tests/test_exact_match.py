@@ -0,0 +1,59 @@
+import pytest
+
+from medbench.datasets import Data
+from medbench.metrics.text_exact_match import (
+    ExactMatchMetric,
+    normalize_exact_match,
+    token_f1,
+)
+
+
+def data(text: str) -> Data:
+    return Data.from_text(data=text)
+
+
+def test_normalize_exact_match_ignores_case_punctuation_and_whitespace():
+    assert normalize_exact_match(" (B) Pneumonia.\n") == "bpneumonia"
+    assert normalize_exact_match("Left  lung") == normalize_exact_match("leftlung")
+
+
+@pytest.mark.parametrize(
+    "prediction, reference, expected",
+    [
+        (("left", "lower", "lobe"), ("left", "lower", "lobe"), 1.0),
+        (("left", "lobe"), ("left", "lower", "lobe"), 0.8),
+        (("right",), ("left",), 0.0),
+        ((), (), 1.0),
+        ((), ("left",), 0.0),
+    ],
+)
+def test_token_f1(prediction, reference, expected):
+    assert token_f1(prediction, reference) == pytest.approx(expected)
+
+
+def test_calculate_batch_scores_best_ground_truth():
+    metric = ExactMatchMetric.setup()
+
+    scores = metric.calculate_batch(
+        [[data("A"), data("Pneumonia.")], [data("B")], []],
+        [data("pneumonia"), data("b) Effusion"), data("C")],
+    )
+
+    assert scores == [
+        {"exact_match": 1.0, "token_f1": 1.0},
+        {"exact_match": 0.0, "token_f1": pytest.approx(2 / 3)},
+        {"exact_match": 0.0, "token_f1": 0.0},
+    ]
+
+
+def test_calculate_run_accuracy_and_macro_f1():
+    metric = ExactMatchMetric.setup()
+
+    run_metrics = metric.calculate_run(
+        [[data("A")], [data("A")], [data("B")], [data("B")]],
+        [data("a"), data("B"), data("b."), data("b")],
+    )
+
+    # A: 1 TP, 1 FN -> F1 2/3; B: 2 TP, 1 FP -> F1 4/5
+    assert run_metrics["accuracy"] == 0.75
+    assert run_metrics["f1"] == pytest.approx((2 / 3 + 4 / 5) / 2)
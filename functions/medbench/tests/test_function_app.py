@@ -0,0 +1,249 @@
+import json
+from collections import defaultdict
+from types import SimpleNamespace
+
+import pytest
+from azure.core.exceptions import ResourceNotFoundError
+
+import function_app
+import medbench.metrics
+from medbench.config import settings
+from medbench.dedup import JobDeduplicator
+from medbench.datasets import Data, Dataset, Instance, Reference
+from medbench.evaluators.tbfact import runner as tbfact_runner
+from medbench.metrics import MetricJob, aggregate_results
+from medbench.metrics.shards import SHARD_RESULTS_CONTAINER, split_job
+from medbench.models import ModelOutput, ModelRun, OpenAIReasoningModel
+
+
+class FakeTBFactEvaluatorRunner:
+    def __init__(self, predictions_model_run, **kwargs):
+        self.predictions_model_run = predictions_model_run
+        # Concurrent shards of a job do not share a reference facts file
+        assert kwargs.get("reference_facts_path") is None
+
+    async def evaluate(self):
+        return [
+            {"details": {"metrics": {"f1": 0.5, "recall": 0.4, "precision": 0.6}}}
+            for _ in self.predictions_model_run.results
+        ]
+
+
+def model_run(num_instances):
+    return ModelRun(
+        id="run",
+        model=OpenAIReasoningModel(
+            name="gpt-4o",
+            version="2024-10-21",
+            endpoint="https://example.openai.azure.com/",
+            api_key="key",
+            system_prompt="",
+            max_tokens=100,
+        ),
+        dataset=Dataset(
+            name="dataset",
+            description="Dataset",
+            instances=[
+                Instance(
+                    id=f"id{i}",
+                    input=Data.from_text(data=f"Note {i}"),
+                    references=[Reference(output=Data.from_text(data=f"Summary {i}"))],
+                    split="Test",
+                )
+                for i in range(num_instances)
+            ],
+        ),
+        results=[
+            ModelOutput(input_id=f"id{i}", completions=Data.from_text(data=f"Sum {i}"))
+            for i in range(num_instances)
+        ],
+    )
+
+
+def test_tbfact_only_job_skips_standard_metrics(monkeypatch):
+    def calculate_summarization_metrics(*args, **kwargs):
+        raise AssertionError("Standard metrics were computed")
+
+    monkeypatch.setattr(
+        medbench.metrics,
+        "calculate_summarization_metrics",
+        calculate_summarization_metrics,
+    )
+    monkeypatch.setattr(
+        tbfact_runner, "TBFactEvaluatorRunner", FakeTBFactEvaluatorRunner
+    )
+    for name in ("deployment", "version", "endpoint", "api_key"):
+        monkeypatch.setattr(settings, f"azure_openai_{name}", "local")
+
+    results = function_app.calculate_metrics(
+        model_run(3), "summarization", metrics=["tbfact"]
+    )
+
+    assert results["instance_level_metrics"] == [
+        {"tbfact-f1": 0.5, "tbfact-recall": 0.4, "tbfact-precision": 0.6}
+    ] * 3
+    assert results["aggregated_metrics"] == pytest.approx(
+        {"tbfact-f1": 0.5, "tbfact-recall": 0.4, "tbfact-precision": 0.6}
+    )
+    assert results["aggregated_statistics"]["tbfact-f1"]["count"] == 3
+
+
+class FailingTBFactEvaluatorRunner(FakeTBFactEvaluatorRunner):
+    async def evaluate(self):
+        raise RuntimeError("Rate limited")
+
+
+def test_degraded_results_are_not_reusable(monkeypatch):
+    monkeypatch.setattr(
+        tbfact_runner, "TBFactEvaluatorRunner", FailingTBFactEvaluatorRunner
+    )
+    for name in ("deployment", "version", "endpoint", "api_key"):
+        monkeypatch.setattr(settings, f"azure_openai_{name}", "local")
+
+    failures = []
+    results = function_app.calculate_metrics(
+        model_run(2), "summarization", metrics=["tbfact"], failures=failures
+    )
+
+    # TBFact fell back to zero scores
+    assert results["aggregated_metrics"]["tbfact-f1"] == 0.0
+    assert failures
+    assert not function_app.reusable_results(results, failures)
+
+    failed_instance = {"instance_level_metrics": [{"rouge1": 0.5}, {"bleu": "Error"}]}
+    assert not function_app.reusable_results(failed_instance, [])
+    assert function_app.reusable_results({"instance_level_metrics": [{"bleu": 1}]}, [])
+
+
+class FakeContainer:
+    def __init__(self):
+        self.blobs = {}
+
+    def upload_blob(self, name, data, overwrite=False):
+        self.blobs[name] = bytes(data)
+
+    def list_blobs(self, name_starts_with=""):
+        return [
+            SimpleNamespace(name=name)
+            for name in sorted(self.blobs)
+            if name.startswith(name_starts_with)
+        ]
+
+    def download_blob(self, name):
+        if name not in self.blobs:
+            raise ResourceNotFoundError(f"{name} not found")
+        return SimpleNamespace(readall=lambda: self.blobs[name])
+
+    def delete_blob(self, name):
+        if name not in self.blobs:
+            raise ResourceNotFoundError(f"{name} not found")
+        del self.blobs[name]
+
+
+@pytest.fixture
+def scored_job(make_job):
+    def make(num_instances, score):
+        # Predictions are the scores the fake metrics give them
+        job = json.loads(make_job(num_instances))
+        for result in job["model_run"]["results"]:
+            result["completions"]["content"][0]["data"] = str(score)
+        return json.dumps(job).encode("utf-8")
+
+    return make
+
+
+def calculate_metrics(model_run, metrics_type, metrics=None, checkpoint=None, **kwargs):
+    instance_level_metrics = [
+        {"score": float(result.completions.get_text())} for result in model_run.results
+    ]
+    return {
+        **aggregate_results(instance_level_metrics),
+        "instance_level_metrics": instance_level_metrics,
+    }
+
+
+def process_shards(job, shard_size, indices=None):
+    shards = split_job(job, "job.json", shard_size, input={"blob": "job.json"})
+    for index, (name, data) in enumerate(shards):
+        if indices is None or index in indices:
+            blob = SimpleNamespace(
+                name=f"metricshards/{name}", length=len(data), read=lambda: data
+            )
+            function_app.metrics_shard_processor(blob)
+
+
+def test_shard_results_of_other_uploads_are_not_merged(
+    monkeypatch, tmp_path, scored_job
+):
+    containers = defaultdict(FakeContainer)
+    monkeypatch.setenv("AzureWebJobsStorage", "UseDevelopmentStorage=true")
+    monkeypatch.setattr(settings, "metrics_checkpoint_path", str(tmp_path))
+    monkeypatch.setattr(function_app, "calculate_metrics", calculate_metrics)
+    monkeypatch.setattr(function_app, "_container_client", containers.__getitem__)
+    monkeypatch.setattr(
+        function_app,
+        "upload_results",
+        lambda connection, container, name, data, **kwargs: containers[
+            container
+        ].upload_blob(name, data),
+    )
+    shard_results = containers[SHARD_RESULTS_CONTAINER]
+
+    # A first upload of the job is left with a single shard scored
+    process_shards(MetricJob.from_bytes(scored_job(4, 0.1)), 2, indices=[0])
+    stale = dict(shard_results.blobs)
+    assert len(stale) == 1
+
+    # Uploads of the job name with other content, and the same or another
+    # number of shards, only merge their own shard results
+    for num_instances, shard_size in ((4, 2), (3, 1)):
+        job = MetricJob.from_bytes(scored_job(num_instances, 0.9))
+        process_shards(job, shard_size)
+
+        output = json.loads(containers["metricresults"].blobs["job.json-results.json"])
+        metrics_results = output["metrics_results"]
+        assert len(metrics_results["instance_level_metrics"]) == num_instances
+        assert metrics_results["aggregated_metrics"] == {"score": 0.9}
+        # Merged shard results are deleted
+        assert shard_results.blobs == stale
+
+
+def test_gzip_results_of_nested_jobs_keep_their_path(
+    monkeypatch, tmp_path, scored_job
+):
+    uploads = {}
+    monkeypatch.setenv("AzureWebJobsStorage", "UseDevelopmentStorage=true")
+    monkeypatch.setattr(settings, "metrics_output_gzip", True)
+    monkeypatch.setattr(settings, "metrics_checkpoint_path", str(tmp_path))
+    monkeypatch.setattr(function_app, "calculate_metrics", calculate_metrics)
+    monkeypatch.setattr(function_app, "_job_deduplicator", JobDeduplicator)
+    monkeypatch.setattr(
+        function_app,
+        "upload_results",
+        lambda connection, container, name, data, **kwargs: uploads.update(
+            {f"{container}/{name}": kwargs}
+        ),
+    )
+    data = scored_job(2, 0.5)
+    blob = SimpleNamespace(
+        name="metricjobs/team/job.json", length=len(data), read=lambda: data
+    )
+
+    function_app.metrics_processor(blob, SimpleNamespace(set=None))
+
+    assert uploads == {"metricresults/team/job.json-results.json": {"compress": True}}
+
+
+def test_failed_jobs_write_their_error_as_bytes():
+    data = b'{"metrics_type": "summarization", "model_run": '
+    blob = SimpleNamespace(
+        name="metricjobs/job.json", length=len(data), read=lambda: data
+    )
+    outputs = []
+    output = SimpleNamespace(set=outputs.append)
+
+    function_app.metrics_processor(blob, output)
+
+    # The output binding is `func.Out[bytes]`
+    assert isinstance(outputs[0], bytes)
+    assert json.loads(outputs[0])["original_blob_name"] == "metricjobs/job.json"
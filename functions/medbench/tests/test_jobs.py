@@ -0,0 +1,80 @@
+import json
+
+from medbench.metrics import MetricJob
+from medbench.models import ModelRun
+
+
+def text(data: str) -> dict:
+    return {"content": [{"type": "Text", "data": data}]}
+
+
+JOB = {
+    "metrics_type": "summarization",
+    "metrics": ["rouge", "tbfact"],
+    "model_run": {
+        "id": "run",
+        "model": {"name": "model", "version": "1"},
+        "dataset": {
+            "name": "dataset",
+            "description": "Dataset",
+            "instances": [
+                {
+                    "id": f"id{i}",
+                    "input": {
+                        "content": [
+                            {"type": "Image", "data": "aGVsbG8=" * 100},
+                            {"type": "Text", "data": f"Input {i}"},
+                        ]
+                    },
+                    "references": [
+                        {"output": text(f"Reference {i}"), "tags": ["Correct"]}
+                    ],
+                    "split": "Test",
+                }
+                for i in range(3)
+            ],
+        },
+        "results": [
+            {
+                "input_id": f"id{i}",
+                "completions": text(f"Prediction {i}"),
+                "metadata": {"score": 0.5},
+            }
+            for i in range(3)
+        ],
+    },
+}
+
+
+def test_from_bytes_matches_json_parsing():
+    expected = ModelRun.from_json(JOB["model_run"])
+
+    job = MetricJob.from_bytes(json.dumps(JOB).encode("utf-8"))
+
+    assert job.metrics_type == "summarization"
+    assert job.metrics == ["rouge", "tbfact"]
+    assert job.model_run.results == expected.results
+    for instance, expected_instance in zip(
+        job.model_run.dataset.instances, expected.dataset.instances
+    ):
+        assert instance.id == expected_instance.id
+        assert instance.get_ground_truths() == expected_instance.get_ground_truths()
+        # Inputs are dropped, as metrics do not use them
+        assert instance.input.content == []
+
+
+def test_summary_leaves_out_instances_and_results(tmp_path):
+    path = tmp_path / "job.json"
+    path.write_text(json.dumps({"model_run": JOB["model_run"]}))
+
+    job = MetricJob.from_file(str(path))
+
+    assert job.metrics_type == "summarization"
+    assert job.metrics is None
+    assert job.summary["model_run"] == {
+        "id": "run",
+        "model": {"name": "model", "version": "1"},
+        "dataset": {"name": "dataset", "description": "Dataset"},
+        "num_instances": 3,
+        "num_results": 3,
+    }
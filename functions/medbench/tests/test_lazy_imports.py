@@ -0,0 +1,40 @@
+import subprocess
+import sys
+
+import pytest
+
+from medbench.metrics import MetricRegistry
+from medbench.models import ModelRegistry
+
+
+def imported_modules(code: str) -> set[str]:
+    result = subprocess.run(
+        [sys.executable, "-c", f"{code}\nimport sys\nprint(' '.join(sys.modules))"],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    return set(result.stdout.split())
+
+
+def test_importing_metrics_defers_heavy_modules():
+    modules = imported_modules("import medbench.metrics, medbench.evaluators")
+
+    assert "openai" not in modules
+    assert "medbench.metrics.text_summarization" not in modules
+    assert "medbench.evaluators.tbfact" not in modules
+
+
+def test_lazy_attributes_import_their_module():
+    modules = imported_modules("from medbench.models import OpenAIReasoningModel")
+
+    assert "medbench.models.azureoai" in modules
+
+
+def test_registries_import_plugins_on_lookup():
+    assert MetricRegistry.get("exact_match").__name__ == "ExactMatchMetric"
+    assert ModelRegistry.get("openai-reasoning-model").__name__ == (
+        "OpenAIReasoningModel"
+    )
+    with pytest.raises(KeyError):
+        MetricRegistry.get("unknown")
@@ -0,0 +1,186 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import attrs
+import pytest
+
+from medbench.datasets import Data
+from medbench.metrics import Metric
+from medbench.metrics.cache import MetricResultCache
+
+
+@attrs.define
+class LengthMetric(Metric):
+    @classmethod
+    def setup(cls) -> "LengthMetric":
+        return cls()
+
+    def _calculate(self, ground_truths, prediction) -> float:
+        return float(len(prediction.get_text()))
+
+
+@attrs.define
+class OtherLengthMetric(LengthMetric):
+    @classmethod
+    def cache_config(cls) -> dict:
+        return {"scale": 2}
+
+
+GROUND_TRUTHS = [[Data.from_text(data="reference")] for _ in range(3)]
+PREDICTIONS = [Data.from_text(data="x" * i) for i in range(3)]
+
+
+@pytest.fixture
+def calculated():
+    calculated = []
+
+    def calculate(metrics, ground_truths, predictions):
+        calculated.append((list(metrics), len(predictions)))
+        return {
+            name: [
+                "error" if not prediction.get_text() else len(prediction.get_text())
+                for prediction in predictions
+            ]
+            for name in metrics
+        }
+
+    calculate.calls = calculated
+    return calculate
+
+
+def test_calculate_reuses_cached_scores(tmp_path, calculated):
+    cache = MetricResultCache(path=str(tmp_path / "metrics.sqlite"))
+    metrics = {"length": LengthMetric}
+
+    first = cache.calculate(metrics, GROUND_TRUTHS, PREDICTIONS, calculated)
+    second = cache.calculate(metrics, GROUND_TRUTHS, PREDICTIONS, calculated)
+
+    assert first == second == {"length": ["error", 1, 2]}
+    # Errors are not cached, so only the failed pair is calculated again
+    assert calculated.calls == [(["length"], 3), (["length"], 1)]
+
+
+def test_calculate_persists_scores(tmp_path, calculated):
+    path = str(tmp_path / "metrics.sqlite")
+    MetricResultCache(path=path).calculate(
+        {"length": LengthMetric}, GROUND_TRUTHS, PREDICTIONS, calculated
+    )
+
+    cache = MetricResultCache(path=path)
+    cache.calculate({"length": LengthMetric}, GROUND_TRUTHS, PREDICTIONS, calculated)
+
+    assert cache.stats()["hits"] == 2
+
+
+def test_calculate_keys_on_metric_config(tmp_path, calculated):
+    cache = MetricResultCache(path=str(tmp_path / "metrics.sqlite"))
+
+    cache.calculate({"length": LengthMetric}, GROUND_TRUTHS, PREDICTIONS, calculated)
+    cache.calculate(
+        {"length": LengthMetric, "other": OtherLengthMetric},
+        GROUND_TRUTHS,
+        PREDICTIONS,
+        calculated,
+    )
+
+    # The failed pair of "length" is calculated again, "other" is never cached
+    assert calculated.calls[1:] == [(["length"], 1), (["other"], 3)]
+
+
+def test_disabled_cache_calculates_everything(calculated):
+    cache = MetricResultCache(path=None)
+
+    cache.calculate({"length": LengthMetric}, GROUND_TRUTHS, PREDICTIONS, calculated)
+    cache.calculate({"length": LengthMetric}, GROUND_TRUTHS, PREDICTIONS, calculated)
+
+    assert calculated.calls == [(["length"], 3), (["length"], 3)]
+
+
+def test_put_evicts_least_recently_used(tmp_path):
+    cache = MetricResultCache(path=str(tmp_path / "metrics.sqlite"), max_size_mb=1)
+    value = "x" * 300_000
+
+    cache.put_many({f"key{i}": value for i in range(3)})
+    cache.get_many(["key0"])
+    cache.put_many({"key3": value})
+
+    # Only the least recently used entry is evicted to stay within budget
+    assert set(cache.get_many([f"key{i}" for i in range(4)])) == {
+        "key0",
+        "key2",
+        "key3",
+    }
+
+
+def test_bert_score_cache_config_follows_model_type():
+    from medbench.metrics.text_summarization import BertScoreMetric
+
+    @attrs.define
+    class LargeBertScoreMetric(BertScoreMetric):
+        model_type: str = "bert-large-uncased"
+
+    assert BertScoreMetric.cache_config()["model_type"] == "bert-base-uncased"
+    assert LargeBertScoreMetric.cache_config()["model_type"] == "bert-large-uncased"
+
+
+class FakeContainer:
+    def __init__(self):
+        self.blobs = {}
+        self.downloads = 0
+        self.uploads = 0
+
+    def download_blob(self, name):
+        from azure.core.exceptions import ResourceNotFoundError
+
+        self.downloads += 1
+        if name not in self.blobs:
+            raise ResourceNotFoundError(f"{name} not found")
+        data, last_modified = self.blobs[name]
+        return SimpleNamespace(
+            readall=lambda: data,
+            properties=SimpleNamespace(last_modified=last_modified),
+        )
+
+    def upload_blob(self, name, data, overwrite=False):
+        self.uploads += 1
+        self.blobs[name] = (data, datetime.now(timezone.utc))
+
+
+def test_blob_tier_reads_one_blob_per_metric(calculated):
+    container = FakeContainer()
+    metrics = {"length": LengthMetric, "other": OtherLengthMetric}
+    ground_truths = [GROUND_TRUTHS[0]] * 300
+    predictions = [Data.from_text(data="x" * i) for i in range(300)]
+
+    MetricResultCache(path=None, blob_container=container).calculate(
+        metrics, ground_truths, predictions, calculated
+    )
+    assert (container.downloads, container.uploads) == (2, 2)
+
+    # Another worker reuses the scores, with one request per metric
+    cache = MetricResultCache(path=None, blob_container=container)
+    scores = cache.calculate(metrics, ground_truths, predictions, calculated)
+
+    assert scores["length"][:3] == ["error", 1, 2]
+    # Only the failed pairs are calculated again, and their blobs rewritten
+    assert calculated.calls[1:] == [(["length", "other"], 1)]
+    assert (container.downloads, container.uploads) == (4, 4)
+    assert cache.stats()["hits"] == 2 * 299
+
+
+def test_blob_tier_ignores_expired_blobs(calculated):
+    container = FakeContainer()
+    metrics = {"length": LengthMetric}
+    MetricResultCache(path=None, blob_container=container).calculate(
+        metrics, GROUND_TRUTHS, PREDICTIONS, calculated
+    )
+    for name, (data, last_modified) in container.blobs.items():
+        container.blobs[name] = (data, last_modified - timedelta(days=31))
+
+    cache = MetricResultCache(path=None, blob_container=container, blob_ttl_days=30)
+    cache.calculate(metrics, GROUND_TRUTHS, PREDICTIONS, calculated)
+
+    assert calculated.calls[1:] == [(["length"], 3)]
+    # Recalculated scores refresh the blob
+    cache.calculate(metrics, GROUND_TRUTHS, PREDICTIONS, calculated)
+    assert calculated.calls[2:] == [(["length"], 1)]
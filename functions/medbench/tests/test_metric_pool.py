@@ -0,0 +1,84 @@
+from typing import ClassVar
+
+import attrs
+import pytest
+
+from medbench.metrics import Metric, MetricPool, MetricRegistry
+
+
+@attrs.define
+class SmallMetric(Metric):
+    memory_footprint_mb: ClassVar[int] = 10
+
+    @classmethod
+    def setup(cls) -> "SmallMetric":
+        return cls()
+
+    def _calculate(self, ground_truths, prediction) -> float:
+        return 0.0
+
+
+@attrs.define
+class OtherSmallMetric(SmallMetric):
+    pass
+
+
+@attrs.define
+class LargeMetric(SmallMetric):
+    memory_footprint_mb: ClassVar[int] = 100
+
+
+def test_get_sets_up_metric_once():
+    pool = MetricPool(memory_budget_mb=100)
+
+    metric = pool.get(SmallMetric)
+
+    assert isinstance(metric, SmallMetric)
+    assert pool.get(SmallMetric) is metric
+    assert pool.memory_usage_mb == 10
+
+
+def test_get_evicts_least_recently_used_metric():
+    pool = MetricPool(memory_budget_mb=110)
+
+    small = pool.get(SmallMetric)
+    pool.get(OtherSmallMetric)
+    # Touch SmallMetric so OtherSmallMetric becomes the least recently used
+    pool.get(SmallMetric)
+    pool.get(LargeMetric)
+
+    assert pool.stats()["metrics"] == ["SmallMetric", "LargeMetric"]
+    assert pool.get(SmallMetric) is small
+    assert pool.memory_usage_mb == 110
+
+
+def test_get_keeps_metric_larger_than_budget():
+    pool = MetricPool(memory_budget_mb=50)
+
+    pool.get(SmallMetric)
+    pool.get(LargeMetric)
+
+    assert pool.stats()["metrics"] == ["LargeMetric"]
+
+
+def test_get_resolves_registered_name(monkeypatch):
+    monkeypatch.setitem(MetricRegistry._registry, "small", SmallMetric)
+    pool = MetricPool()
+
+    metric = pool.get("small")
+
+    assert isinstance(metric, SmallMetric)
+    assert pool.get(SmallMetric) is metric
+    with pytest.raises(KeyError):
+        pool.get("not-a-metric")
+
+
+def test_warm_up_skips_failing_metrics(mocker):
+    pool = MetricPool()
+    mocker.patch.object(LargeMetric, "setup", side_effect=RuntimeError("boom"))
+    warm_up = mocker.patch.object(SmallMetric, "warm_up")
+
+    pool.warm_up([LargeMetric, SmallMetric])
+
+    warm_up.assert_called_once()
+    assert pool.stats()["metrics"] == ["SmallMetric"]
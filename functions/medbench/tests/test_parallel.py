@@ -0,0 +1,45 @@
+from typing import ClassVar
+
+import attrs
+
+from medbench.datasets import Data
+from medbench.metrics import Metric, MetricProcessPool
+
+
+@attrs.define
+class LengthMetric(Metric):
+    cpu_bound: ClassVar[bool] = True
+
+    @classmethod
+    def setup(cls) -> "LengthMetric":
+        return cls()
+
+    def _calculate(self, ground_truths, prediction) -> float:
+        return len(prediction.get_text()) - len(ground_truths[0].get_text())
+
+
+GROUND_TRUTHS = [[Data.from_text(data="x" * i)] for i in range(10)]
+PREDICTIONS = [Data.from_text(data="x" * i * 2) for i in range(10)]
+
+
+def test_calculate_keeps_instance_order():
+    pool = MetricProcessPool(num_workers=2, shards_per_worker=2)
+
+    try:
+        scores = pool.calculate({"length": LengthMetric}, GROUND_TRUTHS, PREDICTIONS)
+    finally:
+        pool.shutdown()
+
+    assert scores == {"length": list(range(10))}
+
+
+def test_calculate_in_process_when_disabled():
+    pool = MetricProcessPool(num_workers=1)
+
+    scores = pool.calculate(
+        {"length": LengthMetric}, GROUND_TRUTHS, PREDICTIONS, batched=False
+    )
+
+    assert not pool.enabled
+    assert pool._executor is None
+    assert scores == {"length": list(range(10))}
@@ -0,0 +1,31 @@
+from medbench.perf import LatencyTracker, process_rss_mb
+
+
+def test_latency_tracker_reports_percentiles_per_kind():
+    tracker = LatencyTracker(window=100)
+    for seconds in range(1, 101):
+        tracker.record("summarization", float(seconds))
+    tracker.record("accuracy", 0.5)
+
+    stats = tracker.stats()
+
+    assert tracker.count == 101
+    assert stats["summarization"] == {
+        "count": 100,
+        "p50_seconds": 50.5,
+        "p95_seconds": 95.05,
+    }
+    assert stats["accuracy"]["p95_seconds"] == 0.5
+
+
+def test_latency_tracker_keeps_a_rolling_window():
+    tracker = LatencyTracker(window=2)
+    for seconds in (10.0, 1.0, 2.0):
+        tracker.record("summarization", seconds)
+
+    assert tracker.stats()["summarization"]["count"] == 2
+    assert tracker.stats()["summarization"]["p95_seconds"] < 10
+
+
+def test_process_rss_mb():
+    assert process_rss_mb() > 0
@@ -0,0 +1,70 @@
+import pytest
+
+from medbench.models.ratelimit import (
+    RateLimiter,
+    TokenBucket,
+    estimate_tokens,
+    retry_after_seconds,
+)
+
+
+def test_token_bucket_spaces_out_reservations():
+    # 60 requests per minute, in bursts of up to 10
+    bucket = TokenBucket(per_minute=60)
+
+    delays = [bucket.reserve(1, now=0.0) for _ in range(12)]
+
+    assert delays[:10] == [0.0] * 10
+    assert delays[10:] == pytest.approx([1.0, 2.0])
+    # Refilled after waiting
+    assert bucket.reserve(1, now=13.0) == 0.0
+
+
+def test_unlimited_bucket_never_waits():
+    bucket = TokenBucket(per_minute=0)
+
+    assert all(bucket.reserve(10**6, now=0.0) == 0.0 for _ in range(10))
+
+
+def test_rate_limiter_limits_tokens_and_honors_retry_after():
+    limiter = RateLimiter(tokens_per_minute=60_000)
+
+    assert limiter.reserve(10_000) == 0.0
+    # The service reports less remaining than estimated
+    limiter.update({"x-ratelimit-remaining-tokens": "0"})
+    assert limiter.reserve(1_000) == pytest.approx(1.0, abs=0.01)
+
+    limiter.update({"retry-after-ms": "5000"})
+    assert 4.9 < limiter.reserve(0) <= 5.0
+
+
+def test_backoff():
+    limiter = RateLimiter(
+        backoff_base=1.0, rate_limit_backoff_base=4.0, backoff_max=8.0
+    )
+
+    assert all(
+        2**attempt / 2 <= limiter.backoff(attempt) <= 2**attempt
+        for attempt in range(3)
+    )
+    assert all(4.0 <= limiter.backoff(10) <= 8.0 for _ in range(10))
+    assert all(
+        2.0 <= limiter.backoff(0, rate_limited=True) <= 4.0 for _ in range(10)
+    )
+    assert 7.0 <= limiter.backoff(0, {"retry-after": "7"}) <= 8.0
+
+
+def test_estimate_tokens():
+    messages = [
+        {"role": "system", "content": [{"type": "text", "text": "a" * 400}]},
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": "b" * 40},
+                {"type": "image_url", "image_url": {"url": "https://"}},
+            ],
+        },
+    ]
+
+    assert estimate_tokens(messages, max_tokens=100) == 100 + 10 + 85 + 100
+    assert retry_after_seconds({"retry-after": "Wed, 21 Oct 2015"}) is None
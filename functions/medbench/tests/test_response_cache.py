@@ -0,0 +1,47 @@
+import time
+
+from medbench.models.cache import ResponseCache
+
+REQUEST = {
+    "model": "gpt-4o",
+    "messages": [{"role": "user", "content": [{"type": "text", "text": "Hi"}]}],
+    "max_completion_tokens": 100,
+    "temperature": 0.0,
+    "stream": False,
+}
+
+
+def test_key_depends_on_request_but_not_streaming():
+    key = ResponseCache.key("gpt-4o", "2024-05-01-preview", REQUEST)
+
+    assert ResponseCache.key(
+        "gpt-4o", "2024-05-01-preview", {**REQUEST, "stream": True}
+    ) == key
+    assert ResponseCache.key(
+        "gpt-4o", "2024-05-01-preview", {**REQUEST, "temperature": 0.5}
+    ) != key
+    assert ResponseCache.key("gpt-4o", "2024-10-21", REQUEST) != key
+
+
+def test_cache_expires_and_evicts(tmp_path):
+    cache = ResponseCache(path=str(tmp_path / "responses.sqlite"), ttl_seconds=60)
+    cache.put("key", {"completions": "Hello"})
+
+    assert cache.get("key") == {"completions": "Hello"}
+    cache._connect().execute(
+        "UPDATE responses SET created_at = ?", (time.time() - 120,)
+    )
+    assert cache.get("key") is None
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+    cache = ResponseCache(path=str(tmp_path / "small.sqlite"), max_size_mb=0)
+    cache.put("key", {"completions": "Hello"})
+    assert cache.get("key") is None
+
+
+def test_disabled_cache():
+    cache = ResponseCache()
+
+    cache.put("key", {"completions": "Hello"})
+    assert cache.get("key") is None
@@ -0,0 +1,33 @@
+import json
+
+import numpy as np
+
+from medbench.metrics.results import dump_results, input_reference
+
+
+def test_dump_results_compact():
+    results = {"aggregated_metrics": {"rouge1": 0.5}, "instance_level_metrics": []}
+
+    data = dump_results({"metrics_results": results})
+
+    assert b"\n" not in data
+    assert json.loads(data) == {"metrics_results": results}
+
+
+def test_dump_results_writes_nan_as_null():
+    data = dump_results(
+        {"scores": [float("nan"), np.float64(0.25)], "count": np.int64(2)},
+        compact=False,
+    )
+
+    assert json.loads(data) == {"scores": [None, 0.25], "count": 2}
+
+
+def test_input_reference():
+    reference = input_reference("metricjobs/job.json", b"{}")
+
+    assert reference == {
+        "blob": "metricjobs/job.json",
+        "sha256": "44136fa355b3678a1146ad16f7e8649e94fb4fc21fe77e8310c060f61caaff8a",
+        "size": 2,
+    }
@@ -0,0 +1,51 @@
+import pytest
+from rouge_score import rouge_scorer
+
+from medbench.metrics.rouge import ROUGE_TYPES, RougeScorer
+
+REFERENCES = [
+    "Patient is a 65-year-old male.\nHe was diagnosed with stage II lung cancer.",
+    "65 year old man diagnosed with lung cancer, stage II.",
+]
+PREDICTIONS = [
+    "The patient, a 65-year-old male, was diagnosed with lung cancer.",
+    "Patient running a fever.\nCough for two weeks.",
+    "",
+]
+
+
+@pytest.mark.parametrize("prediction", PREDICTIONS)
+def test_score_matches_rouge_score(prediction):
+    expected = rouge_scorer.RougeScorer(
+        list(ROUGE_TYPES), use_stemmer=True
+    ).score_multi(REFERENCES, prediction)
+
+    scores = RougeScorer().score(REFERENCES, prediction)
+
+    assert scores == {
+        rouge_type: score.fmeasure for rouge_type, score in expected.items()
+    }
+
+
+def test_score_memoizes_tokens():
+    scorer = RougeScorer(rouge_types=("rouge1", "rougeL"))
+
+    for prediction in PREDICTIONS:
+        scorer.score(REFERENCES, prediction)
+
+    # Each reference is only tokenized for the first prediction
+    assert scorer.cache_info()["misses"] == len(REFERENCES) + len(PREDICTIONS)
+
+
+def test_score_cache_is_bounded():
+    scorer = RougeScorer(cache_size=2)
+
+    for prediction in PREDICTIONS:
+        scorer.score(REFERENCES, prediction)
+
+    assert scorer.cache_info()["size"] == 2
+
+
+def test_invalid_rouge_type():
+    with pytest.raises(ValueError):
+        RougeScorer(rouge_types=("rougeX",))
@@ -0,0 +1,79 @@
+import pytest
+
+from medbench.metrics import MetricJob, aggregate_metrics
+from medbench.metrics.shards import merge_shard_results, should_shard, split_job
+
+
+def test_should_shard(make_job):
+    job = MetricJob.from_bytes(make_job(5))
+
+    assert should_shard(job, 2)
+    assert not should_shard(job, 0)
+    assert not should_shard(job, 5)
+    assert not should_shard(MetricJob.from_bytes(make_job(5, "accuracy")), 2)
+
+
+def test_split_job_covers_instances_in_order(make_job):
+    job = MetricJob.from_bytes(make_job(5))
+
+    shards = split_job(job, "job.json", 2, input={"blob": "metricjobs/job.json"})
+
+    assert [name for name, _ in shards] == [
+        "job.json/shard-00000-of-00003.json",
+        "job.json/shard-00001-of-00003.json",
+        "job.json/shard-00002-of-00003.json",
+    ]
+    shard_jobs = [MetricJob.from_bytes(data) for _, data in shards]
+    assert [
+        instance.id
+        for shard_job in shard_jobs
+        for instance in shard_job.model_run.dataset.instances
+    ] == [f"id{i}" for i in range(5)]
+    assert [
+        result.input_id
+        for shard_job in shard_jobs
+        for result in shard_job.model_run.results
+    ] == [f"id{i}" for i in range(5)]
+
+    shard = shard_jobs[2].shard
+    assert [shard[key] for key in ("index", "count", "start", "stop")] == [2, 3, 4, 5]
+    assert shard["job"] == "job.json"
+    assert shard["input"] == {"blob": "metricjobs/job.json"}
+    assert shard["original_run"]["model_run"]["num_instances"] == 5
+    assert all(shard_job.metrics == ["rouge"] for shard_job in shard_jobs)
+    # Shards are not split again
+    assert not should_shard(shard_jobs[0], 1)
+
+
+def shard_result(index: int, count: int, scores: list[float]) -> dict:
+    return {
+        "shard": {"job": "job.json", "index": index, "count": count},
+        "metrics_results": {
+            "instance_level_metrics": [{"rouge1": score} for score in scores]
+        },
+    }
+
+
+def test_merge_shard_results_recomputes_aggregates():
+    scores = [[0.1, 0.2], [0.3, 0.4], [0.5]]
+
+    # Shards complete in any order
+    merged = merge_shard_results(
+        [shard_result(index, 3, scores[index]) for index in (2, 0, 1)]
+    )
+
+    instance_level_metrics = [
+        {"rouge1": score} for shard_scores in scores for score in shard_scores
+    ]
+    assert merged["instance_level_metrics"] == instance_level_metrics
+    assert merged["aggregated_metrics"] == aggregate_metrics(instance_level_metrics)
+    assert merged["aggregated_statistics"]["rouge1"]["count"] == 5
+
+
+def test_merge_shard_results_fails_on_missing_or_failed_shards():
+    with pytest.raises(ValueError, match="Expected 3 shard results"):
+        merge_shard_results([shard_result(0, 3, [0.1]), shard_result(2, 3, [0.2])])
+
+    failed = {"shard": {"job": "job.json", "index": 1, "count": 2}, "error": "Boom"}
+    with pytest.raises(ValueError, match="Shard 1: Boom"):
+        merge_shard_results([shard_result(0, 2, [0.1]), failed])
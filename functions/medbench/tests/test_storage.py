@@ -0,0 +1,47 @@
+import attrs
+import pytest
+
+from medbench.config import settings
+from medbench.datasets import Data
+from medbench.metrics import Metric
+from medbench.metrics.cache import MetricResultCache
+from medbench.storage import connection_string, container_client
+
+
+@attrs.define
+class LengthMetric(Metric):
+    @classmethod
+    def setup(cls) -> "LengthMetric":
+        return cls()
+
+    def _calculate(self, ground_truths, prediction) -> float:
+        return float(len(prediction.get_text()))
+
+
+def test_connection_string_falls_back_to_function_app_storage(monkeypatch):
+    monkeypatch.setattr(settings, "azure_storage_connection_string", None)
+    monkeypatch.setenv("AzureWebJobsStorage", "UseDevelopmentStorage=true")
+
+    assert connection_string() == "UseDevelopmentStorage=true"
+    assert container_client("scores").client.container_name == "scores"
+    assert container_client(None) is None
+
+
+def test_container_client_connects_on_first_use(monkeypatch):
+    monkeypatch.setattr(settings, "azure_storage_connection_string", None)
+    monkeypatch.delenv("AzureWebJobsStorage", raising=False)
+    # Building the client, e.g. at import time, does not need the account
+    container = container_client("scores")
+
+    with pytest.raises(ValueError, match="AzureWebJobsStorage"):
+        container.download_blob("score.json")
+
+    # Scores of unreachable containers are computed instead
+    cache = MetricResultCache(path=None, blob_container=container)
+    scores = cache.calculate(
+        {"length": LengthMetric},
+        [[Data.from_text(data="reference")]],
+        [Data.from_text(data="prediction")],
+        lambda metrics, ground_truths, predictions: {"length": [10.0]},
+    )
+    assert scores == {"length": [10.0]}